@@ -0,0 +1,104 @@
+"""
+hkl solver workers
+==================
+
+Worker processes of `instrument.utils.hkl_trajectory.reachability_map`.
+
+The workers are spawned, not forked, since forking a process with running
+Channel Access threads can deadlock the children. This module is outside
+`instrument.utils`, so the workers import hklpy and numpy only, not the
+bluesky session. The calculation engine is rebuilt in each worker from the
+picklable `calc_setup` copy.
+
+.. autosummary::
+    ~calc_setup
+    ~forward_all
+    ~pool_init
+    ~pool_forward
+"""
+
+__all__ = ["calc_setup", "forward_all", "pool_init", "pool_forward"]
+
+import logging
+
+from numpy import array
+
+logger = logging.getLogger(__name__)
+
+# Calculation engine of this worker, see `pool_init`.
+_POOL_CALC = None
+
+
+def calc_setup(calc):
+    """
+    Picklable copy of an hklpy calc: geometry, sample, UB matrix, engine
+    mode, axes constraints and positions.
+
+    Returns None if the mode has extra parameters, which are not copied.
+    """
+    if len(calc.engine.parameters) > 0:
+        return None
+    axes = list(calc.physical_axis_names)
+    inverted = list(calc.inverted_axes)
+    constraints = []
+    for axis in axes:
+        value = calc[axis].value
+        # The value getter is not inverted, the setter is.
+        if axis in inverted:
+            value = -value
+        constraints.append((tuple(calc[axis].limits), value, calc[axis].fit))
+    return dict(
+        calc_class=type(calc),
+        engine=calc.engine.name,
+        sample=calc.sample.name,
+        lattice=tuple(calc.sample.lattice),
+        ub=array(calc.sample.UB, dtype=float),
+        mode=calc.engine.mode,
+        axes=axes,
+        inverted=inverted,
+        constraints=constraints,
+        positions=tuple(calc.physical_positions),
+    )
+
+
+def pool_init(setup):
+    """Rebuild the calc of `calc_setup` in a worker process."""
+    global _POOL_CALC
+
+    calc = setup["calc_class"](
+        engine=setup["engine"],
+        sample=setup["sample"],
+        lattice=setup["lattice"],
+    )
+    calc.physical_axis_names = dict(
+        zip(calc.physical_axis_names, setup["axes"])
+    )
+    calc.inverted_axes = setup["inverted"]
+    calc.sample.UB = setup["ub"]
+    calc.engine.mode = setup["mode"]
+    for axis, (limits, value, fit) in zip(
+        setup["axes"], setup["constraints"]
+    ):
+        calc[axis].limits = limits
+        calc[axis].value = value
+        calc[axis].fit = fit
+    calc.physical_positions = setup["positions"]
+    _POOL_CALC = calc
+
+
+def forward_all(calc, hkls):
+    """All the solutions (list of tuples) of each reflection."""
+    results = []
+    for hkl in hkls:
+        try:
+            results.append([tuple(sol) for sol in calc.forward(tuple(hkl))])
+        except Exception as exinfo:  # libhkl errors are not all ValueError
+            logger.debug("No solution for hkl = %s: %s", hkl, exinfo)
+            results.append([])
+    return results
+
+
+def pool_forward(hkls, energy):
+    """Solutions of `hkls` at `energy` (keV), in a worker process."""
+    _POOL_CALC.energy = energy
+    return forward_all(_POOL_CALC, hkls)
@@ -53,13 +53,19 @@ results in this SPEC file output::
    ~SpecWriterCallback
    ~SpecWriterCallback2
    ~spec_comment
+   ~update_spec_index
 """
 
+import atexit
 import datetime
 import getpass
+import json
 import logging
+import os
 import pathlib
+import queue
 import socket
+import threading
 import time
 from collections import OrderedDict
 
@@ -71,6 +77,116 @@ SPEC_TIME_FORMAT = "%a %b %d %H:%M:%S %Y"
 SCAN_ID_RESET_VALUE = 0
 
 
+SPEC_INDEX_VERSION = 1
+
+
+def spec_index_path(filename):
+    """Sidecar index file of a SPEC data file: ``.<name>.idx``."""
+    filename = pathlib.Path(filename)
+    return filename.with_name(f".{filename.name}.idx")
+
+
+def _empty_spec_index():
+    return dict(
+        version=SPEC_INDEX_VERSION,
+        size=0,  # bytes of the SPEC file already indexed
+        epoch=None,  # first #E line
+        n_scans=0,
+        max_scan=0,
+        last_scan=None,
+        offsets={},  # byte offset of each #S line, keyed by scan number
+    )
+
+
+def _spec_index_is_valid(index, filename):
+    """Check the index still describes the beginning of the SPEC file."""
+    if index.get("version") != SPEC_INDEX_VERSION:
+        return False
+    if filename.stat().st_size < index["size"]:
+        return False  # file was truncated or replaced
+    if index["last_scan"] is not None:
+        # The last indexed #S line must still be at its recorded offset.
+        expected = f"#S {index['last_scan']}".encode()
+        with open(filename, "rb") as f:
+            f.seek(index["offsets"][index["last_scan"]])
+            if not f.read(len(expected) + 1).startswith(expected + b" "):
+                return False
+    return True
+
+
+def update_spec_index(filename):
+    """
+    Update (or rebuild) the sidecar index of a SPEC data file.
+
+    The index holds the byte offset of every ``#S`` line, the highest scan
+    number and the header epoch. Only the bytes appended since the last update
+    are read, so it is O(1) in the number of scans already in the file. A stale
+    index (truncated/replaced file) is rebuilt from scratch.
+
+    PARAMETERS
+
+    filename
+        *str* or *pathlib.Path* : SPEC data file
+
+    RETURNS
+
+    *dict* :
+        the index (see ``_empty_spec_index()`` for the keys)
+    """
+    logger = logging.getLogger(__name__)
+    filename = pathlib.Path(filename)
+    index_file = spec_index_path(filename)
+
+    index = None
+    if index_file.exists():
+        try:
+            with open(index_file, "r") as f:
+                index = json.load(f)
+            if not _spec_index_is_valid(index, filename):
+                logger.info("Rebuilding stale SPEC index: %s", index_file)
+                index = None
+        except (OSError, ValueError, KeyError) as exinfo:
+            logger.info("Rebuilding SPEC index %s: %s", index_file, exinfo)
+            index = None
+    if index is None:
+        index = _empty_spec_index()
+
+    with open(filename, "rb") as f:
+        f.seek(index["size"])
+        offset = index["size"]
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # incomplete line, index it next time
+            if line.startswith(b"#S "):
+                parts = line.split()
+                if len(parts) > 1:
+                    scan = parts[1].decode()
+                    index["offsets"][scan] = offset
+                    index["last_scan"] = scan
+                    index["n_scans"] += 1
+                    try:
+                        index["max_scan"] = max(index["max_scan"], float(scan))
+                    except ValueError:
+                        pass
+            elif line.startswith(b"#E ") and index["epoch"] is None:
+                try:
+                    index["epoch"] = int(line.split()[-1])
+                except ValueError:
+                    pass
+            offset += len(line)
+        index["size"] = offset
+
+    try:
+        tmp = index_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, index_file)
+    except OSError as exinfo:
+        logger.warning("Could not write SPEC index %s: %s", index_file, exinfo)
+
+    return index
+
+
 def _rebuild_scan_command(doc):
     """
     reconstruct the scan command for SPEC data file #S line
@@ -695,6 +811,12 @@ class SpecWriterCallback2(FileWriterCallbackBase):
     This writes data from a scan as each *event* document is received. One or
     more scans can be written to the same file.  The file format is text.
 
+    With ``buffered=True``, the lines are handed to a background thread that
+    keeps the file open for the run and writes them in batches (every
+    ``flush_rows`` rows or ``flush_interval`` seconds, whichever comes first).
+    The RunEngine thread does not wait for the (NFS) file system. All lines
+    are written and the file is closed on ``stop`` and at process exit.
+
     .. rubric: Override Methods from FileWriterCallbackBase
     .. autosummary::
         ~descriptor
@@ -707,6 +829,8 @@ class SpecWriterCallback2(FileWriterCallbackBase):
     .. autosummary::
         ~_cmt
         ~_write_lines_
+        ~close_file
+        ~flush
         ~make_default_filename
         ~newfile
         ~usefile
@@ -725,9 +849,24 @@ class SpecWriterCallback2(FileWriterCallbackBase):
     # - - - - # - - - - # - - - - # - - - - # - - - - # - - - - # - - - - #
     # Override Methods
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        buffered=False,
+        flush_interval=1.0,
+        flush_rows=50,
+        **kwargs
+    ):
         super().__init__(*args, **kwargs)
 
+        self.buffered = buffered
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self._queue = None
+        self._writer_thread = None
+        # Once per callback, close_file does nothing if not buffered.
+        atexit.register(self.close_file)
+
         self._file_header_motor_keys = None
         self._motor_stream_name = "label_start_motor"
         self.file_epoch = None
@@ -866,6 +1005,13 @@ class SpecWriterCallback2(FileWriterCallbackBase):
         super().stop(doc)  # process the document
 
         self.write_scan_end(doc)
+        if self.buffered:
+            # Written, closed and indexed by the writer thread, in order.
+            self._start_writer_thread()
+            self._queue.put(("close", None, None))
+            self._queue.put(("index", self.file_name, None))
+        else:
+            self._update_spec_index(self.file_name)
 
     def writer(self):
         """Output to a file completed by other methods."""
@@ -896,15 +1042,13 @@ class SpecWriterCallback2(FileWriterCallbackBase):
 
         but don't create it until we have data
         """
+        self.close_file()
         self.clear()
         filename = pathlib.Path(filename or self.make_default_filename())
         if filename.exists():
-            from spec2nexus.spec import SpecDataFile
-
-            sdf = SpecDataFile(filename)
-            scan_list = sdf.getScanNumbers()
-            l = len(scan_list)
-            m = max(map(float, scan_list))
+            index = update_spec_index(filename)
+            l = index["n_scans"]
+            m = index["max_scan"]
             highest = int(max(l, m) + 0.9999)  # solves issue #128
             scan_id = max(scan_id or 0, highest)
         self.spec_filename = filename
@@ -926,6 +1070,7 @@ class SpecWriterCallback2(FileWriterCallbackBase):
 
     def usefile(self, filename):
         """read from existing SPEC data file"""
+        self.close_file()
         if not self.spec_filename.exists():
             raise IOError(f"file {filename} does not exist")
         scan_id = None
@@ -956,14 +1101,11 @@ class SpecWriterCallback2(FileWriterCallbackBase):
             if len(p) > 4 and p[2] == "user":
                 username = p[4]
 
-            # find the highest scan number used
-            key = "#S"
-            scan_ids = []
-            for line in f.readlines():
-                if line.startswith(key + " ") and len(line.split()) > 1:
-                    scan_id = int(line.split()[1])
-                    scan_ids.append(scan_id)
-            scan_id = max(scan_ids)
+        # find the highest scan number used
+        index = update_spec_index(filename)
+        if index["n_scans"] == 0:
+            raise ValueError(f"no scans found in {filename}")
+        scan_id = int(index["max_scan"])
 
         self.spec_filename = filename
         self.spec_epoch = epoch
@@ -980,6 +1122,7 @@ class SpecWriterCallback2(FileWriterCallbackBase):
 
         lines = []
 
+        self.flush()  # file size is checked next
         if self.file_name.exists() and self.file_name.stat().st_size > 0:
             lines.append("")
         lines.append(f"#F {self.file_name}")
@@ -1092,9 +1235,90 @@ class SpecWriterCallback2(FileWriterCallbackBase):
     def _write_lines_(self, lines, mode="a"):
         """write (more) lines to the file"""
         lines.append("")
+        if self.buffered:
+            # Always appends, like both modes used by this class.
+            self._start_writer_thread()
+            self._queue.put(("write", self.file_name, "\n".join(lines)))
+            return
         with open(self.file_name, mode) as f:
             f.write("\n".join(lines))
 
+    def _start_writer_thread(self):
+        """Start the background writer (buffered mode), if not running."""
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            return
+        self._queue = queue.Queue()
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name="SpecWriterCallback2", daemon=True
+        )
+        self._writer_thread.start()
+
+    def _writer_loop(self):
+        """Background thread: write queued lines, flush in batches."""
+        logger = logging.getLogger(__name__)
+        handle, handle_name = None, None
+        rows, last_flush = 0, time.time()
+        while True:
+            try:
+                action, file_name, text = self._queue.get(
+                    timeout=self.flush_interval
+                )
+            except queue.Empty:
+                if handle is not None and rows > 0:
+                    handle.flush()
+                    rows, last_flush = 0, time.time()
+                continue
+
+            try:
+                if action == "write":
+                    if handle is None or handle_name != file_name:
+                        if handle is not None:
+                            handle.close()
+                        handle = open(file_name, "a")
+                        handle_name = file_name
+                    handle.write(text)
+                    rows += text.count("\n")
+                    if (
+                        rows >= self.flush_rows
+                        or time.time() - last_flush >= self.flush_interval
+                    ):
+                        handle.flush()
+                        rows, last_flush = 0, time.time()
+                elif action == "index":
+                    if handle is not None:
+                        handle.flush()
+                    self._update_spec_index(file_name)
+                elif handle is not None:  # "flush" or "close"
+                    handle.flush()
+                    rows, last_flush = 0, time.time()
+                    if action == "close":
+                        handle.close()
+                        handle, handle_name = None, None
+            except OSError as exinfo:
+                logger.error("Could not write SPEC file %s: %s", file_name, exinfo)
+            finally:
+                self._queue.task_done()
+
+    def _update_spec_index(self, file_name):
+        """Update the sidecar index, errors are logged, not raised."""
+        try:
+            update_spec_index(file_name)
+        except Exception as exinfo:
+            logger = logging.getLogger(__name__)
+            logger.error("Could not index SPEC file %s: %s", file_name, exinfo)
+
+    def flush(self):
+        """Wait until all buffered lines are written to the file."""
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            self._queue.put(("flush", None, None))
+            self._queue.join()
+
+    def close_file(self):
+        """Write all buffered lines and close the file (buffered mode)."""
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            self._queue.put(("close", None, None))
+            self._queue.join()
+
     # - - - - # - - - - # - - - - # - - - - # - - - - # - - - - # - - - - #
     # properties
 
@@ -2,7 +2,7 @@
 Create new stream with processed XMCD data
 """
 
-__all__ = ["dichro", "plot_dichro_settings", "dichro_bec"]
+__all__ = ["dichro", "plot_dichro_settings", "dichro_bec", "xas_xmcd"]
 
 
 from bluesky.callbacks.stream import LiveDispatcher
@@ -28,11 +28,42 @@ class DichroDevice(Device):
         self._run_subs(sub_type=self.SUB_ACQ_DONE, success=True)
 
 
+def xas_xmcd(monitor, detector, transmission=True, signs=None):
+    """
+    XANES and XMCD of the readings of one dichro point.
+
+    Parameters
+    ----------
+    monitor, detector : iterable
+        Counts of each reading (or the arrays of the fast dichro mode).
+    transmission : bool
+        If True the XANES is log(monitor/detector), else detector/monitor.
+    signs : iterable, optional
+        Helicity sign of each reading. If None the XMCD is not computed.
+
+    Returns
+    -------
+    xas : float
+        Mean XANES of the readings.
+    xmcd : float or None
+        Mean of the positive minus mean of the negative helicity XANES.
+    """
+    _mon = array(monitor, dtype=float).ravel()
+    _det = array(detector, dtype=float).ravel()
+    _xas = log(_mon/_det) if transmission else _det/_mon
+    if signs is None:
+        return mean(_xas), None
+    _signs = array(signs[:len(_xas)])
+    return mean(_xas), mean(_xas[_signs > 0]) - mean(_xas[_signs < 0])
+
+
 class Settings():
     positioner = "energy"
     monitor = "4idgI0"
     detector = "4idbI_APD"
     transmission = True
+    # Helicity sign of each reading in a dichro point.
+    signs = [1, -1, -1, 1]
 
 
 # TODO: Should this go in the pr_setup?
@@ -86,21 +117,12 @@ class DichroStream(LiveDispatcher):
                     [evt['data'][self.data_keys[0]] for evt in cache], axis=0
                 )
 
-                _mon = array(
-                    [evt['data'][self.data_keys[1]] for evt in cache]
-                )
-
-                _det = array(
-                    [evt['data'][self.data_keys[2]] for evt in cache]
-                )
-
-                _xas = (
-                    log(_mon/_det) if self.settings.transmission else _det/_mon
-                )
-
-                processed_evt["xas"] = mean(_xas)
-                processed_evt["xmcd"] = (
-                    (_xas[0] + _xas[3])/2 - (_xas[1] + _xas[2])/2
+                # The fast dichro mode has all the readings in one event.
+                processed_evt["xas"], processed_evt["xmcd"] = xas_xmcd(
+                    [evt['data'][self.data_keys[1]] for evt in cache],
+                    [evt['data'][self.data_keys[2]] for evt in cache],
+                    transmission=self.settings.transmission,
+                    signs=self.settings.signs,
                 )
             else:
                 # raise Exception(
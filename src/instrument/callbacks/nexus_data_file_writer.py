@@ -11,13 +11,28 @@ https://bcda-aps.github.io/apstools/dev/api/_filewriters.html#apstools.callbacks
 
 __all__ = ["nxwriter"]
 
+import atexit
 import h5py
 from apstools.callbacks import NXWriterAPS
-from numpy import array
+from apstools.utils import run_in_thread
+from bluesky import plan_stubs as bps
+from copy import copy
+from numpy import array, dtype as np_dtype, prod
+from ophyd import Signal
 from datetime import datetime
+from queue import Queue
+from re import search
+from threading import Thread
+from time import time as ttime
 from ..utils.config import iconfig
 from ..utils._logging_setup import logger
 
+try:
+    # Blosc (and other) HDF5 compression filters
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
 # from ..framework.initialize import RE
 logger.info(__file__)
 
@@ -25,14 +40,384 @@ logger.info(__file__)
 LAYOUT_VERSION = "APS-POLAR-2024-10"
 NEXUS_RELEASE = "v2022.07"  # NeXus release to which this file is written
 
+NEXUS_CONFIG = iconfig.get("NEXUS_DATA_FILES", {})
+
+# h5py dtype of the streamed fields, by descriptor dtype. Strings are kept
+# in memory, SWMR does not support variable length data.
+STREAM_DTYPES = dict(number="f8", integer="i8", boolean="?", array="f8")
+
+# Storage of the stream datasets, see `MyNXWriter.storage_options`.
+STORAGE_DEFAULTS = dict(
+    COMPRESSION="none",
+    COMPRESSION_LEVEL=None,
+    CHUNK_ROWS=512,
+    CHUNK_BYTES=2**20,  # the default HDF5 chunk cache
+    MIN_COMPRESS_ROWS=16,
+    FIELDS={},
+)
+
 
 class MyNXWriter(NXWriterAPS):
     """
     Modify the default behavior of NXWriter for XPCS.
+
+    With `streaming`, the file is created at the start document and the
+    fields of each stream are appended to resizable datasets, in blocks
+    every `flush_interval` seconds. SWMR is enabled once the primary stream
+    is described, so the file can be read during the scan (open it with
+    ``swmr=True``). The metadata, links and the fields of streams described
+    later are written at the stop document.
+
+    With `background`, the finished runs are written one after the other by
+    a worker thread, from a queue of up to `queue_size` runs, so the next
+    scan can start while a file is written. `wait_writer_plan_stub` then
+    only waits while the queue is full, use `flush_writer_plan_stub` at the
+    end of a batch. The stop document blocks the RunEngine callbacks while
+    the queue is full, `wait_writer_plan_stub` keeps that from happening in
+    a plan. `queue_depth` (runs waiting in the queue, not counting the one
+    being written) and `latency` (seconds from the stop document to the
+    file written) are signals.
+
+    The value, EPOCH and time datasets of the numeric stream fields are
+    stored following `storage` (see `storage_options`).
     """
 
     external_files = {}
 
+    streaming = NEXUS_CONFIG.get("STREAMING", False)
+    flush_interval = NEXUS_CONFIG.get("FLUSH_INTERVAL", 1.0)  # seconds
+    storage = dict(STORAGE_DEFAULTS, **NEXUS_CONFIG.get("STORAGE", {}))
+
+    _stream_root = None  # h5py.File open while streaming
+    # descriptor uid -> {key: (value dataset, EPOCH dataset, rows, times)}
+    _streamed = {}
+    _last_flush = 0
+
+    background = NEXUS_CONFIG.get("BACKGROUND_WRITER", False)
+    queue_size = NEXUS_CONFIG.get("WRITER_QUEUE_SIZE", 4)
+
+    _queue = None  # (writer, file name, mode, stop time) of each run
+    _worker = None
+    _exit_hook = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue_depth = Signal(name="nxwriter_queue_depth", value=0)
+        self.latency = Signal(name="nxwriter_latency", value=0.0)
+
+    def create_NX_group(self, parent, specification):
+        """Create a NeXus group, or return it if made while streaming."""
+        local_address = specification.split(":")[0]
+        if local_address in parent:
+            return parent[local_address]
+        return super().create_NX_group(parent, specification)
+
+    def start(self, doc):
+        super().start(doc)
+        self._streamed = {}
+        self._stream_root = None
+        if not self.streaming:
+            return
+
+        fname = self.file_name or self.make_file_name()
+        try:
+            root = h5py.File(fname, "w", libver="latest")
+        except OSError as exinfo:
+            logger.warning(
+                "Not streaming to '%s', it is written at the end of the run:"
+                " %s", fname, exinfo
+            )
+            return
+        root.attrs["default"] = "entry"
+        self._stream_root = root
+        self._last_flush = ttime()
+
+    def _field_storage(self, k):
+        """Storage policy of a field, with its FIELDS override if any."""
+        policy = dict(STORAGE_DEFAULTS, **self.storage)
+        fields = policy.pop("FIELDS") or {}
+        for pattern, override in fields.items():
+            if search(pattern, k):
+                policy.update(override)
+                break
+        return policy
+
+    def _filter(self, policy):
+        """h5py compression keywords of a policy."""
+        name = str(policy["COMPRESSION"] or "none").lower()
+        level = policy["COMPRESSION_LEVEL"]
+        if name.startswith("blosc_"):
+            if hdf5plugin is not None:
+                return dict(hdf5plugin.Blosc(
+                    cname=name[len("blosc_"):],
+                    clevel=5 if level is None else level,
+                    shuffle=hdf5plugin.Blosc.SHUFFLE,
+                ))
+            logger.warning("hdf5plugin is not installed, using lzf.")
+            name = "lzf"
+        if name == "gzip":
+            return dict(
+                compression="gzip",
+                compression_opts=4 if level is None else level,
+                shuffle=True,
+            )
+        if name == "lzf":
+            return dict(compression="lzf", shuffle=True)
+        if name != "none":
+            logger.warning("Unknown NeXus compression '%s', not used.", name)
+        return {}
+
+    def storage_options(self, k, dtype, shape, rows=None):
+        """
+        h5py ``create_dataset`` keywords of a stream dataset.
+
+        Numeric datasets are chunked along the time axis, up to CHUNK_ROWS
+        points and CHUNK_BYTES per chunk, and compressed with COMPRESSION
+        (none, gzip, lzf, blosc_lz4, blosc_zstd...). The policy is
+        ``NEXUS_DATA_FILES.STORAGE`` of the iconfig, updated by the first
+        FIELDS regular expression matching the field name.
+
+        Parameters
+        ----------
+        k : str
+            Field name, the EPOCH and time datasets use the policy of their
+            field.
+        dtype : numpy dtype
+        shape : tuple
+            Shape of one point.
+        rows : int, optional
+            Number of points. None for a resizable (streamed) dataset.
+
+        Returns
+        -------
+        options : dict
+            Empty (contiguous dataset) for short, non-numeric or
+            uncompressed datasets, unless resizable.
+        """
+        dtype = np_dtype(dtype)
+        shape = tuple(shape)
+        policy = self._field_storage(k)
+        options = {}
+        if dtype.kind in "biuf":
+            options = self._filter(policy)
+        if rows is not None and (
+            not options or rows < policy["MIN_COMPRESS_ROWS"]
+        ):
+            return {}
+
+        row_bytes = dtype.itemsize*int(prod(shape))
+        chunk = min(
+            policy["CHUNK_ROWS"], policy["CHUNK_BYTES"]//max(row_bytes, 1)
+        )
+        if rows is not None:
+            chunk = min(chunk, rows)
+        options["chunks"] = (max(chunk, 1),) + shape
+        return options
+
+    def _stream_dtype(self, v):
+        """h5py dtype of a field, None if it cannot be streamed."""
+        if v["external"]:
+            return None
+        shape = v["shape"] or []
+        if v["dtype"] == "array" and (not shape or not all(shape)):
+            return None
+        return STREAM_DTYPES.get(v["dtype"])
+
+    def descriptor(self, doc):
+        super().descriptor(doc)
+        root = self._stream_root
+        if root is None or not self.scanning or root.swmr_mode:
+            # New datasets cannot be made in SWMR mode, keep it in memory.
+            return
+        stream = doc["name"]
+        if len(self.streams[stream]) != 1:
+            return
+
+        group = self.create_NX_group(root, "entry:NXentry")
+        for specification in (
+            "instrument:NXinstrument",
+            "bluesky:NXnote",
+            "streams:NXnote",
+            f"{stream}:NXnote",
+        ):
+            group = self.create_NX_group(group, specification)
+        group.attrs["uid"] = doc["uid"]
+
+        streamed = {}
+        for k, v in self.acquisitions[doc["uid"]]["data"].items():
+            dtype = self._stream_dtype(v)
+            if dtype is None:
+                continue
+            subgroup = self.create_NX_group(group, k + ":NXdata")
+            subgroup.attrs["signal"] = "value"
+            subgroup.attrs["axes"] = ["time", ]
+            shape = tuple(v["shape"] or [])
+            ds = subgroup.create_dataset(
+                "value",
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                dtype=dtype,
+                **self.storage_options(k, dtype, shape),
+            )
+            ds.attrs["target"] = ds.name
+            self.add_dataset_attributes(ds, v, k)
+
+            epoch = subgroup.create_dataset(
+                "EPOCH", shape=(0,), maxshape=(None,), dtype="f8",
+                **self.storage_options(k, "f8", ())
+            )
+            epoch.attrs["units"] = "s"
+            epoch.attrs["long_name"] = "epoch time (s)"
+            epoch.attrs["target"] = epoch.name
+            streamed[k] = (ds, epoch, [], [])
+        self._streamed[doc["uid"]] = streamed
+
+        if stream == "primary":
+            root.swmr_mode = True
+
+    def event(self, doc):
+        streamed = self._streamed.get(doc["descriptor"])
+        if not streamed or not self.scanning:
+            return super().event(doc)
+
+        rest = {k: v for k, v in doc["data"].items() if k not in streamed}
+        if rest:
+            super().event(dict(doc, data=rest))
+        for k, (ds, epoch, rows, times) in streamed.items():
+            if k not in doc["data"]:
+                continue
+            try:
+                value = array(doc["data"][k], dtype=ds.dtype)
+            except (TypeError, ValueError) as exinfo:
+                logger.error("Could not stream %s: %s", k, exinfo)
+                continue
+            if value.shape != ds.shape[1:]:
+                logger.error("Could not stream %s: shape %s", k, value.shape)
+                continue
+            rows.append(value)
+            times.append(doc["timestamps"][k])
+
+        if ttime() - self._last_flush > self.flush_interval:
+            self._flush_streams()
+
+    def _flush_streams(self):
+        """Append the buffered rows, one resize per dataset, and flush."""
+        for streamed in self._streamed.values():
+            for ds, epoch, rows, times in streamed.values():
+                if not rows:
+                    continue
+                n = ds.shape[0]
+                ds.resize(n + len(rows), axis=0)
+                ds[n:] = array(rows, dtype=ds.dtype)
+                epoch.resize(n + len(times), axis=0)
+                epoch[n:] = times
+                rows.clear()
+                times.clear()
+        self._stream_root.flush()
+        self._last_flush = ttime()
+
+    def writer(self):
+        """Finish the streamed file, or write it all if not streaming."""
+        fname = self.file_name or self.make_file_name()
+        mode = "w"
+        if self._stream_root is not None:
+            fname = self._stream_root.filename
+            mode = "a"
+            self._flush_streams()
+            self._stream_root.close()
+            self._stream_root = None
+
+        if self.background:
+            self._enqueue(fname, mode)
+            return
+
+        @run_in_thread
+        def _threaded_writer(fname):
+            self._writer_active = True
+            try:
+                self._write_file(fname, mode)
+            finally:
+                self._writer_active = False
+
+        _threaded_writer(fname)
+
+    def _write_file(self, fname, mode):
+        """Write (mode "w") or finish (mode "a") the file of the run."""
+        try:
+            with h5py.File(fname, mode) as self.root:
+                self.write_root(fname)
+            self.output_nexus_file = fname
+            logger.info(f"wrote NeXus file: {fname}")
+        finally:
+            self.root = None
+
+    def _enqueue(self, fname, mode):
+        """Hand the run to the background writer."""
+        if self._worker is None or not self._worker.is_alive():
+            self._queue = Queue(maxsize=self.queue_size)
+            self._worker = Thread(
+                target=self._work, name="nxwriter", daemon=True
+            )
+            self._worker.start()
+            if not self._exit_hook:
+                # The worker is a daemon, write the queued runs at exit.
+                atexit.register(self._write_queue_at_exit)
+                self._exit_hook = True
+        # start() of the next run replaces (does not modify) the containers
+        # of this run, a shallow copy keeps them for the worker.
+        job = copy(self)
+        self.external_files = {}
+        self._queue.put((job, fname, mode, ttime()))
+        self.queue_depth.put(self._queue.qsize())
+
+    def _work(self):
+        """Background writer, writes the queued runs in order."""
+        while True:
+            job, fname, mode, stop_time = self._queue.get()
+            self.queue_depth.put(self._queue.qsize())
+            try:
+                job._write_file(fname, mode)
+                self.output_nexus_file = fname
+            except Exception as exinfo:
+                logger.error("Could not write '%s': %s", fname, exinfo)
+            finally:
+                self._queue.task_done()
+                self.latency.put(ttime() - stop_time)
+
+    def _write_queue_at_exit(self):
+        """Wait for the queued runs when the session exits."""
+        if self._worker is None or not self._worker.is_alive():
+            return
+        if self._queue.unfinished_tasks:
+            logger.info(
+                "Writing %d queued NeXus file(s) before exit.",
+                self._queue.unfinished_tasks
+            )
+        self.wait_writer()
+
+    def wait_writer(self):
+        """Wait until all the files are written. Not for use in a plan."""
+        if self._queue is not None:
+            self._queue.join()
+        super().wait_writer()
+
+    def wait_writer_plan_stub(self):
+        """
+        Wait for the writer, in a plan.
+
+        With `background`, only waits while the queue is full.
+        """
+        if not self.background:
+            return (yield from super().wait_writer_plan_stub())
+        while self._queue is not None and self._queue.full():
+            yield from bps.sleep(self._external_file_read_retry_delay)
+
+    def flush_writer_plan_stub(self):
+        """Wait until all the files are written, in a plan."""
+        while self._queue is not None and self._queue.unfinished_tasks:
+            yield from bps.sleep(self._external_file_read_retry_delay)
+        yield from super().wait_writer_plan_stub()
+
     def write_root(self, filename):
         super().write_root(filename)
         self.root.attrs["NeXus_version"] = NEXUS_RELEASE
@@ -82,12 +467,17 @@ class MyNXWriter(NXWriterAPS):
             group.attrs["uid"] = uid0
             # just get the one descriptor
             acquisition = self.acquisitions[uid0]
+            streamed = self._streamed.get(uid0, {})
             for k, v in acquisition["data"].items():
                 d = v["data"]
                 # NXlog is for time series data but NXdata makes an automatic "
                 # plot
                 subgroup = self.create_NX_group(group, k + ":NXdata")
 
+                if k in streamed:
+                    self._finish_streamed(subgroup, stream_name, k, v)
+                    continue
+
                 if v["external"]:
                     # We will link external images directly.
                     # self.write_stream_external(
@@ -99,21 +489,16 @@ class MyNXWriter(NXWriterAPS):
                         parent, d, subgroup, stream_name, k, v
                     )
 
-                t = array(v["time"])
-                ds = subgroup.create_dataset("EPOCH", data=t)
+                t = array(v["time"], dtype="f8")
+                ds = subgroup.create_dataset(
+                    "EPOCH",
+                    data=t,
+                    **self.storage_options(k, "f8", (), len(t)),
+                )
                 ds.attrs["units"] = "s"
                 ds.attrs["long_name"] = "epoch time (s)"
                 ds.attrs["target"] = ds.name
-
-                if len(t) > 0:
-                    t_start = t[0]
-                    iso = datetime.fromtimestamp(t_start).isoformat()
-                    ds = subgroup.create_dataset("time", data=t - t_start)
-                    ds.attrs["units"] = "s"
-                    ds.attrs["long_name"] = "time since first data (s)"
-                    ds.attrs["target"] = ds.name
-                    ds.attrs["start_time"] = t_start
-                    ds.attrs["start_time_iso"] = iso
+                self._write_time(subgroup, k, t)
 
             # link images to parent names
             for k in group:
@@ -122,6 +507,61 @@ class MyNXWriter(NXWriterAPS):
 
         return bluesky
 
+    def write_stream_internal(self, parent, d, subgroup, stream_name, k, v):
+        """Write a field of a stream, numeric ones with `storage_options`."""
+        options = {}
+        if isinstance(d, list) and len(d) > 0 and v["dtype"] in STREAM_DTYPES:
+            try:
+                d = array(d)
+            except ValueError:  # ragged arrays
+                pass
+            else:
+                options = self.storage_options(k, d.dtype, d.shape[1:], len(d))
+        if not options:
+            return super().write_stream_internal(
+                parent, d, subgroup, stream_name, k, v
+            )
+
+        # fmt: off
+        subgroup.attrs["signal"] = "value"
+        subgroup.attrs["axes"] = ["time", ]
+        # fmt: on
+        ds = subgroup.create_dataset("value", data=d, **options)
+        ds.attrs["target"] = ds.name
+        self.add_dataset_attributes(ds, v, k)
+        if stream_name == "baseline":
+            self._write_start_end(subgroup, k, v, ds)
+
+    def _write_start_end(self, subgroup, k, v, ds):
+        """First and last values of a baseline field."""
+        for name, index in (("value_start", 0), ("value_end", -1)):
+            ds_end = subgroup.create_dataset(name, data=ds[index])
+            self.add_dataset_attributes(ds_end, v, k)
+            ds_end.attrs["target"] = ds_end.name
+
+    def _write_time(self, subgroup, k, t):
+        """Time since the first data of a field."""
+        if len(t) > 0:
+            t_start = t[0]
+            iso = datetime.fromtimestamp(t_start).isoformat()
+            ds = subgroup.create_dataset(
+                "time",
+                data=t - t_start,
+                **self.storage_options(k, "f8", (), len(t)),
+            )
+            ds.attrs["units"] = "s"
+            ds.attrs["long_name"] = "time since first data (s)"
+            ds.attrs["target"] = ds.name
+            ds.attrs["start_time"] = t_start
+            ds.attrs["start_time_iso"] = iso
+
+    def _finish_streamed(self, subgroup, stream_name, k, v):
+        """Adds what the streamed datasets of a field miss at the end."""
+        self._write_time(subgroup, k, subgroup["EPOCH"][()])
+        ds = subgroup["value"]
+        if stream_name == "baseline" and ds.shape[0] > 0:
+            self._write_start_end(subgroup, k, v, ds)
+
 
 nxwriter = MyNXWriter()  # create the callback instance
 _nx_config = iconfig.get("NEXUS_DATA_FILE", None)
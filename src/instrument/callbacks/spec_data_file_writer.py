@@ -74,7 +74,11 @@ def newSpecFile(title, scan_id=None, RE=None):
 try:
     # apstools >=1.6.21
     # _specwriter = apstools.callbacks.SpecWriterCallback2()
-    _specwriter = SpecWriterCallback2()
+    _specwriter = SpecWriterCallback2(
+        buffered=spec_config.get("BUFFERED", False),
+        flush_interval=spec_config.get("FLUSH_INTERVAL", 1.0),
+        flush_rows=spec_config.get("FLUSH_ROWS", 50),
+    )
     # _specwriter = apstools.callbacks.SpecWriterCallback()
 except AttributeError:
     # apstools <1.6.21
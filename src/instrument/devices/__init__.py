@@ -2,71 +2,60 @@
 local, custom Device definitions
 """
 
-from yaml import load as yload, Loader as yloader
-from os.path import dirname, abspath, join
-from ..utils.config import iconfig
-from ..utils.dynamic_import import device_import
+from functools import partial
+from ..utils.config import iconfig, device_table
+from ..utils.dynamic_import import device_import, devices_import
+from ..utils.oregistry_setup import oregistry
 from .counters_class import counters
 from .phaseplates import pr_setup
 
-current_folder = dirname(abspath(__file__))
-
-devs_a = yload(
-    open(join(current_folder, "../configs/4ida_devices.yml"), "r").read(),
-    yloader
-)
-
-devs_b = yload(
-    open(join(current_folder, "../configs/4idb_devices.yml"), "r").read(),
-    yloader
-)
-
-devs_g = yload(
-    open(join(current_folder, "../configs/4idg_devices.yml"), "r").read(),
-    yloader
-)
-
-devs_raman = yload(
-    open(join(current_folder, "../configs/4idraman_devices.yml"), "r").read(),
-    yloader
-)
-
 scaler_name = None
-devs = dict()
-
-if iconfig.get("STATION") == "4idb":
-    # devs = devs_a | devs_b
-    devs = [devs_a, devs_b]
-    scaler_name = "scaler_ctr8"
-elif iconfig.get("STATION") == "4idg":
-    # devs = devs_a | devs_b | devs_g
-    devs = [devs_a, devs_b, devs_g]
+if iconfig.get("STATION") in ("4idb", "4idg"):
     scaler_name = "scaler_ctr8"
-elif iconfig.get("STATION") == "raman":
-    devs = [devs_raman]
-
-TIMEOUT = iconfig.get("OPHYD", {}).get("TIMEOUTS", {}).get("PV_CONNECTION", 5)
-# is there a better way?
-for dev in devs:
-    for module, items in dev.items():
-        devices = (
-            [items["device"]]
-            if isinstance(items["device"], str) else
-            items["device"]
-        )
-        baselines = (
-            [items["baseline"]]
-            if isinstance(items["baseline"], bool) else
-            items["baseline"]
-        )
-
-        timeouts = items.get("timeout", None)
-        if timeouts is None:
-            timeouts = [TIMEOUT for _ in range(len(baselines))]
-        timeouts = [timeouts] if isinstance(timeouts, (int, float)) else timeouts
-
-        for device, baseline, timeout in zip(devices, baselines, timeouts):
-            locals()[device] = device_import(module, device, baseline, timeout)
 
-if scaler_name is not None and locals()[scaler_name] is not None:
-    counters.default_scaler = locals()[scaler_name]
+PARALLEL = iconfig.get("OPHYD", {}).get("PARALLEL_CONNECTION", True)
+
+# The device table is read from the station YAML files by utils.config.
+entries = []
+_lazy_entries = {}
+for item in device_table:
+    entry = (item["module"], item["device"], item["baseline"], item["timeout"])
+    if item["lazy"]:
+        _lazy_entries[item["device"]] = entry
+    else:
+        entries.append(entry)
+
+
+def _load_lazy(name):
+    """Import, connect and setup a lazy device, keeping it in this module."""
+    globals()[name] = device_import(*_lazy_entries[name])
+    # Only forgotten once loaded, a failed import can be tried again.
+    del _lazy_entries[name]
+    oregistry.pending.pop(name, None)
+    return globals()[name]
+
+
+def __getattr__(name):
+    """Resolve lazy devices on first access (PEP 562)."""
+    if name in _lazy_entries:
+        return _load_lazy(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Lazy devices are only loaded when first accessed, either as an attribute of
+# this module or through `oregistry.find(name)`.
+for _name in _lazy_entries:
+    oregistry.pending[_name] = partial(_load_lazy, _name)
+
+if PARALLEL:
+    # Instantiate all devices, wait for all connections at once, then setup.
+    locals().update(devices_import(entries))
+else:
+    for module, device, baseline, timeout in entries:
+        locals()[device] = device_import(module, device, baseline, timeout)
+
+if scaler_name is not None:
+    if scaler_name in _lazy_entries:
+        _load_lazy(scaler_name)
+    if locals()[scaler_name] is not None:
+        counters.default_scaler = locals()[scaler_name]
@@ -5,7 +5,11 @@ __all__ = ['energy']
 
 from ophyd import Signal
 from ophyd.status import Status, AndStatus, wait as status_wait
+from ophyd.utils import LimitError
+from collections import OrderedDict
+from threading import Lock
 from time import time as ttime
+from numpy import array, argsort, isnan, mean
 from pyRestTable import Table
 from .monochromator import mono
 from .aps_undulator import undulators
@@ -13,10 +17,157 @@ from .phaseplates import pr1, pr2, pr3
 from .transfocator_device import transfocator
 from .polar_diffractometer import huber_euler, huber_hp
 from ..utils._logging_setup import logger
+from ..utils.functions import nearest_index
 logger.info(__file__)
 
 # TODO: use oregistry and label="energy_track" to make it more generic.
 
+ENERGY_TOLERANCE = 1e-4  # keV
+
+
+def _flat_status(statuses):
+    """
+    Single status that finishes when all `statuses` finish.
+
+    Avoids the nested AndStatus chains, every status reports to this one.
+    """
+    status = Status()
+    pending = [len(statuses)]
+    lock = Lock()
+
+    def _done(st):
+        with lock:
+            if status.done:
+                return
+            if not st.success:
+                status.set_exception(
+                    st.exception() or RuntimeError(f"{st} failed.")
+                )
+                return
+            pending[0] -= 1
+            if pending[0] == 0:
+                status.set_finished()
+
+    if len(statuses) == 0:
+        status.set_finished()
+    for st in statuses:
+        st.add_callback(_done)
+    return status
+
+
+def _check_targets(positioner, targets):
+    """Raise if a target is not a number or outside the `positioner` limits."""
+    targets = array(targets, dtype=float)
+    if isnan(targets).any():
+        raise ValueError(f"{positioner.name}: invalid targets {targets}.")
+    low, high = getattr(positioner, "limits", (0, 0))
+    if low < high:
+        outside = targets[(targets < low) | (targets > high)]
+        if len(outside) > 0:
+            raise LimitError(
+                f"{positioner.name}: {outside} outside the limits "
+                f"[{low}, {high}]."
+            )
+    return targets
+
+
+class EnergyTrackingPlan:
+    """
+    Energy moves precomputed for a list of energies.
+
+    The devices that are tracking the energy are found once (at scan start),
+    and the targets of the mono, undulators (with their offsets) and phase
+    retarders theta are computed for all energies, and checked against the
+    limits of each positioner (before the scan starts). Each energy move is
+    then issued as one flat group of moves. The time each device takes to
+    finish is recorded, see `report`.
+
+    Parameters
+    ----------
+    energies : iterable
+        Energies in keV.
+    """
+
+    def __init__(self, energies):
+        self.energies = array(energies, dtype=float)
+        order = argsort(self.energies)
+        self.energies = self.energies[order]
+
+        # name -> (positioner, targets sorted as self.energies)
+        self.positioners = OrderedDict()
+        self.positioners[mono.name] = (mono.energy, self.energies)
+
+        for pr in [pr1, pr2, pr3]:
+            if pr.tracking.get():
+                _check_targets(pr.energy, self.energies)
+                self.positioners[pr.name] = (
+                    pr.th,
+                    array([pr.convert_energy_to_theta(e) for e in self.energies])
+                )
+
+        for und in [undulators.us, undulators.ds]:
+            if und.tracking.get():
+                self.positioners[und.name] = (
+                    und.energy, self.energies + und.offset.get()
+                )
+
+        # The transfocator computes its own positions (see its energy table).
+        if transfocator.tracking.get():
+            self.positioners[transfocator.name] = (
+                transfocator.energy, self.energies
+            )
+
+        for positioner, targets in self.positioners.values():
+            _check_targets(positioner, targets)
+
+        self.move_times = {name: [] for name in self.positioners}
+        self.limiting = {name: 0 for name in self.positioners}
+
+    def index(self, energy):
+        """Index of `energy` in the precomputed list, or None."""
+        return nearest_index(self.energies, energy, ENERGY_TOLERANCE)
+
+    def set(self, energy, **kwargs):
+        """Move all tracking devices to the targets of `energy`."""
+        i = self.index(energy)
+        if i is None:
+            raise ValueError(f"Energy {energy} is not in the tracking plan.")
+
+        t0 = ttime()
+        finished = {}
+
+        def _timer(name):
+            def _done(status):
+                finished[name] = ttime() - t0
+                self.move_times[name].append(finished[name])
+                if len(finished) == len(self.positioners):
+                    self.limiting[max(finished, key=finished.get)] += 1
+            return _done
+
+        statuses = OrderedDict()
+        for name, (positioner, targets) in self.positioners.items():
+            st = positioner.set(targets[i], **kwargs)
+            st.add_callback(_timer(name))
+            statuses[name] = st
+
+        return _flat_status(list(statuses.values())), statuses
+
+    def report(self):
+        """Prints the move time of each tracking device."""
+        table = Table()
+        table.labels = (
+            "Device", "Moves", "Mean (s)", "Max (s)", "Limiting (points)"
+        )
+        for name, times in self.move_times.items():
+            table.addRow((
+                name,
+                len(times),
+                f"{mean(times):.3f}" if len(times) > 0 else "-",
+                f"{max(times):.3f}" if len(times) > 0 else "-",
+                self.limiting[name],
+            ))
+        print(table.reST(fmt="simple"))
+
 
 class EnergySignal(Signal):
 
@@ -29,6 +180,30 @@ class EnergySignal(Signal):
     # Useful for debugging.
     _status = {}
 
+    # Precomputed moves, see `prepare_tracking`.
+    tracking_plan = None
+    last_tracking_plan = None
+
+    def prepare_tracking(self, energies):
+        """
+        Snapshot the tracking devices and precompute moves for `energies`.
+
+        Energies that are not in the list are moved as usual.
+        """
+        self.tracking_plan = EnergyTrackingPlan(energies)
+        return self.tracking_plan
+
+    def clear_tracking(self):
+        """
+        Stop using the precomputed moves.
+
+        The plan is kept in `last_tracking_plan`, use its `report()` method to
+        see which device limited the energy moves.
+        """
+        if self.tracking_plan is not None:
+            self.last_tracking_plan = self.tracking_plan
+        self.tracking_plan = None
+
     @property
     def tracking(self):
 
@@ -73,6 +248,21 @@ class EnergySignal(Signal):
 
         old_value = self._readback
 
+        tracking_plan = self.tracking_plan
+        if tracking_plan is not None and tracking_plan.index(position) is not None:
+            status, self._status = tracking_plan.set(
+                position, timeout=timeout, moved_cb=moved_cb
+            )
+            if wait:
+                status_wait(status)
+            self._run_subs(
+                sub_type=self.SUB_VALUE,
+                old_value=old_value,
+                value=position,
+                timestamp=ttime()
+            )
+            return status
+
         # Mono
         mono_status = mono.energy.set(
             position, wait=wait, timeout=timeout, moved_cb=moved_cb
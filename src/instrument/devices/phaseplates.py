@@ -13,6 +13,7 @@ from numpy import arcsin, pi, sin
 from apstools.devices import TrackingSignal, PVPositionerSoftDoneWithStop
 from ..callbacks.dichro_stream import plot_dichro_settings
 from ..utils._logging_setup import logger
+from ..utils.oregistry_setup import oregistry
 
 # This is here because PRDevice.select_pr has a micron symbol that utf-8
 # cannot read. See: https://github.com/bluesky/ophyd/issues/930
@@ -183,10 +184,26 @@ class PRSetup():
     positioner = None
     offset = None
     dichro_steps = [1, -1, -1, 1]
+    # Use the softglue gated acquisition if the PZT oscillates.
+    fast_dichro = False
+    fast_dichro_name = "sgz_dichro"
 
     def __init__(self):
         self._current_setup = {}
 
+    def fast_dichro_detector(self):
+        """
+        Softglue fast dichro detector, or None if not used.
+
+        It is used in dichro scans if `fast_dichro` is True and the PZT is
+        the oscillating positioner.
+        """
+        if not self.fast_dichro:
+            return None
+        if self.positioner is None or "pzt" not in self.positioner.name:
+            return None
+        return oregistry.find(self.fast_dichro_name)
+
     def __repr__(self):
 
         tracked = ""
@@ -207,7 +224,8 @@ class PRSetup():
                 f"  Offset positioner = {offset}\n"
                 f"  Offset value = {self.offset.get()}\n"
                 f"  PZT center = {pzt_center}\n"
-                f"  Steps for dichro scan = {self.dichro_steps}\n")
+                f"  Steps for dichro scan = {self.dichro_steps}\n"
+                f"  Fast dichro = {self.fast_dichro}\n")
 
     def _get_setup(self, pr):
 
@@ -2,11 +2,16 @@
 SoftGlueZynq
 '''
 
-__all__ = ['sgz']
+__all__ = ['sgz', 'sgz_dichro']
 
 from ophyd import Component, Device, EpicsSignal, EpicsSignalRO, DynamicDeviceComponent
+from ophyd import Signal, DeviceStatus
 from collections import OrderedDict
+from threading import Thread
+from time import sleep, time as ttime
+from numpy import asarray
 from bluesky.plan_stubs import mv
+from ..callbacks.dichro_stream import plot_dichro_settings, xas_xmcd
 from ..utils import logger
 logger.info(__file__)
 
@@ -51,6 +56,11 @@ def _dma_fields(num=8, first_letter="I"):
             f"1acquireDma.{chr(ord(first_letter)+i-1)}",
             {"kind": "config"}
         )
+        defn[f"channel_{i}_data"] = (
+            EpicsSignalRO,
+            f"1acquireDma.VAL{chr(ord('A')+i-1)}",
+            {"kind": "omitted"}
+        )
     return defn
 
 
@@ -102,6 +112,9 @@ class SoftGlueClocks(Device):
 
 
 class SoftGlueZynqDevice(Device):
+
+    _dichro_restore = OrderedDict()  # signal: value before the dichro gate
+
     dma = DynamicDeviceComponent(_dma_fields())
 
     # Buffer 1 --> general enable
@@ -171,6 +184,25 @@ class SoftGlueZynqDevice(Device):
     def setup_count_plan(self, time):
         yield from mv(self.div_by_n_count.n, self._reference_clock*time)
 
+    def setup_dichro_gate_plan(self, output="fo2"):
+        # The PZT (in AC mode) flips the helicity at every ckUser edge.
+        # The routing and the divider (set by SoftGlueFastDichro) are
+        # restored by restore_dichro_gate_plan.
+        route = getattr(self.io, output).signal
+        self._dichro_restore = OrderedDict([
+            (route, route.get()),
+            (self.div_by_n_count.n, self.div_by_n_count.n.get()),
+        ])
+        yield from mv(route, "ckUser")
+
+    def restore_dichro_gate_plan(self):
+        args = []
+        for signal, value in self._dichro_restore.items():
+            args += [signal, value]
+        self._dichro_restore = OrderedDict()
+        if args:
+            yield from mv(*args)
+
     def default_settings(self, timeout=10):
 
         logger.info("Setting up clocks.")
@@ -248,5 +280,109 @@ class SoftGlueZynqDevice(Device):
         self.gate_trigger.width.set(500000).wait(timeout)
 
 
+class SoftGlueFastDichro(Device):
+    """
+    Dichro point in a single trigger, gated by the softglue.
+
+    The softglue user clock (ckUser) flips the PZT helicity and advances the
+    softglue scaler channels into the DMA buffer, so one acquisition of
+    `preset_monitor` seconds gives `states` gated readings of each channel.
+    The event has the monitor and detector counts of each state, and the
+    `xas` and `xmcd` computed with `xas_xmcd`, as in the `DichroStream`.
+
+    The monitor and detector are selected by the softglue scaler channel
+    names, `monitor_name` and `detector_name`. The helicity sign of each
+    state is in `signs`, by default (None) the signs of the `DichroStream`
+    settings.
+    """
+
+    preset_monitor = Component(Signal, value=1.0, kind="config")
+    states = Component(Signal, value=4, kind="config")
+    monitor = Component(Signal, value=[], kind="normal")
+    detector = Component(Signal, value=[], kind="normal")
+    xas = Component(Signal, value=0.0, kind="hinted")
+    xmcd = Component(Signal, value=0.0, kind="hinted")
+
+    def __init__(
+        self, *args, softglue=None, signs=None, timeout=10, **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.softglue = softglue
+        self.signs = None if signs is None else list(signs)
+        self.monitor_name = None
+        self.detector_name = None
+        self.transmission = True
+        self._timeout = timeout
+
+    def _channel_data(self, name, n):
+        """First `n` DMA values of the softglue scaler channel `name`."""
+        dma = self.softglue.dma
+        for i in range(1, 9):
+            if getattr(dma, f"channel_{i}_name").get() == name:
+                data = asarray(getattr(dma, f"channel_{i}_data").get())
+                return data[:n]
+        raise ValueError(f"No softglue scaler channel named '{name}'.")
+
+    def _acquire(self):
+        sg = self.softglue
+        n = int(self.states.get())
+        total = self.preset_monitor.get()
+
+        sg.dma.clear_button.set(1).wait(self._timeout)
+        sg.dma.clear_buffer.set(1).wait(self._timeout)
+        sg.dma.enable.set(1).wait(self._timeout)
+        sg.div_by_n_count.n.set(
+            round(sg._reference_clock*total/n)
+        ).wait(self._timeout)
+        sg.buffers.in3.signal.set("1!").wait(self._timeout)
+
+        t0 = ttime()
+        sg.buffers.in2.signal.set("1").wait(self._timeout)
+        sleep(total)
+        while True:
+            sg.dma.read_button.put(1)
+            if sg.dma.events.get() >= n:
+                break
+            if ttime() - t0 > total + self._timeout:
+                raise TimeoutError(
+                    f"{self.name}: the softglue sent {sg.dma.events.get()} "
+                    f"of {n} gated readings."
+                )
+            sleep(0.01)
+        sg.buffers.in2.signal.set("0").wait(self._timeout)
+
+        mon = self._channel_data(self.monitor_name, n)
+        det = self._channel_data(self.detector_name, n)
+        xas, xmcd = xas_xmcd(mon, det, self.transmission, self.get_signs())
+
+        self.monitor.put(mon)
+        self.detector.put(det)
+        self.xas.put(xas)
+        self.xmcd.put(xmcd)
+
+    def get_signs(self):
+        """Helicity sign of each state."""
+        if self.signs is None:
+            return list(plot_dichro_settings.settings.signs)
+        return self.signs
+
+    def trigger(self):
+        status = DeviceStatus(self)
+
+        def _run():
+            try:
+                self._acquire()
+            except Exception as exinfo:
+                status.set_exception(exinfo)
+            else:
+                status.set_finished()
+
+        Thread(target=_run, daemon=True).start()
+        return status
+
+
 sgz = SoftGlueZynqDevice('4idIF:', name='sgz', labels=("detector",))
+sgz_dichro = SoftGlueFastDichro(
+    "", softglue=sgz, name="sgz_dichro", labels=("detector",)
+)
 # sd.baseline.append(sgz)
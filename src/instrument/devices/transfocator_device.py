@@ -21,17 +21,21 @@ from ophyd.status import AndStatus
 from bluesky.plan_stubs import mv, sleep as bps_sleep, abs_set
 from apstools.devices import TrackingSignal
 from toolz import partition
-from numpy import poly1d, loadtxt
+from numpy import poly1d, loadtxt, array, argsort
 from scipy.interpolate import interp1d
 from time import sleep as tsleep
 from .monochromator import mono
 from ..utils._logging_setup import logger
-from ..utils.transfocator_calculation_new import transfocator_calculation
+from ..utils.functions import nearest_index
+from ..utils.transfocator_calculation_new import (
+    calculator, transfocator_calculation
+)
 
 logger.info(__file__)
 
 MOTORS_IOC = "4idgSoft:"
 EPICS_ENERGY_SLEEP = 0.15
+ENERGY_TABLE_TOLERANCE = 1e-4  # keV
 
 
 def _make_lenses_motors(motors: list):
@@ -191,6 +195,12 @@ class EnergySignal(Signal):
 
         self._readback = value
 
+        # Precomputed energy table, avoids the IOC round trip.
+        if self.parent.use_energy_table.get():
+            entry = self.parent.energy_table_entry(value)
+            if entry is not None:
+                return self.parent.move_from_energy_table(entry, **kwargs)
+
         if self.parent.energy_select.get() != 1:
             self.parent.energy_select.set(1).wait(1)
 
@@ -281,6 +291,9 @@ class TransfocatorClass(PyCRL):
     deltay = Component(Signal, value=0, kind="config")
     trackxy = Component(TrackingSignal, value=False, kind="config")
 
+    # Energy tracking from a precomputed table instead of the PyCRL IOC.
+    use_energy_table = Component(Signal, value=False, kind="config")
+
     def __init__(
             self,
             *args,
@@ -302,6 +315,8 @@ class TransfocatorClass(PyCRL):
         # self.polynomial_y.put(y_polynomial)
         self._x_interpolation = None
         self._y_interpolation = None
+        self._energy_table = None
+        self._energy_table_lenses = None
         self.reference_data_x.subscribe(self._update_interpolation_x, run=False)
         self.reference_data_y.subscribe(self._update_interpolation_y, run=False)
 
@@ -472,6 +487,147 @@ class TransfocatorClass(PyCRL):
             verbose=verbose
         )
 
+    def compute_energy_table(
+        self,
+        energies,
+        experiment="diffractometer",
+        optimize_lenses=False,
+        reference_distance=None,
+    ):
+        """
+        Precompute the transfocator positions for a list of energies.
+
+        The Z positions are relative to the current Z at the current energy,
+        so the present alignment is kept, as in the IOC (dq) tracking. X and Y
+        are taken from the reference data interpolation if `trackxy` is set.
+
+        PARAMETERS
+        ----------
+            energies : iterable
+                Photon energies in keV.
+            experiment : "diffractometer" or "magnet"
+                Name of the experimental configuration to focus.
+            optimize_lenses : bool
+                If True, it will also select the best lens set for each
+                energy. Otherwise the lenses currently inserted are kept.
+            reference_distance : float
+                Distance between CRL and sample when CRL Z is at zero (mm).
+
+        RETURNS
+        -------
+            dict with the "energy", "lenses", "z", "x" and "y" lists.
+        """
+        if reference_distance is None:
+            reference_distance = self._default_distance
+
+        lenses_in = self.lenses_in
+        z_now = self.z.user_readback.get()
+
+        energies = array(energies, dtype=float)
+        energies = energies[argsort(energies)]
+        energy_now = mono.energy.get()
+
+        if optimize_lenses:
+            def _calc(energy):
+                return transfocator_calculation(
+                    energy,
+                    optimize_position=z_now,
+                    reference_distance=reference_distance,
+                    experiment=experiment,
+                    selected_lenses=lenses_in,
+                    verbose=False
+                )
+
+            _, z_ref = _calc(energy_now)
+            rows = [_calc(energy) for energy in energies]
+        else:
+            # Same lenses at all energies, one vectorized calculation.
+            zs = calculator.crl_z(
+                [energy_now] + list(energies),
+                lenses_in,
+                optimize_position=z_now,
+                experiment=experiment,
+                reference_distance=reference_distance,
+            )
+            z_ref = zs[0]
+            rows = [(lenses_in, zpos) for zpos in zs[1:]]
+
+        table = dict(energy=[], lenses=[], z=[], x=[], y=[])
+        for energy, (lenses, zpos) in zip(energies, rows):
+            zpos = float(z_now + (zpos - z_ref))
+            if not self._check_z_lims(zpos):
+                raise ValueError(
+                    f"The Z position {zpos} for {energy} keV is outside the "
+                    "Z travel range."
+                )
+            table["energy"].append(energy)
+            table["lenses"].append(list(lenses))
+            table["z"].append(zpos)
+            if self.trackxy.get():
+                if None in (self._x_interpolation, self._y_interpolation):
+                    raise ValueError(
+                        "The reference data for XY tracking has not been "
+                        "entered. Cannot track the XY motion."
+                    )
+                table["x"].append(
+                    float(self._x_interpolation(zpos)) + self.deltax.get()
+                )
+                table["y"].append(
+                    float(self._y_interpolation(zpos)) + self.deltay.get()
+                )
+            else:
+                table["x"].append(None)
+                table["y"].append(None)
+
+        self._energy_table = table
+        self._energy_table_lenses = lenses_in
+        logger.info(
+            "Transfocator energy table computed for %d energies.",
+            len(table["energy"])
+        )
+        return table
+
+    def clear_energy_table(self):
+        """Forget the precomputed energy table."""
+        self._energy_table = None
+
+    def energy_table_entry(self, energy):
+        """
+        Table row of `energy` (within ENERGY_TABLE_TOLERANCE), or None.
+        """
+        table = self._energy_table
+        if table is None or len(table["energy"]) == 0:
+            return None
+        j = nearest_index(table["energy"], energy, ENERGY_TABLE_TOLERANCE)
+        if j is None:
+            return None
+        return {key: values[j] for key, values in table.items()}
+
+    def move_from_energy_table(self, entry, **kwargs):
+        """Move lenses, Z, X and Y straight to the positions of a table row."""
+        status = DeviceStatus(self)
+        status.set_finished()
+
+        # Keep the IOC energy up to date, as the scalar path does.
+        if self.energy_select.get() != 1:
+            status = AndStatus(status, self.energy_select.set(1))
+        status = AndStatus(status, self.energy_local.set(entry["energy"]))
+
+        # Lenses only change if the table was computed with optimize_lenses.
+        if entry["lenses"] != self._energy_table_lenses:
+            args = self._setup_lenses_move(entry["lenses"])
+            for lens, pos in partition(2, args):
+                status = AndStatus(status, lens.set(pos))
+            self._energy_table_lenses = entry["lenses"]
+
+        # Bypass ZMotor.set, X and Y come from the table.
+        status = AndStatus(status, EpicsMotor.set(self.z, entry["z"], **kwargs))
+        if entry["x"] is not None:
+            status = AndStatus(status, self.x.set(entry["x"]))
+            status = AndStatus(status, self.y.set(entry["y"]))
+
+        return status
+
     def move_z_correct_xy_plan(self, zpos):
         xpos = (
             self.reference_x.get() +
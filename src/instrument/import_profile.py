@@ -0,0 +1,164 @@
+"""
+Import-time profile of the instrument startup.
+==============================================
+
+Runs ``python -X importtime`` on a startup module in a separate process and
+reports the cumulative import time of each module, so the startup can be
+kept under a time budget.
+
+Usage from a shell::
+
+    python -m instrument.import_profile --station 4idb --top 25
+    python -m instrument.import_profile --budget 20  # exit 1 if over
+
+.. autosummary::
+    ~profile_imports
+    ~import_profile_report
+    ~main
+"""
+
+__all__ = """
+    profile_imports
+    import_profile_report
+""".split()
+
+import argparse
+import logging
+import subprocess
+import sys
+from os import environ
+
+from pyRestTable import Table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATION = "4idb"
+US = 1e-6  # importtime reports microseconds
+
+
+def profile_imports(module=None, station=DEFAULT_STATION):
+    """
+    Import `module` in a new interpreter and collect the import times.
+
+    Parameters
+    ----------
+    module : str, optional
+        Module to import. Default: ``instrument.startup_<station>``.
+    station : str, optional
+        Value of the POLAR_INSTRUMENT environment variable.
+
+    Returns
+    -------
+    times : list
+        Items of (module name, self time, cumulative time), in seconds, in
+        the order reported by the interpreter. Nested imports have their name
+        indented by two spaces per level.
+    """
+    if module is None:
+        module = f"instrument.startup_{station}"
+    env = dict(environ, POLAR_INSTRUMENT=station)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        logger.warning("Importing '%s' failed:\n%s", module, proc.stderr[-2000:])
+
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:  # the header line
+            continue
+        # Keep the indentation, it marks the nesting level of the import.
+        name = fields[2][1:].rstrip()
+        times.append((name, self_us * US, cumulative_us * US))
+    return times
+
+
+def import_profile_report(times, top=30, prefix=None):
+    """
+    Prints the modules with the largest cumulative import time.
+
+    Parameters
+    ----------
+    times : list
+        Output of `profile_imports`.
+    top : int, optional
+        Number of modules to show.
+    prefix : str, optional
+        Only show modules whose name starts with `prefix`, e.g. "instrument".
+
+    Returns
+    -------
+    total : float
+        Total import time (seconds), the sum of the top-level imports.
+    """
+    # Top-level imports are not indented by importtime.
+    total = sum(cumul for name, _, cumul in times if name == name.lstrip())
+    rows = [
+        (name.strip(), self_t, cumul)
+        for name, self_t, cumul in times
+        if prefix is None or name.strip().startswith(prefix)
+    ]
+    rows.sort(key=lambda row: row[2], reverse=True)
+
+    table = Table()
+    table.labels = ("Module", "Self (s)", "Cumulative (s)", "% of total")
+    for name, self_t, cumul in rows[:top]:
+        table.addRow((
+            name,
+            f"{self_t:.3f}",
+            f"{cumul:.3f}",
+            f"{100 * cumul / total:.1f}" if total > 0 else "-",
+        ))
+    print(table.reST(fmt="simple"))
+    print(f"Total import time: {total:.2f} s")
+    return total
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description="Report the import time of the instrument startup."
+    )
+    parser.add_argument(
+        "--station",
+        default=environ.get("POLAR_INSTRUMENT", DEFAULT_STATION),
+        help="station name, used to pick instrument.startup_<station>",
+    )
+    parser.add_argument(
+        "--module", default=None, help="module to profile instead of startup"
+    )
+    parser.add_argument(
+        "--top", type=int, default=30, help="number of modules to show"
+    )
+    parser.add_argument(
+        "--prefix", default=None, help="only show modules with this prefix"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="exit with status 1 if the total import time exceeds this (s)",
+    )
+    args = parser.parse_args()
+
+    times = profile_imports(args.module, args.station)
+    total = import_profile_report(times, top=args.top, prefix=args.prefix)
+
+    if args.budget is not None and total > args.budget:
+        print(f"Over budget: {total:.2f} s > {args.budget:.2f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+NeXus storage benchmark.
+========================
+
+Writes representative runs with `MyNXWriter` and several storage policies
+(see ``NEXUS_DATA_FILES.STORAGE`` in the iconfig), and reports the time to
+write each file, its size and the time to read every stream field back,
+column by column.
+
+Usage from a shell::
+
+    python -m instrument.nexus_benchmark --points 5000
+    python -m instrument.nexus_benchmark --streaming --directory /tmp/nx
+
+.. autosummary::
+    ~REPRESENTATIVE_RUNS
+    ~POLICIES
+    ~benchmark_storage
+    ~benchmark_report
+    ~main
+"""
+
+__all__ = """
+    REPRESENTATIVE_RUNS
+    POLICIES
+    benchmark_storage
+    benchmark_report
+""".split()
+
+import argparse
+import sys
+import tempfile
+import uuid
+from os import path
+from time import time as ttime
+
+import h5py
+import numpy as np
+from pyRestTable import Table
+
+# Fields of each run: name -> (descriptor dtype, shape of one point).
+REPRESENTATIVE_RUNS = dict(
+    scaler=dict(
+        points=2000,
+        fields={
+            "x": ("number", []),
+            **{f"scaler_ch{i}": ("integer", []) for i in range(1, 9)},
+        },
+    ),
+    vortex=dict(
+        points=500,
+        fields={
+            "energy": ("number", []),
+            **{f"vortex_roi{i}": ("number", []) for i in range(1, 9)},
+            "vortex_spectrum": ("array", [2048]),
+        },
+    ),
+    tetramm=dict(
+        points=20000,
+        fields={
+            "y": ("number", []),
+            **{f"tetramm_current{i}": ("number", []) for i in range(1, 5)},
+        },
+    ),
+)
+"""Step scans with scaler channels and Vortex ROIs, TetrAMM fly scan."""
+
+POLICIES = dict(
+    none=dict(COMPRESSION="none"),
+    gzip=dict(COMPRESSION="gzip", COMPRESSION_LEVEL=4),
+    lzf=dict(COMPRESSION="lzf"),
+    blosc_lz4=dict(COMPRESSION="blosc_lz4", COMPRESSION_LEVEL=5),
+    blosc_zstd=dict(COMPRESSION="blosc_zstd", COMPRESSION_LEVEL=3),
+)
+"""Storage policies compared by default."""
+
+
+def _value(dtype, shape, index, rng):
+    """Detector-like value: counts with noise, smooth positions."""
+    if dtype == "integer":
+        return int(rng.poisson(1000 + 500*np.sin(index/50)))
+    if dtype == "array":
+        peak = np.exp(-((np.arange(shape[0]) - shape[0]/2)/40)**2)
+        return rng.poisson(100*peak + 5).astype(float).tolist()
+    return 1e-3*index + float(rng.normal(0, 1e-6))
+
+
+def _documents(run, npoints=None, seed=0):
+    """Start, descriptor, event and stop documents of a run."""
+    rng = np.random.default_rng(seed)
+    fields = run["fields"]
+    npoints = npoints or run["points"]
+    t0 = ttime()
+    start = str(uuid.uuid4())
+    yield "start", dict(
+        uid=start,
+        time=t0,
+        scan_id=1,
+        plan_name="benchmark",
+        detectors=list(fields)[1:],
+        motors=list(fields)[:1],
+        title="NeXus storage benchmark",
+    )
+    descriptor = str(uuid.uuid4())
+    yield "descriptor", dict(
+        uid=descriptor,
+        run_start=start,
+        name="primary",
+        data_keys={
+            name: dict(dtype=dtype, shape=shape, source=f"SIM:{name}")
+            for name, (dtype, shape) in fields.items()
+        },
+    )
+    for index in range(npoints):
+        data = {
+            name: _value(dtype, shape, index, rng)
+            for name, (dtype, shape) in fields.items()
+        }
+        yield "event", dict(
+            uid=str(uuid.uuid4()),
+            descriptor=descriptor,
+            seq_num=index + 1,
+            time=t0 + 0.01*index,
+            data=data,
+            timestamps={name: t0 + 0.01*index for name in data},
+        )
+    yield "stop", dict(
+        uid=str(uuid.uuid4()),
+        run_start=start,
+        time=t0 + 0.01*npoints,
+        exit_status="success",
+        reason="",
+        num_events=dict(primary=npoints),
+    )
+
+
+def _read_time(fname):
+    """Time to read every field (value, EPOCH, time) of the streams."""
+    t0 = ttime()
+    with h5py.File(fname, "r") as root:
+        streams = root["/entry/instrument/bluesky/streams"]
+        for stream in streams.values():
+            for field in stream.values():
+                for name in ("value", "EPOCH", "time"):
+                    if name in field:
+                        field[name][()]
+    return ttime() - t0
+
+
+def benchmark_storage(
+    policies=None, runs=None, npoints=None, directory=None, streaming=False
+):
+    """
+    Write and read representative runs with several storage policies.
+
+    Parameters
+    ----------
+    policies : dict, optional
+        Name -> ``NEXUS_DATA_FILES.STORAGE`` policy. Default: `POLICIES`.
+    runs : dict, optional
+        Name -> run description. Default: `REPRESENTATIVE_RUNS`.
+    npoints : int, optional
+        Number of points of every run, instead of their own.
+    directory : str, optional
+        Where the files are written. Default: a temporary directory,
+        removed at the end.
+    streaming : boolean, optional
+        If True, the files are streamed during the run (SWMR).
+
+    Returns
+    -------
+    results : list
+        Items of (run, policy, write time (s), read time (s), size (bytes)).
+    """
+    from .callbacks.nexus_data_file_writer import MyNXWriter
+
+    policies = policies or POLICIES
+    runs = runs or REPRESENTATIVE_RUNS
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = directory or tmp
+        results = []
+        for run_name, run in runs.items():
+            documents = list(_documents(run, npoints))
+            for policy_name, policy in policies.items():
+                writer = MyNXWriter()
+                writer.streaming = streaming
+                writer.background = False
+                writer.storage = dict(policy)
+                writer._external_file_read_retry_delay = 0.001  # wait poll
+                writer.file_name = path.join(
+                    directory, f"{run_name}_{policy_name}.hdf"
+                )
+
+                t0 = ttime()
+                for key, doc in documents:
+                    writer.receiver(key, doc)
+                writer.wait_writer()
+                write_time = ttime() - t0
+
+                results.append((
+                    run_name,
+                    policy_name,
+                    write_time,
+                    _read_time(writer.file_name),
+                    path.getsize(writer.file_name),
+                ))
+    return results
+
+
+def benchmark_report(results):
+    """
+    Prints the results of `benchmark_storage`.
+
+    The size ratio compares each policy with the first one of the run.
+    """
+    table = Table()
+    table.labels = (
+        "Run", "Policy", "Write (s)", "Read (s)", "Size (MB)", "Size ratio"
+    )
+    reference = {}
+    for run_name, policy_name, write_time, read_time, size in results:
+        reference.setdefault(run_name, size)
+        table.addRow((
+            run_name,
+            policy_name,
+            f"{write_time:.3f}",
+            f"{read_time:.4f}",
+            f"{size / 1e6:.2f}",
+            f"{size / reference[run_name]:.2f}",
+        ))
+    print(table.reST(fmt="simple"))
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description="Compare the NeXus storage policies."
+    )
+    parser.add_argument(
+        "--points",
+        type=int,
+        default=None,
+        help="number of points of every run (default: per run)",
+    )
+    parser.add_argument(
+        "--policy",
+        action="append",
+        choices=sorted(POLICIES),
+        help="policy to compare, can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--directory", default=None, help="keep the files in this directory"
+    )
+    parser.add_argument(
+        "--streaming", action="store_true", help="stream the files (SWMR)"
+    )
+    args = parser.parse_args()
+
+    policies = None
+    if args.policy:
+        policies = {name: POLICIES[name] for name in args.policy}
+    results = benchmark_storage(
+        policies,
+        npoints=args.points,
+        directory=args.directory,
+        streaming=args.streaming,
+    )
+    benchmark_report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,11 +10,13 @@ from .local_scans import (
     mvr,
     grid_scan,
     rel_grid_scan,
+    list_scan,
     qxscan,
     count,
     abs_set
 )
 
 from .center_maximum import maxi, cen
+from .duration_estimate import estimate_duration
 #from .flyscan_demo import flyscan_1d, flyscan_snake, flyscan_cycler
 #from .workflow_plan import run_workflow
@@ -0,0 +1,289 @@
+"""
+Scan duration estimate
+======================
+
+Walks the messages of a plan without running it, and adds up:
+
+* the moves, from the velocity and acceleration of the motor records (see
+  `axis_time`), or ``SCANS.SET_TIMES`` for other positioners (e.g. energy);
+* the counting, from the ``preset_monitor`` of the triggered detectors,
+  following the presets set by the plan (count time, qxscan factors);
+* the time of every other message, learned by `point_timer` from the
+  previous timed runs, or `DEFAULT_OVERHEADS`.
+
+Dichro scans, qxscan energy lists and fixQ moves are estimated from the
+messages they generate. The plan is generated as in a real run, so PVs are
+read but nothing is moved or triggered. The plans skip their other side
+effects (detector file setup, NeXus writer setup) when `is_dry_run`.
+
+The dry run state is a module flag: do not estimate a plan while another
+plan is being generated in a different thread (e.g. from the RunEngine of a
+queueserver), since that plan would also see `is_dry_run`. With
+``SCANS.ESTIMATE_DURATION`` the plan body is run twice, first walked here
+and then by the RunEngine, both in the same thread.
+
+.. autosummary::
+    ~estimate_duration
+    ~duration_metadata
+    ~is_dry_run
+"""
+
+__all__ = ["estimate_duration", "duration_metadata", "is_dry_run"]
+
+from collections import defaultdict
+from functools import wraps
+
+from ophyd.status import Status
+from pyRestTable import Table
+
+from ..utils._logging_setup import logger
+from ..utils.config import iconfig
+from ..utils.point_ordering import axis_kinematics, axis_time
+from ..utils.point_timing import MESSAGE_TIMINGS, point_timer
+
+# Time (s) of a message, used until `point_timer` measured it.
+DEFAULT_OVERHEADS = dict(
+    read=0.01,
+    save=0.02,
+    create=0.001,
+    checkpoint=0.001,
+    stage=0.05,
+    unstage=0.05,
+    open_run=0.1,
+    close_run=0.1,
+)
+
+# Move time (s) of positioners without a motor record.
+SET_TIMES = iconfig.get("SCANS", {}).get("SET_TIMES", {})
+
+# Add the estimate to the run metadata of the local plans.
+ESTIMATE_DURATION = iconfig.get("SCANS", {}).get("ESTIMATE_DURATION", False)
+
+_dry_run = [False]
+
+
+def is_dry_run():
+    """
+    True while `estimate_duration` walks a plan.
+
+    It is not thread specific, see the module docstring.
+    """
+    return _dry_run[0]
+
+
+# Messages whose time is physical, estimated from the devices.
+_PHYSICAL = ("set", "trigger", "wait", "sleep")
+
+
+def _overhead(command):
+    """Mean time of a message, learned by `point_timer` if possible."""
+    info = MESSAGE_TIMINGS.get(command)
+    if info and info["count"]:
+        return info["total"]/info["count"]
+    return DEFAULT_OVERHEADS.get(command, 0.0)
+
+
+def _position(obj, positions):
+    if obj in positions:
+        return positions[obj]
+    try:
+        return float(obj.position)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _set_time(obj, target, positions):
+    """Estimated time to move `obj` to `target`."""
+    start = _position(obj, positions)
+    try:
+        positions[obj] = float(target)
+    except (TypeError, ValueError):
+        return 0.0
+    if hasattr(obj, "velocity"):
+        if start is None:
+            return 0.0
+        velocity, acceleration = axis_kinematics(obj)
+        return float(axis_time(target - start, velocity, acceleration))
+    if start is not None and start == positions[obj]:
+        return 0.0
+    return SET_TIMES.get(obj.name, 0.0)
+
+
+def _count_time(det, presets):
+    """Counting time of a detector, from its `preset_monitor`."""
+    preset = getattr(det, "preset_monitor", None)
+    if preset is None:
+        return 0.0
+    if preset in presets:
+        return abs(presets[preset])
+    try:
+        return abs(float(preset.get()))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def _value(obj, positions):
+    """Last set position, or current position or value, of `obj`."""
+    value = _position(obj, positions)
+    if value is None:
+        try:
+            value = obj.get()
+        except Exception:
+            value = None
+    return value
+
+
+def _response(msg, positions):
+    """Stand-in for the RunEngine response to a message."""
+    if msg.command == "read":
+        try:
+            return msg.obj.read()
+        except Exception:
+            return {}
+    if msg.command == "locate":
+        locations = [
+            dict(setpoint=value, readback=value)
+            for value in (_value(obj, positions) for obj in msg.args)
+        ]
+        if msg.kwargs.get("squeeze", True) and len(locations) == 1:
+            return locations[0]
+        return locations
+    if msg.command in ("set", "trigger"):
+        # Finished status, for plans that check it (e.g. PipelinedStep).
+        status = Status()
+        status.set_finished()
+        return status
+    if msg.command == "open_run":
+        return "dry-run"
+    if msg.command == "subscribe":
+        return 0
+    return None
+
+
+def _walk(plan):
+    """Adds up the estimated time of each message of `plan`."""
+    times = defaultdict(float)
+    positions = {}
+    presets = {}
+    # group -> [longest move, longest count] until its statuses finish
+    pending = defaultdict(lambda: [0.0, 0.0])
+    points = 0
+    stream = None  # of the event being bundled
+    response = None
+    while True:
+        try:
+            msg = plan.send(response)
+        except StopIteration:
+            break
+
+        command = msg.command
+        group = msg.kwargs.get("group")
+        if command == "set":
+            duration = _set_time(msg.obj, msg.args[0], positions)
+            presets[msg.obj] = msg.args[0]
+            pending[group][0] = max(pending[group][0], duration)
+        elif command == "trigger":
+            duration = _count_time(msg.obj, presets)
+            pending[group][1] = max(pending[group][1], duration)
+        elif command == "wait":
+            move, count = pending.pop(group, (0.0, 0.0))
+            times["count"] += count
+            times["move"] += max(move - count, 0.0)
+        elif command == "sleep":
+            times["sleep"] += msg.args[0]
+        elif command == "create":
+            stream = msg.kwargs.get("name")
+        elif command == "save":
+            if stream == "primary":
+                points += 1
+            stream = None
+        if command not in _PHYSICAL:
+            times["overhead"] += _overhead(command)
+        response = _response(msg, positions)
+
+    return times, points
+
+
+def _baseline_time():
+    """Baseline reads of the last timed run, not in the plan messages."""
+    run = point_timer.last_run
+    if run is None:
+        return 0.0
+    return run["setup"].get("baseline", 0.0) + \
+        run["teardown"].get("baseline", 0.0)
+
+
+def estimate_duration(plan_function, *args, output=True, **kwargs):
+    """
+    Estimated wall time of a plan.
+
+    Parameters
+    ----------
+    plan_function : callable
+        Plan, e.g. `qxscan`.
+    ``*args``, ``**kwargs``
+        Arguments of the plan.
+    output : boolean, optional
+        If True, prints the estimate.
+
+    Returns
+    -------
+    estimate : dict
+        Seconds spent moving, counting, sleeping, in message overheads and
+        reading the baseline, the total and the number of events.
+
+    Example
+    -------
+    estimate_duration(qxscan, 7.112, time=1, dichro=True)
+    """
+    _dry_run[0] = True
+    try:
+        times, points = _walk(plan_function(*args, **kwargs))
+    finally:
+        _dry_run[0] = False
+
+    times["baseline"] = _baseline_time()
+    estimate = {
+        key: round(times[key], 2)
+        for key in ("move", "count", "sleep", "overhead", "baseline")
+    }
+    estimate["total"] = round(sum(estimate.values()), 2)
+    estimate["events"] = points
+
+    if output:
+        table = Table()
+        table.labels = ("Item", "Time (s)")
+        for key in ("move", "count", "sleep", "overhead", "baseline"):
+            table.addRow((key, f"{estimate[key]:.1f}"))
+        table.addRow(("total", f"{estimate['total']:.1f}"))
+        print(f"\n{getattr(plan_function, '__name__', 'plan')}: "
+              f"{points} events, about {estimate['total']/60:.1f} min")
+        print(table.reST(fmt="simple"))
+    return estimate
+
+
+def duration_metadata(plan_function):
+    """
+    Adds the estimated duration to the run metadata of a plan.
+
+    If ``SCANS.ESTIMATE_DURATION`` is set, the plan is first walked by
+    `estimate_duration` and the total (seconds) is added as the
+    "estimated_duration" metadata, visible to the queueserver monitors and
+    in the databroker. An "estimated_duration" already in `md` (e.g. from
+    `lup` calling `ascan`) is kept.
+    """
+    @wraps(plan_function)
+    def wrapper(*args, **kwargs):
+        md = kwargs.get("md") or {}
+        if ESTIMATE_DURATION and not _dry_run[0] and \
+                "estimated_duration" not in md:
+            try:
+                estimate = estimate_duration(
+                    plan_function, *args, output=False, **kwargs
+                )
+                kwargs["md"] = dict(md, estimated_duration=estimate["total"])
+            except Exception as exinfo:
+                logger.warning("Could not estimate the duration: %s", exinfo)
+        return (yield from plan_function(*args, **kwargs))
+
+    return wrapper
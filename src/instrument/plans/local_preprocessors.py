@@ -7,6 +7,8 @@ from ophyd import Kind
 from ..callbacks.dichro_stream import plot_dichro_settings, dichro_bec
 from ..devices import counters
 from ..devices.phaseplates import pr_setup
+from ..devices.transfocator_device import transfocator
+from ..devices.energy_device import energy
 from ..utils.run_engine import bec
 from ..utils._logging_setup import logger
 logger.info(__file__)
@@ -109,6 +111,7 @@ def stage_dichro_wrapper(plan, dichro, lockin, positioner):
     """
     _current_scaler_plot = []
     _dichro_token = [None, None]
+    _fast_stash = {}
 
     def _stage():
 
@@ -153,6 +156,45 @@ def stage_dichro_wrapper(plan, dichro, lockin, positioner):
                     pr_setup.positioner, pr_setup.positioner.parent.center.get()
                 )
 
+            fast = pr_setup.fast_dichro_detector()
+            if fast is not None:
+                yield from _stage_fast_dichro(fast)
+            elif pr_setup.fast_dichro:
+                logger.warning(
+                    "Fast dichro needs the PZT, using the step by step mode."
+                )
+
+    def _stage_fast_dichro(fast):
+        # One event per point, with the readings of all helicity states.
+        settings = plot_dichro_settings.settings
+        _fast_stash.update(
+            n=plot_dichro_settings.n,
+            monitor=settings.monitor,
+            detector=settings.detector,
+            signs=settings.signs,
+        )
+        fast.monitor_name = settings.monitor
+        fast.detector_name = settings.detector
+        fast.transmission = settings.transmission
+
+        plot_dichro_settings.n = 1
+        settings.monitor = fast.monitor.name
+        settings.detector = fast.detector.name
+        settings.signs = fast.get_signs()
+
+        _fast_stash["softglue"] = fast.softglue
+        yield from fast.softglue.setup_dichro_gate_plan()
+
+        # The dwell follows the scaler at each point, see `dichro_steps`.
+        scaler = counters.default_scaler
+        if scaler.monitor != "Time":
+            logger.warning(
+                "The scaler counts on '%s', the fast dichro dwell is "
+                "%s.preset_monitor = %s s.",
+                scaler.monitor, fast.name, fast.preset_monitor.get()
+            )
+        yield from mv(pr_setup.positioner.parent.selectAC, 1)
+
     def _unstage():
 
         if lockin:
@@ -160,6 +202,18 @@ def stage_dichro_wrapper(plan, dichro, lockin, positioner):
             yield from mv(pr_setup.positioner.parent.selectDC, 1)
             # yield from mv(pr_setup.positioner.parent.ACstatus, 0)
 
+        if dichro and _fast_stash:
+            settings = plot_dichro_settings.settings
+            plot_dichro_settings.n = _fast_stash.pop("n")
+            settings.monitor = _fast_stash.pop("monitor")
+            settings.detector = _fast_stash.pop("detector")
+            settings.signs = _fast_stash.pop("signs")
+            # Not there if the stage failed before the softglue setup.
+            softglue = _fast_stash.pop("softglue", None)
+            if softglue is not None:
+                yield from softglue.restore_dichro_gate_plan()
+            yield from mv(pr_setup.positioner.parent.selectDC, 1)
+
         if dichro:
             # move PZT to off center.
             if 'pzt' in pr_setup.positioner.name:
@@ -178,6 +232,79 @@ def stage_dichro_wrapper(plan, dichro, lockin, positioner):
     return (yield from finalize_wrapper(_inner_plan(), _unstage()))
 
 
+def transfocator_table_wrapper(plan, energies):
+    """
+    Precompute the transfocator energy table for the scan energies.
+
+    Only done if the transfocator is tracking the energy and its
+    `use_energy_table` flag is set. The table is removed at the end.
+
+    Parameters
+    ----------
+    plan : iterable or iterator
+        a generator, list, or similar containing `Msg` objects
+    energies : iterable
+        energies (keV) of the scan.
+
+    Yields
+    ------
+    msg : Msg
+        messages from plan
+    """
+
+    def _stage():
+        if transfocator.tracking.get() and transfocator.use_energy_table.get():
+            transfocator.compute_energy_table(energies)
+        yield from null()
+
+    def _unstage():
+        transfocator.clear_energy_table()
+        yield from null()
+
+    def _inner_plan():
+        yield from _stage()
+        return (yield from plan)
+
+    return (yield from finalize_wrapper(_inner_plan(), _unstage()))
+
+
+def energy_tracking_wrapper(plan, energies):
+    """
+    Precompute the energy tracking moves for the scan energies.
+
+    The devices that track the energy are read once, before the scan, and
+    each point moves them as one group (see `EnergyTrackingPlan`).
+
+    Parameters
+    ----------
+    plan : iterable or iterator
+        a generator, list, or similar containing `Msg` objects
+    energies : iterable
+        energies (keV) of the scan.
+
+    Yields
+    ------
+    msg : Msg
+        messages from plan
+    """
+
+    def _stage():
+        energy.prepare_tracking(energies)
+        yield from null()
+
+    def _unstage():
+        energy.clear_tracking()
+        yield from null()
+
+    def _inner_plan():
+        yield from _stage()
+        return (yield from plan)
+
+    return (yield from finalize_wrapper(_inner_plan(), _unstage()))
+
+
 extra_devices_decorator = make_decorator(extra_devices_wrapper)
 configure_counts_decorator = make_decorator(configure_counts_wrapper)
 stage_dichro_decorator = make_decorator(stage_dichro_wrapper)
+transfocator_table_decorator = make_decorator(transfocator_table_wrapper)
+energy_tracking_decorator = make_decorator(energy_tracking_wrapper)
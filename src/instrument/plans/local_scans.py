@@ -9,31 +9,46 @@ __all__ = [
     'mvr',
     'grid_scan',
     'rel_grid_scan',
+    'list_scan',
     'qxscan',
     'count',
     'abs_set'
 ]
 
 from bluesky.plans import (
-    scan, grid_scan as bp_grid_scan, count as bp_count, list_scan
+    scan, grid_scan as bp_grid_scan, count as bp_count,
+    list_scan as bp_list_scan
 )
 from bluesky.plan_stubs import (
-    mv as bps_mv, abs_set as bps_abs_set, rd, trigger_and_read, move_per_step
+    mv as bps_mv, abs_set as bps_abs_set, rd, trigger_and_read, move_per_step,
+    checkpoint, create, drop, read, save, trigger, wait
 )
 from bluesky.preprocessors import (
-    reset_positions_decorator, relative_set_decorator, subs_decorator
+    reset_positions_decorator, relative_set_decorator, subs_decorator,
+    contingency_wrapper, run_decorator, stage_decorator
 )
-from bluesky.plan_patterns import chunk_outer_product_args
+from bluesky.plan_patterns import (
+    chunk_outer_product_args, inner_product, outer_product
+)
+from bluesky.utils import root_ancestor, separate_devices, short_uid
 from .local_preprocessors import (
     configure_counts_decorator,
     extra_devices_decorator,
-    stage_dichro_decorator
+    stage_dichro_decorator,
+    transfocator_table_decorator,
+    energy_tracking_decorator
 )
 
 from toolz import partition
 from pathlib import Path
-from numpy import array
-
+from collections import defaultdict
+from functools import partial
+from time import time as ttime
+from numpy import argsort, array, zeros
+
+from ..callbacks.dichro_stream import plot_dichro_settings, xas_xmcd
+from .duration_estimate import duration_metadata, is_dry_run
+from .statistics_counting import statistics_reading
 from ..callbacks.nexus_data_file_writer import nxwriter
 from ..devices import counters
 from ..devices.qxscan_setup import qxscan_params
@@ -42,26 +57,47 @@ from ..devices.aps_undulator import undulators
 from ..devices.phaseplates import pr1, pr2, pr3, pr_setup
 from ..utils._logging_setup import logger
 from ..utils.experiment_utils import experiment
+from ..utils.hkl_trajectory import solve_hkl_points
+from ..utils.point_ordering import order_points
 from ..utils.run_engine import RE
 from ..utils.config import iconfig
-from ..utils.hkl_utils import current_diffractometer
 
 logger.info(__file__)
 
 HDF1_NAME_FORMAT = Path(iconfig["AREA_DETECTOR"]["HDF5_FILE_TEMPLATE"])
 
+# Detectors that latch their data at the end of the acquisition, see
+# `PipelinedStep`. A device `pipeline_safe` attribute overrides this list.
+PIPELINE_SAFE_DETECTORS = iconfig.get("SCANS", {}).get(
+    "PIPELINE_SAFE_DETECTORS", []
+)
+
+# Solve the fixQ/hkl list positions before the scan, see `_setup_fixq`.
+FIXQ_PRECOMPUTE = iconfig.get("SCANS", {}).get("FIXQ_PRECOMPUTE", True)
+
 
 class LocalFlag:
     """Stores flags that are used to select and run local scans."""
     dichro = False
     fixq = False
     hkl_pos = {}
+    hkl_reals = {}
     dichro_steps = None
 
 
 flag = LocalFlag()
 
 
+def current_diffractometer():
+    """
+    Currently selected hklpy diffractometer.
+
+    The hkl stack is only imported when a plan needs it (fixq scans).
+    """
+    from hkl.user import current_diffractometer as _current_diffractometer
+    return _current_diffractometer()
+
+
 def _collect_extras(escan_flag, huber_flag):
     """Collect all detectors that need to be read during a scan."""
 
@@ -96,7 +132,20 @@ def dichro_steps(devices_to_read, take_reading):
     Switch the x-ray polarization for each scan point.
     This will increase the number of points in a scan by a factor that is equal
     to the length of the `pr_setup.dichro_steps` list.
+
+    In the fast dichro mode (`pr_setup.fast_dichro` with the PZT) the
+    softglue flips the polarization, and a single reading of the fast dichro
+    detector has all the polarization states. Its dwell is the scaler preset
+    of the point (e.g. with the qxscan factors) if the scaler counts time.
     """
+    fast = pr_setup.fast_dichro_detector()
+    if fast is not None:
+        scaler = counters.default_scaler
+        if scaler.monitor == "Time":
+            dwell = yield from rd(scaler.preset_monitor)
+            yield from mv(fast.preset_monitor, dwell)
+        return (yield from take_reading(devices_to_read + [fast]))
+
     devices_to_read += [pr_setup.positioner]
     for pos in flag.dichro_steps:
         yield from mv(pr_setup.positioner, pos)
@@ -133,9 +182,13 @@ def one_local_step(detectors, step, pos_cache, take_reading=trigger_and_read):
     if flag.fixq:
         huber = current_diffractometer()
         devices_to_read += [huber]
-        args = (huber.h, flag.hkl_pos[huber.h],
-                huber.k, flag.hkl_pos[huber.k],
-                huber.l, flag.hkl_pos[huber.l])
+        reals = flag.hkl_reals.get(step.get(energy))
+        if reals:
+            args = [item for pair in reals.items() for item in pair]
+        else:
+            args = (huber.h, flag.hkl_pos[huber.h],
+                    huber.k, flag.hkl_pos[huber.k],
+                    huber.l, flag.hkl_pos[huber.l])
         yield from bps_mv(*args)
 
     if flag.dichro:
@@ -144,6 +197,499 @@ def one_local_step(detectors, step, pos_cache, take_reading=trigger_and_read):
         yield from take_reading(devices_to_read)
 
 
+def pipeline_safe(device):
+    """
+    True if `device` can be read while the motors move to the next point.
+
+    Set ``device.pipeline_safe = True`` (or list its name in
+    ``SCANS.PIPELINE_SAFE_DETECTORS``) only for detectors that keep their
+    data once the trigger is done, like the scalers.
+    """
+    default = device.name in PIPELINE_SAFE_DETECTORS
+    return getattr(device, "pipeline_safe", default)
+
+
+class PipelinedStep:
+    """
+    Inner loop that moves to the next point while the detectors are read.
+
+    For each point, the detectors are triggered and the positioners (and any
+    device not `pipeline_safe`) are read. Then the move to the next point is
+    started, and the `pipeline_safe` detectors are read and the event is
+    emitted while the motors move. The next step only waits for that move.
+
+    It is used as the `per_step` kwarg of the `ascan` and `grid_scan` plans
+    with ``pipeline=True``. A step that does not match the expected next
+    point (or a move that did not finish, e.g. after a pause) is moved as
+    usual.
+
+    Parameters
+    ----------
+    steps : list of dict
+        All the points of the scan, in order, mapping motors to positions.
+    name : str, optional
+        Event stream name. Defaults to 'primary'.
+    """
+
+    def __init__(self, steps, name="primary"):
+        self.steps = list(steps)
+        self.name = name
+        self._index = 0
+        self._premove = None  # (step, group, statuses)
+
+    def _next_step(self):
+        self._index += 1
+        if self._index < len(self.steps):
+            return self.steps[self._index]
+        return None
+
+    def _move(self, step, pos_cache):
+        """Wait for the move started in the previous step."""
+        if self._premove is None:
+            return (yield from move_per_step(step, pos_cache))
+
+        premoved, group, statuses = self._premove
+        self._premove = None
+        yield from checkpoint()
+        yield from wait(group=group)
+
+        done = all(status.done and status.success for status in statuses)
+        if not done or premoved != step:
+            logger.debug("Pipelined move not used for step %s", step)
+            for motor in premoved:
+                pos_cache[motor] = None
+            return (yield from move_per_step(step, pos_cache))
+
+        pos_cache.update(step)
+
+    def _start_next_move(self, next_step, pos_cache):
+        """Start the move to the next point, without waiting."""
+        group = short_uid("pipelined_set")
+        statuses = []
+        for motor, pos in next_step.items():
+            if pos == pos_cache[motor]:
+                continue
+            statuses.append((yield from bps_abs_set(motor, pos, group=group)))
+        self._premove = (next_step, group, statuses)
+
+    def __call__(self, detectors, step, pos_cache):
+        yield from self._move(step, pos_cache)
+        next_step = self._next_step()
+
+        devices = separate_devices(
+            root_ancestor(device)
+            for device in list(step.keys()) + list(detectors)
+        )
+        early = [device for device in devices if not pipeline_safe(device)]
+        latched = [device for device in devices if pipeline_safe(device)]
+
+        group = short_uid("trigger")
+        for device in devices:
+            if hasattr(device, "trigger"):
+                yield from trigger(device, group=group)
+        yield from wait(group=group)
+
+        def _read_point():
+            yield from create(self.name)
+            for device in early:
+                yield from read(device)
+            if next_step is not None:
+                yield from self._start_next_move(next_step, pos_cache)
+            for device in latched:
+                yield from read(device)
+            yield from save()
+
+        def _drop(exception):
+            yield from drop()
+
+        return (
+            yield from contingency_wrapper(_read_point(), except_plan=_drop)
+        )
+
+
+def _scan_steps(args):
+    """Points of `bluesky.plans.scan` with these arguments."""
+    return list(inner_product(num=args[-1], args=args[:-1]))
+
+
+def _grid_steps(args, snake_axes=None):
+    """Points of `bluesky.plans.grid_scan` with these arguments."""
+    chunks = list(chunk_outer_product_args(args))
+    if snake_axes is True:
+        snake_axes = [chunk[0] for chunk in chunks[1:]]
+    if snake_axes is not None and snake_axes is not False:
+        chunks = [chunk[:4] + (chunk[0] in snake_axes,) for chunk in chunks]
+    elif snake_axes is False:
+        chunks = [chunk[:4] + (False,) for chunk in chunks]
+
+    _args = list(chunks[0][:4])
+    for chunk in chunks[1:]:
+        _args.extend(chunk)
+    return list(outer_product(args=_args))
+
+
+def _list_steps(args):
+    """Points of `bluesky.plans.list_scan` with these arguments."""
+    motors, positions = zip(*partition(2, args))
+    return [dict(zip(motors, point)) for point in zip(*positions)]
+
+
+def _list_args(steps):
+    """`bluesky.plans.list_scan` arguments measuring these points."""
+    args = []
+    for motor in steps[0]:
+        args.extend([motor, [step[motor] for step in steps]])
+    return args
+
+
+# Last ordering: the one of the duration estimate is used by the run.
+_ORDER_CACHE = {}
+
+
+def _min_travel_steps(steps, relative=False):
+    """
+    Reorders the points to minimize the estimated move time.
+
+    Parameters
+    ----------
+    steps : list of dict
+        Points of the scan, mapping motors to positions.
+    relative : boolean, optional
+        True if the positions are relative to the current position.
+
+    Returns
+    -------
+    steps : list of dict
+        Points in the new order.
+    md : dict
+        Run metadata, with the original index of each measured point
+        ("point_order") and the estimated move times (seconds).
+    """
+    motors = list(steps[0])
+    points = [[step[motor] for motor in motors] for step in steps]
+    key = (
+        tuple(motor.name for motor in motors),
+        tuple(map(tuple, points)),
+        relative,
+    )
+    if key not in _ORDER_CACHE:
+        _ORDER_CACHE.clear()
+        _ORDER_CACHE[key] = order_points(
+            points,
+            motors=motors,
+            start=[0.0]*len(motors) if relative else None,
+        )
+    order, original, optimized = _ORDER_CACHE[key]
+    md = dict(
+        point_order=order,
+        estimated_move_time=dict(
+            original=round(original, 2), optimized=round(optimized, 2)
+        ),
+    )
+    return [steps[i] for i in order], md
+
+
+def _setup_fixq(steps, relative=False):
+    """
+    Keeps the current hkl for a fixQ scan.
+
+    If `FIXQ_PRECOMPUTE`, the real positions of that hkl are solved for all
+    the energies of `steps` before the scan (see `solve_hkl_points`), and
+    `one_local_step` moves the real motors directly.
+
+    Parameters
+    ----------
+    steps : list of dict
+        Points of the scan, mapping motors to positions.
+    relative : boolean, optional
+        True if the positions are relative to the current position.
+    """
+    huber = current_diffractometer()
+    flag.hkl_pos = {
+        huber.h: huber.h.get().setpoint,
+        huber.k: huber.k.get().setpoint,
+        huber.l: huber.l.get().setpoint,
+    }
+    flag.hkl_reals = {}
+    if not FIXQ_PRECOMPUTE:
+        return
+
+    # one_local_step looks the solution up with the energy of the step.
+    keys = sorted({step[energy] for step in steps if energy in step})
+    energies = None
+    if keys:
+        offset = energy.get() if relative else 0
+        energies = [key + offset for key in keys]
+    else:
+        keys = [None]
+
+    hkl = [flag.hkl_pos[axis] for axis in (huber.h, huber.k, huber.l)]
+    solutions = solve_hkl_points(huber, [hkl]*len(keys), energies=energies)
+    unreachable = [key for key, sol in zip(keys, solutions) if sol is None]
+    if unreachable:
+        raise ValueError(
+            f"hkl = {hkl} cannot be reached at the energies {unreachable}, "
+            "check the mode and constraints."
+        )
+    flag.hkl_reals = dict(zip(keys, solutions))
+
+
+def _hkl_reals_steps(steps):
+    """
+    Replaces the hkl axes of `steps` by the diffractometer real positions.
+
+    The real positions of all points are solved before the scan (see
+    `solve_hkl_points`), using the energy of each point if it is scanned.
+    Missing hkl axes stay at their current setpoint.
+
+    Returns
+    -------
+    steps : list of dict
+        Points with the real motors instead of the hkl axes. Unchanged if
+        there are no hkl axes.
+    diffractometer : hklpy Diffractometer or None
+        Diffractometer of the hkl axes, to be read at each point.
+    """
+    pseudos = [
+        motor for motor in steps[0]
+        if getattr(getattr(motor, "parent", None), "calc", None) is not None
+        and motor in motor.parent.pseudo_positioners
+    ]
+    if not pseudos:
+        return steps, None
+
+    diffractometer = pseudos[0].parent
+    axes = diffractometer.pseudo_positioners
+    current = [axis.get().setpoint for axis in axes]
+    hkls = [
+        [step.get(axis, value) for axis, value in zip(axes, current)]
+        for step in steps
+    ]
+    energies = None
+    if energy in steps[0]:
+        energies = [step[energy] for step in steps]
+
+    solutions = solve_hkl_points(diffractometer, hkls, energies=energies)
+    unreachable = [
+        tuple(hkl) for hkl, sol in zip(hkls, solutions) if sol is None
+    ]
+    if unreachable:
+        raise ValueError(
+            f"{len(unreachable)} points cannot be reached, check the mode "
+            f"and constraints: {unreachable}"
+        )
+
+    new_steps = []
+    for step, solution in zip(steps, solutions):
+        new_step = {
+            motor: value for motor, value in step.items()
+            if motor not in axes
+        }
+        new_step.update(solution)
+        new_steps.append(new_step)
+    return new_steps, diffractometer
+
+
+def _curvature(x, y):
+    """Absolute second derivative on a non-uniform grid, zero at the ends."""
+    curv = zeros(len(x))
+    if len(x) < 3:
+        return curv
+    h1 = x[1:-1] - x[:-2]
+    h2 = x[2:] - x[1:-1]
+    curv[1:-1] = abs(
+        2*(h2*y[:-2] - (h1 + h2)*y[1:-1] + h1*y[2:]) / (h1*h2*(h1 + h2))
+    )
+    return curv
+
+
+def _adaptive_next_points(positions, measured, batch):
+    """
+    Indices of the next points of an adaptive scan.
+
+    The measured points are sorted by position, and the intervals between
+    them are ranked by the largest normalized curvature of the signals at
+    their ends times their width. The unmeasured point closest to the
+    middle of the best intervals are returned.
+
+    Parameters
+    ----------
+    positions : numpy.array
+        Positions of all the points that could be measured.
+    measured : dict
+        Signals (tuple) measured at each point index.
+    batch : int
+        Maximum number of points returned.
+    """
+    done = array(sorted(measured, key=lambda i: positions[i]))
+    x = positions[done]
+    signals = array([measured[i] for i in done], dtype=float)
+
+    weight = zeros(len(x))
+    for column in signals.T:
+        curv = _curvature(x, column)
+        if curv.max() > 0:
+            weight += curv/curv.max()
+    if weight.max() == 0:
+        weight[:] = 1  # flat or too few points: fill the widest intervals.
+
+    left, right = weight[:-1], weight[1:]
+    score = (
+        array([max(a, b) for a, b in zip(left, right)]) * abs(x[1:] - x[:-1])
+    )
+
+    selected = []
+    for i in argsort(score)[::-1]:
+        if len(selected) == batch or score[i] == 0:
+            break
+        low, high = sorted((x[i], x[i+1]))
+        inside = [
+            j for j in range(len(positions))
+            if low < positions[j] < high and j not in measured
+        ]
+        if inside:
+            middle = (low + high)/2
+            selected.append(
+                min(inside, key=lambda j: abs(positions[j] - middle))
+            )
+    return selected
+
+
+def adaptive_list_scan(
+    detectors,
+    *args,
+    coarse=4,
+    max_points=None,
+    max_time=None,
+    batch=5,
+    dichro=False,
+    take_reading=trigger_and_read,
+    md=None
+):
+    """
+    List scan that measures a coarse grid, then adds points where the
+    normalized signal (and the XMCD if `dichro`) bends the most.
+
+    The signal is computed as in the `DichroStream`, from the monitor and
+    detector set in `plot_dichro_settings.settings`.
+
+    Parameters
+    ----------
+    detectors : list
+        list of 'readable' objects
+    *args :
+        ``motor1, [point1, point2, ...], motor2, [point1, point2, ...]``,
+        the first motor is used to rank the points. All the points are
+        candidates, but only a subset is measured.
+    coarse : int, optional
+        Every `coarse`-th point (and the last one) is measured first.
+    max_points : int, optional
+        Maximum number of measured points. Defaults to half of the points.
+    max_time : float, optional
+        No points are added after `max_time` seconds.
+    batch : int, optional
+        Number of points added after each curvature evaluation.
+    dichro : boolean, optional
+        If True the XMCD is also used, with the helicity signs in
+        `plot_dichro_settings.settings`.
+    take_reading : plan, optional
+        Acquisition of each reading, see `one_local_step`.
+    md : dict, optional
+        metadata
+    """
+    motors = [motor for motor, _ in partition(2, args)]
+    values = [array(points) for _, points in partition(2, args)]
+    positions = values[0]
+    npts = len(positions)
+    if npts == 0:
+        raise ValueError("The adaptive scan needs at least one position.")
+    if max_points is None:
+        max_points = max(npts//2, 1)
+
+    _md = {
+        'detectors': [det.name for det in detectors],
+        'motors': [motor.name for motor in motors],
+        'num_points': min(max_points, npts),
+        'plan_name': 'adaptive_list_scan',
+        'hints': {},
+    }
+    _md.update(md or {})
+    _md['hints'].setdefault('dimensions', [([motors[0].name], 'primary')])
+
+    settings = plot_dichro_settings.settings
+    measured = {}
+    readings = []
+
+    def _take_reading(devices, name='primary'):
+        ret = yield from take_reading(devices, name=name)
+        readings.append(ret)
+        return ret
+
+    def _signal():
+        try:
+            xas, xmcd = xas_xmcd(
+                [ret[settings.monitor]['value'] for ret in readings],
+                [ret[settings.detector]['value'] for ret in readings],
+                transmission=settings.transmission,
+                signs=settings.signs if dichro else None,
+            )
+        except KeyError:
+            return (0.0,)
+        return (xas,) if xmcd is None else (xas, xmcd)
+
+    @stage_decorator(list(detectors) + motors)
+    @run_decorator(md=_md)
+    def _inner():
+        t0 = ttime()
+        pos_cache = defaultdict(lambda: None)
+        order = list(range(0, npts, max(int(coarse), 1)))
+        if order[-1] != npts - 1:
+            order.append(npts - 1)
+        order = order[:max_points]
+
+        while order:
+            for index in order:
+                readings.clear()
+                step = {
+                    motor: points[index]
+                    for motor, points in zip(motors, values)
+                }
+                yield from one_local_step(
+                    detectors, step, pos_cache, take_reading=_take_reading
+                )
+                measured[index] = _signal()
+
+            remaining = max_points - len(measured)
+            if remaining <= 0:
+                break
+            if max_time is not None and ttime() - t0 > max_time:
+                logger.info("Adaptive scan time budget reached.")
+                break
+            order = _adaptive_next_points(
+                positions, measured, min(batch, remaining)
+            )
+            # Keep the scan direction of the positions list.
+            order.sort()
+
+        logger.info(
+            "Adaptive scan measured %d of %d points.", len(measured), npts
+        )
+
+    return (yield from _inner())
+
+
+def _statistics_step(per_step, precision, min_dwell, max_dwell, dichro):
+    """`one_local_step` counting each point to the `precision` target."""
+    if per_step not in (None, one_local_step):
+        logger.warning("per_step is replaced by the precision counting.")
+    return partial(
+        one_local_step,
+        take_reading=statistics_reading(
+            precision, min_dwell, max_dwell, dichro=dichro
+        )
+    )
+
+
 def one_local_shot(detectors, take_reading=trigger_and_read):
     """
     Inner loop for fixQ and dichro scans.
@@ -185,6 +731,10 @@ def _setup_paths(detectors):
     )
     _master_fullpath += "_master.hdf"
 
+    if is_dry_run():
+        # Duration estimate: the detectors file paths are not set.
+        return _master_fullpath, {}, {}
+
     # Setup area detectors
     _dets_file_paths = {}
     # Relative paths are used in the master file so that data can be copied.
@@ -215,11 +765,14 @@ def _setup_paths(detectors):
 
 
 def setup_nxwritter(_base_path, _master_fullpath, _rel_dets_paths):
+    if is_dry_run():
+        return
     nxwriter.external_files = _rel_dets_paths
     nxwriter.file_name = str(_master_fullpath)
     nxwriter.file_path = str(_base_path)
 
 
+@duration_metadata
 def count(
         num=1,
         time=None,
@@ -228,6 +781,9 @@ def count(
         dichro=False,
         delay=None,
         per_shot=None,
+        precision=None,
+        min_dwell=None,
+        max_dwell=None,
         md=None
 ):
     """
@@ -259,6 +815,11 @@ def count(
         Hook for customizing action of inner loop (messages per step).
         See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
         for details.
+    precision : float, optional
+        If set, each point is counted until the detector/monitor relative
+        error is below this value (see `statistics_reading`).
+    min_dwell, max_dwell : float, optional
+        Dwell limits (seconds) of each point when `precision` is set.
     md : dict, optional
         metadata
     Notes
@@ -279,6 +840,13 @@ def count(
 
     flag.fixq = fixq
     per_shot = one_local_shot if fixq or dichro else None
+    if precision is not None:
+        per_shot = partial(
+            one_local_shot,
+            take_reading=statistics_reading(
+                precision, min_dwell, max_dwell, dichro=dichro
+            )
+        )
 
     extras = yield from _collect_extras(False, False)
 
@@ -312,8 +880,8 @@ def count(
     _md.update(md or {})
 
     @subs_decorator(nxwriter.receiver)
-    @stage_dichro_decorator(dichro, lockin, None)
     @configure_counts_decorator(detectors, time)
+    @stage_dichro_decorator(dichro, lockin, None)
     @extra_devices_decorator(extras)
     def _inner_count():
         yield from bp_count(
@@ -329,6 +897,7 @@ def count(
     return (yield from _inner_count())
 
 
+@duration_metadata
 def ascan(
     *args,
     time=None,
@@ -337,6 +906,11 @@ def ascan(
     dichro=False,
     fixq=False,
     per_step=None,
+    pipeline=False,
+    precision=None,
+    min_dwell=None,
+    max_dwell=None,
+    relative=False,
     md=None
 ):
     """
@@ -379,6 +953,18 @@ def ascan(
         hook for customizing action of inner loop (messages per step).
         See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
         for details.
+    pipeline : boolean, optional
+        If True, the motors move to the next point while the `pipeline_safe`
+        detectors are read (see `PipelinedStep`). Not used in dichro, fixq
+        or custom `per_step` scans.
+    precision : float, optional
+        If set, each point is counted until the detector/monitor relative
+        error is below this value (see `statistics_reading`).
+    min_dwell, max_dwell : float, optional
+        Dwell limits (seconds) of each point when `precision` is set.
+    relative : boolean, optional
+        True if the positions are relative to the current ones. Only tells
+        the fixq solver, the moves are made relative by the caller (`lup`).
     md : dictionary, optional
         Metadata to be added to the run start.
 
@@ -398,19 +984,26 @@ def ascan(
     flag.fixq = fixq
     if per_step is None:
         per_step = one_local_step if fixq or dichro else None
-    if fixq:
-        huber = current_diffractometer()
-        flag.hkl_pos = {
-            huber.h: huber.h.get().setpoint,
-            huber.k: huber.k.get().setpoint,
-            huber.l: huber.l.get().setpoint,
-        }
-
+    if precision is not None:
+        per_step = _statistics_step(
+            per_step, precision, min_dwell, max_dwell, dichro
+        )
     # This allows passing "time" without using the keyword.
     if len(args) % 3 == 2 and time is None:
         time = args[-1]
         args = args[:-1]
 
+    if fixq:
+        _setup_fixq(_scan_steps(args), relative=relative)
+
+    if pipeline:
+        if per_step is None:
+            per_step = PipelinedStep(_scan_steps(args))
+        else:
+            logger.warning(
+                "pipeline=True is not used with dichro, fixq or per_step."
+            )
+
     if detectors is None:
         detectors = counters.detectors
 
@@ -460,6 +1053,7 @@ def ascan(
     return (yield from _inner_ascan())
 
 
+@duration_metadata
 def lup(
     *args,
     time=None,
@@ -468,6 +1062,10 @@ def lup(
     dichro=False,
     fixq=False,
     per_step=None,
+    pipeline=False,
+    precision=None,
+    min_dwell=None,
+    max_dwell=None,
     md=None
 ):
     """
@@ -510,6 +1108,15 @@ def lup(
         hook for customizing action of inner loop (messages per step).
         See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
         for details.
+    pipeline : boolean, optional
+        If True, the motors move to the next point while the `pipeline_safe`
+        detectors are read (see `PipelinedStep`). Not used in dichro, fixq
+        or custom `per_step` scans.
+    precision : float, optional
+        If set, each point is counted until the detector/monitor relative
+        error is below this value (see `statistics_reading`).
+    min_dwell, max_dwell : float, optional
+        Dwell limits (seconds) of each point when `precision` is set.
     md : dictionary, optional
         Metadata to be added to the run start.
 
@@ -535,12 +1142,18 @@ def lup(
             dichro=dichro,
             fixq=fixq,
             per_step=per_step,
+            pipeline=pipeline,
+            precision=precision,
+            min_dwell=min_dwell,
+            max_dwell=max_dwell,
+            relative=True,
             md=_md
         ))
 
     return (yield from inner_lup())
 
 
+@duration_metadata
 def grid_scan(
     *args,
     time=None,
@@ -550,6 +1163,9 @@ def grid_scan(
     dichro=False,
     fixq=False,
     per_step=None,
+    pipeline=False,
+    min_travel=False,
+    relative=False,
     md=None
 ):
     """
@@ -594,6 +1210,19 @@ def grid_scan(
         hook for customizing action of inner loop (messages per step).
         See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
         for details.
+    pipeline : boolean, optional
+        If True, the motors move to the next point while the `pipeline_safe`
+        detectors are read (see `PipelinedStep`). Not used in dichro, fixq
+        or custom `per_step` scans.
+    min_travel : boolean, optional
+        If True, the mesh points are measured in the order that minimizes
+        the estimated move time (see `order_points`), using a list scan.
+        The original index of each measured point is kept in the
+        "point_order" metadata.
+    relative : boolean, optional
+        True if the positions are relative to the current ones. Only tells
+        the point ordering and the fixq solver, the moves are made relative
+        by the caller (`rel_grid_scan`).
     md: dict, optional
         metadata
 
@@ -616,19 +1245,28 @@ def grid_scan(
     if per_step is None:
         per_step = one_local_step if fixq or dichro else None
 
-    if fixq:
-        huber = current_diffractometer()
-        flag.hkl_pos = {
-            huber.h: huber.h.get().setpoint,
-            huber.k: huber.k.get().setpoint,
-            huber.l: huber.l.get().setpoint,
-        }
-
     # This allows passing "time" without using the keyword.
     if len(args) % 4 == 1 and time is None:
         time = args[-1]
         args = args[:-1]
 
+    steps, _order_md = None, {}
+    if min_travel:
+        steps, _order_md = _min_travel_steps(
+            _grid_steps(args, snake_axes), relative=relative
+        )
+
+    if fixq:
+        _setup_fixq(steps or _grid_steps(args, snake_axes), relative)
+
+    if pipeline:
+        if per_step is None:
+            per_step = PipelinedStep(steps or _grid_steps(args, snake_axes))
+        else:
+            logger.warning(
+                "pipeline=True is not used with dichro, fixq or per_step."
+            )
+
     if detectors is None:
         detectors = counters.detectors
 
@@ -658,6 +1296,7 @@ def grid_scan(
         _md['hints']['detectors'].extend(item.hints['fields'])
 
     _md["hints"]["scan_type"] = "gridscan"
+    _md.update(_order_md)
 
     _md.update(md or {})
 
@@ -666,19 +1305,28 @@ def grid_scan(
     @stage_dichro_decorator(dichro, lockin, args)
     @extra_devices_decorator(extras)
     def _inner_grid_scan():
-        yield from bp_grid_scan(
-            detectors + extras,
-            *args,
-            snake_axes=snake_axes,
-            per_step=per_step,
-            md=_md
-        )
+        if steps:
+            yield from bp_list_scan(
+                detectors + extras,
+                *_list_args(steps),
+                per_step=per_step,
+                md=_md
+            )
+        else:
+            yield from bp_grid_scan(
+                detectors + extras,
+                *args,
+                snake_axes=snake_axes,
+                per_step=per_step,
+                md=_md
+            )
 
         yield from nxwriter.wait_writer_plan_stub()
 
     return (yield from _inner_grid_scan())
 
 
+@duration_metadata
 def rel_grid_scan(
     *args,
     time=None,
@@ -688,6 +1336,8 @@ def rel_grid_scan(
     dichro=False,
     fixq=False,
     per_step=None,
+    pipeline=False,
+    min_travel=False,
     md=None
 ):
     """
@@ -735,6 +1385,15 @@ def rel_grid_scan(
         hook for customizing action of inner loop (messages per step).
         See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
         for details.
+    pipeline : boolean, optional
+        If True, the motors move to the next point while the `pipeline_safe`
+        detectors are read (see `PipelinedStep`). Not used in dichro, fixq
+        or custom `per_step` scans.
+    min_travel : boolean, optional
+        If True, the mesh points are measured in the order that minimizes
+        the estimated move time (see `order_points`), using a list scan.
+        The original index of each measured point is kept in the
+        "point_order" metadata.
     md: dict, optional
         metadata
 
@@ -763,12 +1422,182 @@ def rel_grid_scan(
             dichro=dichro,
             fixq=fixq,
             per_step=per_step,
+            pipeline=pipeline,
+            min_travel=min_travel,
+            relative=True,
             md=_md
         ))
 
     return (yield from inner_rel_grid_scan())
 
 
+@duration_metadata
+def list_scan(
+    *args,
+    time=None,
+    detectors=None,
+    lockin=False,
+    dichro=False,
+    fixq=False,
+    per_step=None,
+    pipeline=False,
+    min_travel=False,
+    md=None
+):
+    """
+    Scan over a list of points, all motors move together.
+
+    This is a local version of `bluesky.plans.list_scan` and replaces it in
+    the session namespace. Note that its signature is different: the
+    detectors are the `detectors` keyword argument (default
+    `counters.detectors`), not the first positional argument.
+
+    Parameters
+    ----------
+    ``*args``
+        patterned like (``motor1, [point1, point2, ....],``
+                        ``motor2, [point1, point2, ....],``
+                        ...
+                        ``motorN, [point1, point2, ....]``)
+        All lists must have the same length.
+    time : float, optional
+        If a number is passed, it will modify the counts over time. All
+        detectors need to have a .preset_monitor signal.
+    detectors : list, optional
+        List of detectors to be used in the scan. If None, will use the
+        detectors defined in `counters.detectors`.
+    lockin : boolean, optional
+        Flag to do a lock-in scan. Please run pr_setup.config() prior do a
+        lock-in scan.
+    dichro : boolean, optional
+        Flag to do a dichro scan. Please run pr_setup.config() prior do a
+        dichro scan. Note that this will switch the x-ray polarization at every
+        point using the +, -, -, + sequence, thus increasing the number of
+        points by a factor of 4
+    fixq : boolean, optional
+        Flag for fixQ scans. If True, it will fix the diffractometer hkl
+        position during the scan. This is particularly useful for energy scan.
+        Note that hkl is moved ~after~ the other motors!
+    per_step: callable, optional
+        hook for customizing action of inner loop (messages per step).
+        See docstring of :func:`bluesky.plan_stubs.one_nd_step` (the default)
+        for details.
+    pipeline : boolean, optional
+        If True, the motors move to the next point while the `pipeline_safe`
+        detectors are read (see `PipelinedStep`). Not used in dichro, fixq
+        or custom `per_step` scans.
+    min_travel : boolean, optional
+        If True, the points are measured in the order that minimizes the
+        estimated move time (see `order_points`). The original index of each
+        measured point is kept in the "point_order" metadata.
+    md: dict, optional
+        metadata
+
+    See Also
+    --------
+    :func:`bluesky.plans.list_scan`
+    :func:`grid_scan`
+    """
+
+    flag.dichro = dichro
+    if dichro:
+        _offset = pr_setup.offset.get()
+        _center = pr_setup.positioner.parent.center.get()
+        _steps = pr_setup.dichro_steps
+        flag.dichro_steps = [_center + step*_offset for step in _steps]
+
+    flag.fixq = fixq
+    if per_step is None:
+        per_step = one_local_step if fixq or dichro else None
+
+    # This allows passing "time" without using the keyword.
+    if len(args) % 2 == 1 and time is None:
+        time = args[-1]
+        args = args[:-1]
+
+    steps = _list_steps(args)
+    diffractometer = None
+    if FIXQ_PRECOMPUTE:
+        steps, diffractometer = _hkl_reals_steps(steps)
+        if diffractometer is not None:
+            args = _list_args(steps)
+
+    _order_md = {}
+    if min_travel:
+        steps, _order_md = _min_travel_steps(steps)
+        args = _list_args(steps)
+
+    if fixq:
+        _setup_fixq(steps)
+
+    if pipeline:
+        if per_step is None:
+            per_step = PipelinedStep(steps)
+        else:
+            logger.warning(
+                "pipeline=True is not used with dichro, fixq or per_step."
+            )
+
+    if detectors is None:
+        detectors = counters.detectors
+
+    _master_fullpath, _dets_file_paths, _rel_dets_paths = (
+        _setup_paths(detectors)
+    )
+
+    setup_nxwritter(
+        experiment.experiment_path, _master_fullpath, _rel_dets_paths
+    )
+
+    # Identity test, "in" would compare energy with the position arrays.
+    motors = args[0::2]
+    extras = yield from _collect_extras(
+        any(motor is energy for motor in motors),
+        "huber" in str(motors),
+    )
+
+    _md = dict(
+        hints={'monitor': counters.monitor, 'detectors': []},
+        data_management=experiment.data_management or "None",
+        esaf=experiment.esaf,
+        proposal=experiment.proposal,
+        base_experiment_path=str(experiment.base_experiment_path),
+        experiment_path=str(experiment.experiment_path),
+        master_file_path=str(_master_fullpath),
+        detectors_file_full_path=_dets_file_paths,
+        detectors_file_relative_path=_rel_dets_paths,
+    )
+
+    for item in detectors:
+        _md['hints']['detectors'].extend(item.hints['fields'])
+
+    _md["hints"]["scan_type"] = "listscan"
+    _md.update(_order_md)
+
+    if diffractometer is not None:
+        # The hkl axes were replaced by the real motors, read them here.
+        extras.append(diffractometer)
+
+    _md.update(md or {})
+
+    @subs_decorator(nxwriter.receiver)
+    @configure_counts_decorator(detectors, time)
+    @stage_dichro_decorator(dichro, lockin, args)
+    @extra_devices_decorator(extras)
+    def _inner_list_scan():
+        yield from bp_list_scan(
+            detectors + extras,
+            *args,
+            per_step=per_step,
+            md=_md
+        )
+
+        yield from nxwriter.wait_writer_plan_stub()
+
+    return (yield from _inner_list_scan())
+
+
+@duration_metadata
 def qxscan(
     edge_energy,
     time=None,
@@ -776,6 +1605,13 @@ def qxscan(
     lockin=False,
     dichro=False,
     fixq=False,
+    adaptive=False,
+    max_points=None,
+    max_time=None,
+    coarse=4,
+    precision=None,
+    min_dwell=None,
+    max_dwell=None,
     md=None
 ):
     """
@@ -807,6 +1643,22 @@ def qxscan(
         Flag for fixQ scans. If True, it will fix the diffractometer hkl
         position during the scan. Note that hkl is moved ~after~ the other
         motors!
+    adaptive : boolean, optional
+        If True, measures every `coarse`-th energy first, then adds energies
+        of the qxscan_params list where the XANES (and XMCD) curvature is
+        large, until `max_points` or `max_time` is reached. See
+        `adaptive_list_scan`.
+    max_points : int, optional
+        Adaptive scan point budget. Defaults to half of the energies.
+    max_time : float, optional
+        Adaptive scan time budget in seconds.
+    coarse : int, optional
+        Spacing (in points) of the initial adaptive grid.
+    precision : float, optional
+        If set, each point is counted until the detector/monitor relative
+        error is below this value (see `statistics_reading`).
+    min_dwell, max_dwell : float, optional
+        Dwell limits (seconds) of each point when `precision` is set.
     md : dictionary, optional
         Metadata to be added to the run start.
 
@@ -828,18 +1680,19 @@ def qxscan(
 
     flag.fixq = fixq
     per_step = one_local_step if fixq or dichro else None
-    if fixq:
-        huber = current_diffractometer()
-        flag.hkl_pos = {
-            huber.h: huber.h.get().setpoint,
-            huber.k: huber.k.get().setpoint,
-            huber.l: huber.l.get().setpoint,
-        }
-
+    _take_reading = trigger_and_read
+    if precision is not None:
+        _take_reading = statistics_reading(
+            precision, min_dwell, max_dwell, dichro=dichro
+        )
+        per_step = partial(one_local_step, take_reading=_take_reading)
     # Get energy argument and extras
     energy_list = yield from rd(qxscan_params.energy_list)
     args = (energy, array(energy_list) + edge_energy)
 
+    if fixq:
+        _setup_fixq([{energy: value} for value in args[1]])
+
     extras = yield from _collect_extras(energy in args, "huber" in str(args))
 
     # Setup count time
@@ -889,6 +1742,9 @@ def qxscan(
         _md['hints']['scan_type'] += " dichro"
     if lockin:
         _md['hints']['scan_type'] += " lockin"
+    if adaptive:
+        _md['hints']['scan_type'] += " adaptive"
+        _md['plan_name'] = 'qxscan'
 
     _md.update(md or {})
 
@@ -896,10 +1752,24 @@ def qxscan(
     @configure_counts_decorator(detectors, time)
     @stage_dichro_decorator(dichro, lockin, args)
     @extra_devices_decorator(extras)
+    @transfocator_table_decorator(args[1])
+    @energy_tracking_decorator(args[1])
     def _inner_qxscan():
-        yield from list_scan(
-            detectors + extras, *args, per_step=per_step, md=_md
+        if adaptive:
+            yield from adaptive_list_scan(
+                detectors + extras,
+                *args,
+                coarse=coarse,
+                take_reading=_take_reading,
+                max_points=max_points,
+                max_time=max_time,
+                dichro=dichro,
+                md=_md
             )
+        else:
+            yield from bp_list_scan(
+                detectors + extras, *args, per_step=per_step, md=_md
+                )
 
         # put original times back.
         for det, preset in _ct.items():
@@ -0,0 +1,195 @@
+"""
+Count each point until a target precision is reached.
+
+The default scaler is read repeatedly (with its current preset) and its
+counts are accumulated until the relative error of the detector/monitor
+ratio is below the requested precision. In dichro scans the precision is
+relative to the XMCD of the previous point. The event has the totals of
+the reads in the scaler fields (counts and elapsed time), and the
+`counting_stats` device.
+"""
+
+__all__ = ["counting_stats", "statistics_reading"]
+
+from collections import defaultdict
+from numbers import Number
+from numpy import inf, sqrt
+from ophyd import Component, Device, Signal
+from bluesky.plan_stubs import create, rd, read, save, trigger, wait
+from bluesky.utils import root_ancestor, separate_devices, short_uid
+from ..callbacks.dichro_stream import plot_dichro_settings, xas_xmcd
+from ..devices import counters
+from ..utils._logging_setup import logger
+
+# Number of reads without a time limit, if `max_dwell` is not given.
+DEFAULT_MAX_READS = 10
+
+
+class CountingStatsDevice(Device):
+    """Accumulated counts and dwell of the last point."""
+
+    monitor = Component(Signal, value=0.0)
+    detector = Component(Signal, value=0.0)
+    dwell = Component(Signal, value=0.0)
+    reads = Component(Signal, value=0)
+    relative_error = Component(Signal, value=0.0)
+
+
+counting_stats = CountingStatsDevice("", name="counting")
+
+
+def _detector_key(scaler, monitor):
+    """First plotted scaler channel that is not the monitor."""
+    for field in scaler.hints.get("fields", []):
+        if field != monitor:
+            return field
+    raise ValueError(
+        f"No plotted detector channel in {scaler.name}, use counters()."
+    )
+
+
+def _total_signals(scaler, cache):
+    """Signals named like the fields of `scaler`, to emit the totals."""
+    if cache.get("scaler") is not scaler:
+        # Same objects at every point, or each event gets a descriptor.
+        cache.clear()
+        cache["scaler"] = scaler
+        cache["signals"] = {
+            walk.item.name: Signal(name=walk.item.name, kind=walk.item.kind)
+            for walk in scaler.walk_signals()
+        }
+    return cache["signals"]
+
+
+def statistics_reading(
+    precision, min_dwell=None, max_dwell=None, dichro=False, detector=None
+):
+    """
+    Reading function that counts until a relative error is reached.
+
+    It can be used as the `take_reading` of `one_local_step` and
+    `one_local_shot`. All devices are triggered once, then only the
+    default scaler is counted again (with its current preset) until the
+    Poisson relative error of detector/monitor is <= `precision`, and the
+    dwell is within [`min_dwell`, `max_dwell`]. In the event, the scaler
+    fields (channels and elapsed time) are the totals of all the reads, the
+    other devices are read once, and `counting_stats` has the dwell, number
+    of reads and relative error.
+
+    Parameters
+    ----------
+    precision : float
+        Target relative error (e.g. 0.001).
+    min_dwell : float, optional
+        Minimum dwell per point (seconds).
+    max_dwell : float, optional
+        Maximum dwell per point (seconds). Defaults to 10 reads.
+    dichro : boolean, optional
+        If True, the error of each helicity reading is compared to
+        `precision` times the XMCD of the previous point, using the monitor
+        and detector of the `DichroStream` settings.
+    detector : str, optional
+        Scaler channel used as the detector. Defaults to the first plotted
+        scaler channel.
+    """
+    if precision is None or precision <= 0:
+        raise ValueError("precision must be a positive number.")
+
+    settings = plot_dichro_settings.settings
+    point = dict(readings=[], xmcd=None)
+    signals_cache = {}
+
+    def _relative_error(mon, det):
+        if mon <= 0 or det <= 0:
+            return inf
+        return sqrt(1/mon + 1/det)
+
+    def _target(mon, det):
+        """Largest relative error accepted for this reading."""
+        if not dichro or not point["xmcd"]:
+            return precision
+        # sigma(xmcd) ~ sigma(xas) of each reading.
+        scale = 1 if settings.transmission else det/mon
+        return precision*abs(point["xmcd"])/scale
+
+    def _update_xmcd(mon, det):
+        point["readings"].append((mon, det))
+        if len(point["readings"]) == len(settings.signs):
+            mons, dets = zip(*point["readings"])
+            _, point["xmcd"] = xas_xmcd(
+                mons, dets, settings.transmission, settings.signs
+            )
+            point["readings"] = []
+
+    def take_reading(devices, name="primary"):
+        scaler = counters.default_scaler
+        mon_key = settings.monitor if dichro else scaler.monitor
+        det_key = (
+            settings.detector if dichro else
+            detector or _detector_key(scaler, mon_key)
+        )
+
+        devices = separate_devices(root_ancestor(dev) for dev in devices)
+        to_trigger = [dev for dev in devices if hasattr(dev, "trigger")]
+        totals = defaultdict(float)
+        dwell, reads, error = 0.0, 0, inf
+        _max_dwell = max_dwell
+
+        while True:
+            group = short_uid("trigger")
+            for dev in to_trigger:
+                yield from trigger(dev, group=group)
+            yield from wait(group=group)
+            to_trigger = [scaler]
+
+            reading = yield from read(scaler)
+            for key, item in reading.items():
+                if isinstance(item["value"], Number):
+                    totals[key] += item["value"]
+                else:
+                    totals[key] = item["value"]
+            dwell += (yield from rd(scaler.time))
+            reads += 1
+
+            if _max_dwell is None:
+                _max_dwell = dwell*DEFAULT_MAX_READS
+            mon, det = totals[mon_key], totals[det_key]
+            error = _relative_error(mon, det)
+            if min_dwell is not None and dwell < min_dwell:
+                continue
+            if error <= _target(mon, det) or dwell >= _max_dwell:
+                break
+
+        if error > _target(mon, det):
+            logger.debug(
+                "Precision not reached in %.2f s, relative error %.2e.",
+                dwell, error
+            )
+        if dichro:
+            _update_xmcd(mon, det)
+
+        for signal, value in (
+            (counting_stats.monitor, mon),
+            (counting_stats.detector, det),
+            (counting_stats.dwell, dwell),
+            (counting_stats.reads, reads),
+            (counting_stats.relative_error, error),
+        ):
+            signal.put(value)
+
+        # The scaler channels are replaced by the totals of the reads.
+        signals = _total_signals(scaler, signals_cache)
+        for key, value in totals.items():
+            signals[key].put(value)
+        emitted = [dev for dev in devices if dev is not scaler]
+        if scaler in devices:
+            emitted += [signals[key] for key in totals]
+
+        yield from create(name)
+        ret = {}
+        for dev in emitted + [counting_stats]:
+            ret.update((yield from read(dev)))
+        yield from save()
+        return ret
+
+    return take_reading
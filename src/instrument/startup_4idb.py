@@ -47,25 +47,29 @@ else:
 
 from .callbacks import *  # noqa
 from .plans import *  # noqa
-from .utils.polartools_hklpy_imports import *  # noqa
-from .utils import *
-from .utils.dm_utils import (
-    dm_get_experiment_data_path,
-    dm_upload,
-    dm_upload_info,
-)
 
-# TODO: Loads plans for development, remove for production.
-from .utils.tests.common import *  # noqa
+if not running_in_queueserver():
+    # Interactive sessions only, the queueserver worker does not need the
+    # analysis/hkl stack, the magics or the test plans (see startup_qserver).
+    from .utils.polartools_hklpy_imports import *  # noqa
+    from .utils import *
+    from .utils.dm_utils import (
+        dm_get_experiment_data_path,
+        dm_upload,
+        dm_upload_info,
+    )
 
-from IPython import get_ipython
-from .utils.local_magics import LocalMagics
-get_ipython().register_magics(LocalMagics)
+    # TODO: Loads plans for development, remove for production.
+    from .utils.tests.common import *  # noqa
 
-cat = db_query(
-    full_cat,
-    dict(instrument_name=f'polar-{environ["POLAR_INSTRUMENT"]}')
-)
+    from IPython import get_ipython
+    from .utils.local_magics import LocalMagics
+    get_ipython().register_magics(LocalMagics)
+
+    cat = db_query(
+        full_cat,
+        dict(instrument_name=f'polar-{environ["POLAR_INSTRUMENT"]}')
+    )
 
 # TODO: this is useful while we are doing pre-commissioning tests
 # Remove everything from baseline.
@@ -43,14 +43,18 @@ else:
 
 from .callbacks import *  # noqa
 from .plans import *  # noqa
-from .utils.polartools_hklpy_imports import *  # noqa
-from .utils import *
 
-# TODO: Loads plans for development, remove for production.
-# from .utils.tests.common import *  # noqa
+if not running_in_queueserver():
+    # Interactive sessions only, the queueserver worker does not need the
+    # analysis/hkl stack or the magics (see startup_qserver).
+    from .utils.polartools_hklpy_imports import *  # noqa
+    from .utils import *
 
-from IPython import get_ipython
-from .utils.local_magics import LocalMagics
-get_ipython().register_magics(LocalMagics)
+    # TODO: Loads plans for development, remove for production.
+    # from .utils.tests.common import *  # noqa
 
-cat = db_query(full_cat, dict(instrument_name = f'polar-{environ["POLAR_INSTRUMENT"]}'))
+    from IPython import get_ipython
+    from .utils.local_magics import LocalMagics
+    get_ipython().register_magics(LocalMagics)
+
+    cat = db_query(full_cat, dict(instrument_name = f'polar-{environ["POLAR_INSTRUMENT"]}'))
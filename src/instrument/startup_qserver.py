@@ -0,0 +1,52 @@
+"""
+Start a Bluesky queueserver worker with a minimal import graph.
+
+Loads only the device registry, the RunEngine, the data file writers and the
+plans exposed to the queue. The hkl/polartools analysis stack, the IPython
+magics, the interactive callbacks helpers and the test plans are not
+imported, the plans import what they need when they run.
+
+Use as the queueserver startup module::
+
+    start-re-manager --startup-module instrument.startup_qserver
+
+The station is selected with the ``POLAR_INSTRUMENT`` environment variable.
+"""
+
+from os import environ
+if not environ.get("POLAR_INSTRUMENT"):
+    environ["POLAR_INSTRUMENT"] = "4idb"
+
+# logging setup first
+from .utils._logging_setup import logger
+
+logger.info(__file__)
+
+# Setup EPICS layer
+from .utils.ophyd_setup import set_control_layer, set_timeouts
+set_control_layer()
+set_timeouts()
+
+# Bluesky data acquisition setup
+from .utils.config import iconfig  # noqa
+from .utils.oregistry_setup import oregistry  # noqa
+from .utils.run_engine import RE, sd  # noqa
+
+# Device registry, the plans find their devices in the oregistry.
+from . import devices  # noqa
+
+# Data file writers.
+if iconfig.get("NEXUS_DATA_FILES") is not None:
+    from .callbacks.nexus_data_file_writer import nxwriter  # noqa
+
+if iconfig.get("SPEC_DATA_FILES") is not None:
+    from .callbacks.spec_data_file_writer import (  # noqa
+        newSpecFile,
+        spec_comment,
+        specwriter,
+    )
+
+# Plans exposed to the queue, the local plans override the bluesky ones.
+from apstools.plans import lineup2  # noqa
+from bluesky.plans import *  # noqa
+from .plans import *  # noqa
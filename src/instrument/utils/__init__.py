@@ -9,7 +9,9 @@ from .aps_dm_setup import *  # noqa
 from .debug_setup import *  # noqa
 from .mpl_setup import *  # noqa
 from .oregistry_setup import oregistry
-from .dynamic_import import device_import
+from .dynamic_import import device_import, device_timing_report
+from .baseline_cache import baseline_timing_report
+from .point_timing import point_timer, point_timing_report
 from .catalog import full_cat
 
 # from .dm_utils import (
@@ -25,6 +27,7 @@ from .experiment_utils import (
 )
 
 from .config import iconfig
+from .functions import running_in_queueserver
 
 from .suspenders import (
     run_engine_suspenders,
@@ -33,7 +36,10 @@ from .suspenders import (
     suspender_change_sleep
 )
 
-if iconfig.get("STATION") == "4idg":
+if running_in_queueserver():
+    # Queueserver plans import the hkl stack only when they need it.
+    pass
+elif iconfig.get("STATION") == "4idg":
     from .hkl_utils import *
     # from .transfocator_calculation import *
     from .flyscan_utils import read_flyscan_stream, find_eiger_triggers
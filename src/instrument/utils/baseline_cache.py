@@ -0,0 +1,276 @@
+"""
+Baseline served from CA monitors
+================================
+
+The stock ``SupplementalData`` reads every baseline device (hundreds of PVs)
+at the start and at the end of each run. `CachedSupplementalData` instead
+keeps a CA monitor on each baseline signal and serves the last received value
+(with its timestamp). A signal is read again from the IOC when it is
+disconnected, has no monitor update, or its cached value is older than
+``BASELINE.MAX_AGE`` seconds.
+
+Devices with their own ``trigger`` (detectors) are always read as usual.
+
+.. autosummary::
+    ~BaselineCache
+    ~CachedSupplementalData
+    ~baseline_timing_report
+"""
+
+from collections import OrderedDict
+from time import time as ttime
+
+from bluesky import SupplementalData
+from bluesky.preprocessors import (
+    baseline_wrapper, fly_during_wrapper, monitor_during_wrapper
+)
+from ophyd import Device, Signal
+from pyRestTable import Table
+
+from ._logging_setup import logger
+from .config import iconfig
+
+_baseline_config = iconfig.get("BASELINE") or {}  # all keys are optional
+BASELINE_MODE = _baseline_config.get("MODE", "read")
+MAX_AGE = _baseline_config.get("MAX_AGE", 600)
+
+# Time spent reading each baseline device, filled by `CachedBaselineReader`.
+BASELINE_TIMINGS = OrderedDict()
+
+
+def _signals(device):
+    """Leaf signals of a device (or the signal itself), keyed by name."""
+    if hasattr(device, "walk_signals"):
+        return {walk.item.name: walk.item for walk in device.walk_signals()}
+    return {device.name: device}
+
+
+class CachedBaselineReader:
+    """
+    Readable stand-in for a baseline device, served from a `BaselineCache`.
+
+    It has no ``trigger`` on purpose, the baseline of a positioner or of a
+    configuration device needs no acquisition.
+    """
+
+    def __init__(self, device, cache):
+        self.device = device
+        self.cache = cache
+
+    @property
+    def name(self):
+        return self.device.name
+
+    @property
+    def parent(self):
+        return None
+
+    @property
+    def hints(self):
+        return getattr(self.device, "hints", {})
+
+    def describe(self):
+        return self.device.describe()
+
+    def read_configuration(self):
+        return self.device.read_configuration()
+
+    def describe_configuration(self):
+        return self.device.describe_configuration()
+
+    def read(self):
+        t0 = ttime()
+        reading, cached = self.cache.read(self.device)
+        duration = ttime() - t0
+
+        info = BASELINE_TIMINGS.setdefault(
+            self.name, dict(reads=0, total=0.0, last=0.0, cached=0, keys=0)
+        )
+        info["reads"] += 1
+        info["total"] += duration
+        info["last"] = duration
+        info["cached"] = cached
+        info["keys"] = len(reading)
+        return reading
+
+
+class BaselineCache:
+    """
+    Last known value of the baseline signals, updated by CA monitors.
+
+    Parameters
+    ----------
+    max_age : float or None
+        Cached values received more than `max_age` seconds ago are read
+        again from the IOC. None means no limit while the monitor is
+        connected.
+    """
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._keys = {}  # device name -> {read key: signal or None}
+        self._values = {}  # read key -> (reading, received time)
+        self._types = {}  # read key -> type of the value read from the IOC
+        self._untrusted = set()  # keys whose monitor value is not usable
+        self._readers = {}
+
+    def reader(self, device):
+        """
+        Object used in the baseline stream for `device`.
+
+        Devices with their own ``trigger`` method are returned unchanged.
+        """
+        trigger = getattr(type(device), "trigger", None)
+        if trigger not in (None, Device.trigger, Signal.trigger):
+            return device
+        if device.name not in self._readers:
+            self._readers[device.name] = CachedBaselineReader(device, self)
+        return self._readers[device.name]
+
+    def readers(self, devices):
+        """List of `reader` for each device."""
+        return [self.reader(device) for device in devices]
+
+    def _on_value(self, value=None, timestamp=None, obj=None, **kwargs):
+        """Monitor callback, keeps the new value."""
+        key = obj.name
+        expected = self._types.get(key)
+        if expected is not None and not isinstance(value, expected):
+            # e.g. enum monitors giving the index where read gives the string
+            self._untrusted.add(key)
+            return
+        self._values[key] = (
+            {"value": value, "timestamp": timestamp or ttime()},
+            ttime()
+        )
+
+    def _store(self, reading):
+        """Keep a reading done on the IOC."""
+        now = ttime()
+        for key, value in reading.items():
+            self._values[key] = (value, now)
+            self._types.setdefault(key, type(value["value"]))
+
+    def _subscribe(self, device):
+        """First read of a device, starts the monitors of its read keys."""
+        reading = device.read()
+        signals = _signals(device)
+        self._keys[device.name] = {key: signals.get(key) for key in reading}
+        self._store(reading)
+        for key, signal in self._keys[device.name].items():
+            if signal is None:
+                self._untrusted.add(key)
+                continue
+            try:
+                signal.subscribe(
+                    self._on_value, event_type=signal.SUB_VALUE, run=False
+                )
+            except Exception as exinfo:
+                logger.debug("No monitor for '%s': %s", key, exinfo)
+                self._untrusted.add(key)
+        return reading
+
+    def _fresh(self, key, signal, now):
+        """True if the cached value of `key` can be used."""
+        if key in self._untrusted or key not in self._values:
+            return False
+        if signal is not None and not getattr(signal, "connected", True):
+            return False
+        if self.max_age is None:
+            return True
+        return now - self._values[key][1] <= self.max_age
+
+    def read(self, device):
+        """
+        Baseline reading of `device`.
+
+        Returns
+        -------
+        reading : OrderedDict
+            Same content as ``device.read()``.
+        cached : int
+            Number of keys served from the cache.
+        """
+        if device.name not in self._keys:
+            return self._subscribe(device), 0
+
+        now = ttime()
+        keys = self._keys[device.name]
+        stale = [
+            key for key, sig in keys.items() if not self._fresh(key, sig, now)
+        ]
+        if any(keys[key] is None for key in stale):
+            # Cannot read that key alone, read the whole device.
+            reading = device.read()
+            self._store(reading)
+            return reading, 0
+
+        for key in stale:
+            self._store(keys[key].read())
+
+        reading = OrderedDict(
+            (key, dict(self._values[key][0])) for key in keys
+        )
+        return reading, len(keys) - len(stale)
+
+    def clear(self):
+        """Forget the cached values, the next baseline reads from the IOCs."""
+        self._values.clear()
+
+
+class CachedSupplementalData(SupplementalData):
+    """
+    ``SupplementalData`` with the baseline read from a `BaselineCache`.
+
+    Parameters
+    ----------
+    use_cache : bool
+        If False, behaves as the bluesky ``SupplementalData``.
+    max_age : float or None
+        See `BaselineCache`.
+    """
+
+    def __init__(self, *args, use_cache=True, max_age=MAX_AGE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.use_cache = use_cache
+        self.cache = BaselineCache(max_age=max_age)
+
+    def __call__(self, plan):
+        if not self.use_cache:
+            return (yield from super().__call__(plan))
+
+        plan = baseline_wrapper(plan, self.cache.readers(self.baseline))
+        plan = monitor_during_wrapper(plan, self.monitors)
+        plan = fly_during_wrapper(plan, self.flyers)
+        return (yield from plan)
+
+
+def baseline_timing_report(sort_by="last"):
+    """
+    Prints a table with the time spent reading each baseline device.
+
+    Parameters
+    ----------
+    sort_by : str
+        Column used to sort the table (slowest first). Options are "last",
+        "total" or "reads".
+    """
+    table = Table()
+    table.labels = (
+        "Device", "Reads", "Cached keys", "Last (s)", "Mean (s)", "Total (s)"
+    )
+    rows = sorted(
+        BASELINE_TIMINGS.items(), key=lambda item: item[1][sort_by],
+        reverse=True
+    )
+    for name, info in rows:
+        table.addRow((
+            name,
+            info["reads"],
+            f"{info['cached']}/{info['keys']}",
+            f"{info['last']:.4f}",
+            f"{info['total'] / max(info['reads'], 1):.4f}",
+            f"{info['total']:.3f}",
+        ))
+
+    print(table.reST(fmt="simple"))
@@ -5,6 +5,17 @@ Read YAML configuration files, such as 'iconfig.yml'.
 .. autosummary::
     ~load_config_yaml
     ~IConfigFileVersionError
+    ~validate_device_entries
+    ~compile_station_config
+    ~load_station_config
+
+The merged configuration (master + station iconfig) and the resolved table of
+the station devices are compiled into a pickle file that is reused while the
+YAML files do not change (same modification time and size, or same content
+hash). The device YAML entries are checked when compiling, and bad entries
+are reported (and skipped) before any device is imported. The compiled file
+defaults to ``~/.cache/polar_instrument_<station>.pickle`` and can be moved
+with the ``POLAR_COMPILED_CONFIG`` environment variable.
 
 Examples from the ``iconfig.yml`` configuration file:
 
@@ -29,13 +40,16 @@ Examples from the ``iconfig.yml`` configuration file:
 
 __all__ = [
     "iconfig",
+    "device_table",
 ]
 
+import hashlib
 import logging
 import pathlib
+import pickle
 
 import yaml
-from os import environ
+from os import environ, replace
 
 logger = logging.getLogger(__name__)
 logger.info(__file__)
@@ -47,6 +61,24 @@ DEFAULT_ICONFIG_YML_FILE = (
 MASTER_ICONFIG_YML_FILE = instrument_path / "configs" / "iconfig_master.yml"
 ICONFIG_MINIMUM_VERSION = "2.0.0"
 
+# The C loader is much faster, use it if libyaml is available.
+YAML_LOADER = getattr(yaml, "CLoader", yaml.Loader)
+
+# Device YAML files loaded by each station.
+STATION_DEVICE_FILES = {
+    "4idb": ["4ida_devices.yml", "4idb_devices.yml"],
+    "4idg": ["4ida_devices.yml", "4idb_devices.yml", "4idg_devices.yml"],
+    "raman": ["4idraman_devices.yml"],
+}
+
+COMPILED_CONFIG_VERSION = 1
+COMPILED_CONFIG_FILE = pathlib.Path(
+    environ.get(
+        "POLAR_COMPILED_CONFIG",
+        pathlib.Path.home() / ".cache" / f"polar_instrument_{_STATION}.pickle"
+    )
+)
+
 
 def load_config_yaml(iconfig_yml=None):
     """
@@ -66,7 +98,7 @@ def load_config_yaml(iconfig_yml=None):
         path = pathlib.Path(iconfig_yml)
     if not path.exists():
         raise FileExistsError(f"Configuration file '{path}' does not exist.")
-    iconfig = yaml.load(open(path, "r").read(), yaml.Loader)
+    iconfig = yaml.load(open(path, "r").read(), YAML_LOADER)
     return iconfig
 
 
@@ -74,9 +106,239 @@ class IConfigFileVersionError(ValueError):
     """Configuration file version too old."""
 
 
-# Loads the master configuration, then update it with the current station.
-iconfig = load_config_yaml(MASTER_ICONFIG_YML_FILE)
-iconfig.update(load_config_yaml(DEFAULT_ICONFIG_YML_FILE))
+def _file_signature(path):
+    """Modification time, size and content hash of a file."""
+    stat = path.stat()
+    return dict(
+        mtime=stat.st_mtime_ns,
+        size=stat.st_size,
+        sha256=hashlib.sha256(path.read_bytes()).hexdigest(),
+    )
+
+
+def _source_unchanged(path, signature):
+    """True if the file still matches its compiled signature."""
+    path = pathlib.Path(path)
+    if not path.exists():
+        return False
+    stat = path.stat()
+    if (
+        stat.st_mtime_ns == signature["mtime"] and
+        stat.st_size == signature["size"]
+    ):
+        return True
+    # Touched but maybe not modified (e.g. git checkout), compare the content.
+    return _file_signature(path)["sha256"] == signature["sha256"]
+
+
+def validate_device_entries(devs, source):
+    """
+    Check the entries of a devices YAML file.
+
+    Each entry is keyed by the module name (in ``instrument.devices``) and
+    needs a ``device`` (name or list of names) and a ``baseline`` (bool or
+    list of bools, a single bool applies to all the devices). The optional
+    ``timeout`` (number or list) and ``lazy`` (bool) must match them.
+
+    Parameters
+    ----------
+    devs : dict
+        Content of the YAML file.
+    source : str
+        Name of the YAML file, used in the messages.
+
+    Returns
+    -------
+    errors : dict
+        Error message of each bad entry, keyed by module name.
+    """
+    errors = {}
+    if not isinstance(devs, dict):
+        return {"*": f"{source}: the file content is not a mapping."}
+
+    for module, items in devs.items():
+        problems = []
+        module_path = (
+            instrument_path / "devices" / str(module).replace(".", "/")
+        )
+        if not (
+            module_path.with_suffix(".py").exists() or
+            (module_path / "__init__.py").exists()
+        ):
+            problems.append(f"module 'instrument.devices.{module}' not found")
+
+        if not isinstance(items, dict):
+            errors[module] = f"{source}: '{module}' is not a mapping."
+            continue
+
+        device = items.get("device")
+        if isinstance(device, str):
+            n = 1
+        elif (
+            isinstance(device, list) and
+            all(isinstance(d, str) for d in device)
+        ):
+            n = len(device)
+        else:
+            problems.append("'device' must be a name or a list of names")
+            n = None
+
+        baseline = items.get("baseline")
+        if isinstance(baseline, bool):
+            baseline = [baseline] * (n or 1)
+        if not (
+            isinstance(baseline, list) and
+            all(isinstance(b, bool) for b in baseline)
+        ):
+            problems.append("'baseline' must be a bool or a list of bools")
+        elif n is not None and len(baseline) != n:
+            problems.append(f"{len(baseline)} baselines for {n} devices")
+
+        timeout = items.get("timeout")
+        if isinstance(timeout, (int, float)) and not isinstance(timeout, bool):
+            timeout = [timeout] * (n or 1)
+        if timeout is not None:
+            if not (
+                isinstance(timeout, list) and
+                all(isinstance(t, (int, float)) for t in timeout)
+            ):
+                problems.append(
+                    "'timeout' must be a number or a list of numbers"
+                )
+            elif n is not None and len(timeout) != n:
+                problems.append(f"{len(timeout)} timeouts for {n} devices")
+
+        if not isinstance(items.get("lazy", False), bool):
+            problems.append("'lazy' must be a bool")
+
+        unknown = set(items) - {"device", "baseline", "timeout", "lazy"}
+        if unknown:
+            problems.append(f"unknown keys {sorted(unknown)}")
+
+        if problems:
+            errors[module] = f"{source}: '{module}': " + "; ".join(problems)
+
+    return errors
+
+
+def _resolve_device_entries(devs, default_timeout, default_lazy):
+    """Expand the YAML entries into one item per device."""
+    entries = []
+    for module, items in devs.items():
+        devices = (
+            [items["device"]]
+            if isinstance(items["device"], str) else
+            items["device"]
+        )
+        # A single baseline or timeout applies to all the devices of the entry.
+        baselines = items["baseline"]
+        if isinstance(baselines, bool):
+            baselines = [baselines] * len(devices)
+
+        timeouts = items.get("timeout", default_timeout)
+        if isinstance(timeouts, (int, float)):
+            timeouts = [timeouts] * len(devices)
+
+        for device, baseline, timeout in zip(devices, baselines, timeouts):
+            entries.append(
+                dict(
+                    module=module,
+                    device=device,
+                    baseline=baseline,
+                    timeout=timeout,
+                    lazy=items.get("lazy", default_lazy),
+                )
+            )
+    return entries
+
+
+def compile_station_config():
+    """
+    Merge the iconfig files and resolve the device table of the station.
+
+    Returns
+    -------
+    compiled : dict
+        With keys "iconfig", "devices" (list of device entries), "errors"
+        (bad YAML entries, skipped) and "sources" (file signatures).
+    """
+    # Loads the master configuration, then update it with the current station.
+    # This file is a source too, changing the compiler invalidates the cache.
+    sources = [
+        pathlib.Path(__file__),
+        MASTER_ICONFIG_YML_FILE,
+        DEFAULT_ICONFIG_YML_FILE,
+    ]
+    iconfig = load_config_yaml(MASTER_ICONFIG_YML_FILE)
+    iconfig.update(load_config_yaml(DEFAULT_ICONFIG_YML_FILE))
+
+    ophyd_config = iconfig.get("OPHYD", {})
+    default_timeout = ophyd_config.get("TIMEOUTS", {}).get("PV_CONNECTION", 5)
+    default_lazy = ophyd_config.get("LAZY_DEVICES", False)
+
+    devices, errors = [], {}
+    for fname in STATION_DEVICE_FILES.get(iconfig.get("STATION"), []):
+        path = instrument_path / "configs" / fname
+        sources.append(path)
+        devs = load_config_yaml(path) or {}
+        bad = validate_device_entries(devs, fname)
+        for module, msg in bad.items():
+            errors[f"{fname}:{module}"] = msg
+        if "*" not in bad:
+            good = {k: v for k, v in devs.items() if k not in bad}
+            devices += _resolve_device_entries(
+                good, default_timeout, default_lazy
+            )
+
+    return dict(
+        version=COMPILED_CONFIG_VERSION,
+        iconfig=iconfig,
+        devices=devices,
+        errors=errors,
+        sources={str(path): _file_signature(path) for path in sources},
+    )
+
+
+def load_station_config(path=COMPILED_CONFIG_FILE):
+    """
+    Compiled station configuration, re-compiled only if a source changed.
+    """
+    path = pathlib.Path(path)
+    compiled = None
+    if path.exists():
+        try:
+            with open(path, "rb") as f:
+                compiled = pickle.load(f)
+            if compiled.get("version") != COMPILED_CONFIG_VERSION or not all(
+                _source_unchanged(src, sig)
+                for src, sig in compiled["sources"].items()
+            ):
+                compiled = None
+        except Exception as exinfo:  # any unpickling problem means recompile
+            logger.info("Recompiling the configuration: %s", exinfo)
+            compiled = None
+
+    if compiled is None:
+        compiled = compile_station_config()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(compiled, f)
+            replace(tmp, path)
+        except OSError as exinfo:
+            logger.warning("Could not write '%s': %s", path, exinfo)
+
+    for msg in compiled["errors"].values():
+        logger.error("Bad device entry, it will not be loaded. %s", msg)
+
+    return compiled
+
+
+_compiled = load_station_config()
+iconfig = _compiled["iconfig"]
+device_table = _compiled["devices"]
+"""Devices of the station: module, device, baseline, timeout and lazy."""
 
 # Validate the iconfig file has the minimum version.
 _version = iconfig.get("ICONFIG_VERSION")
@@ -0,0 +1,115 @@
+"""
+Device connection cache
+=======================
+
+On-disk record of the last connection outcome and duration of every device
+in the station YAML files. It is used by the "fast restart" mode to avoid
+waiting the full timeout on devices that were offline in the last session.
+
+.. autosummary::
+    ~CONNECTION_CACHE_PATH
+    ~cache_key
+    ~load_connection_cache
+    ~save_connection_cache
+    ~update_connection_cache
+    ~known_offline
+"""
+
+import json
+import logging
+import pathlib
+from os import replace
+from threading import RLock
+from time import time as ttime
+
+from .config import iconfig
+
+logger = logging.getLogger(__name__)
+logger.info(__file__)
+
+_STATION = iconfig.get("STATION")
+DEFAULT_CACHE_PATH = (
+    pathlib.Path.home() / ".config" / f"polar_device_connections_{_STATION}.json"
+)
+CONNECTION_CACHE_PATH = pathlib.Path(
+    iconfig.get("OPHYD", {}).get("CONNECTION_CACHE", DEFAULT_CACHE_PATH)
+).expanduser()
+"""JSON file with the last connection outcome of each device."""
+
+_lock = RLock()  # held across the read-modify-write of the file
+
+
+def cache_key(module_name, obj_name):
+    """Key of a device YAML entry in the cache."""
+    return f"{module_name}:{obj_name}"
+
+
+def load_connection_cache(path=CONNECTION_CACHE_PATH):
+    """
+    Read the connection record of the current station.
+
+    Returns an empty dictionary if the file does not exist or is unreadable.
+    """
+    path = pathlib.Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get(_STATION, {})
+    except (OSError, ValueError) as exinfo:
+        logger.warning("Could not read '%s': %s", path, exinfo)
+        return {}
+
+
+def save_connection_cache(record, path=CONNECTION_CACHE_PATH):
+    """
+    Write the connection record of the current station.
+
+    Other stations' records in the same file are preserved. The file is
+    replaced atomically so a crash never leaves it half-written.
+    """
+    path = pathlib.Path(path)
+    with _lock:
+        content = {}
+        if path.exists():
+            try:
+                with open(path, "r") as f:
+                    content = json.load(f)
+            except (OSError, ValueError):
+                content = {}
+        content[_STATION] = record
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(content, f, indent=2)
+            replace(tmp, path)
+        except OSError as exinfo:
+            logger.warning("Could not write '%s': %s", path, exinfo)
+
+
+def update_connection_cache(timings, path=CONNECTION_CACHE_PATH):
+    """
+    Merge device timings (see `dynamic_import.DEVICE_TIMINGS`) into the cache.
+
+    Parameters
+    ----------
+    timings : dict
+        Keyed by device name, each with "module", "connected" and "connect".
+    """
+    with _lock:
+        record = load_connection_cache(path)
+        now = ttime()
+        for obj_name, info in timings.items():
+            record[cache_key(info["module"], obj_name)] = dict(
+                connected=bool(info.get("connected", False)),
+                duration=round(info.get("connect", 0.0), 3),
+                timestamp=now,
+            )
+        save_connection_cache(record, path)
+
+
+def known_offline(record, module_name, obj_name):
+    """True if the device did not connect in the previous session."""
+    entry = record.get(cache_key(module_name, obj_name))
+    return entry is not None and not entry.get("connected", True)
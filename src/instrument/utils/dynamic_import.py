@@ -1,13 +1,39 @@
 from importlib import import_module
-from time import time as ttime, sleep
+from time import time as ttime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ophyd.signal import ConnectionTimeoutError
+from ophyd.status import SubscriptionStatus
+from ophyd.utils.errors import StatusTimeoutError, WaitTimeoutError
 from collections import OrderedDict
+from functools import partial
+from threading import Lock
+from pyRestTable import Table
 from .config import iconfig
-from .run_engine import sd
+from .run_engine import RE, sd
 from .oregistry_setup import oregistry
+from .connection_cache import (
+    load_connection_cache, update_connection_cache, known_offline
+)
 from ._logging_setup import logger
 
 TIMEOUT = iconfig.get("OPHYD", {}).get("TIMEOUTS", {}).get("PV_CONNECTION", 5)
+MAX_WORKERS = iconfig.get("OPHYD", {}).get("CONNECTION_WORKERS", 16)
+FAST_RESTART = iconfig.get("OPHYD", {}).get("FAST_RESTART", False)
+PRIME_TIMEOUT = iconfig.get("AREA_DETECTOR", {}).get("PRIME_TIMEOUT", 10)
+
+# Startup time spent on each device, filled by `devices_import`.
+DEVICE_TIMINGS = OrderedDict()
+
+# Outcome and duration of the AD plugin priming, filled by `prime_plugins`.
+PRIMED_PLUGINS = OrderedDict()
+
+# Retries the devices that were offline in the previous session.
+_background = None
+
+# Known-offline devices connected in the background, waiting for their setup
+# in the thread of the RunEngine: (obj_name, obj, baseline).
+_connected_pending = []
+_connected_pending_lock = Lock()
 
 
 def AD_plugin_primed(plugin):
@@ -21,66 +47,148 @@ def AD_plugin_primed(plugin):
     return plugin.time_stamp.get() != 0
 
 
-def AD_prime_plugin2(plugin):
+def AD_prime_plugin2(plugin, timeout=PRIME_TIMEOUT):
     """
     Modification of the APS AD_plugin_primed for Vortex.
 
     Some area detectors PVs are not setup in the Vortex.
+
+    Instead of fixed sleeps, the signals are set waiting for each put to
+    complete, and the acquisition is considered done when the plugin receives
+    its first array (the plugin time stamp changes from zero).
+
+    Returns
+    -------
+    primed : bool
+        False if the plugin did not receive an array within `timeout`.
     """
     if AD_plugin_primed(plugin):
         logger.debug("'%s' plugin is already primed", plugin.name)
-        return
+        return True
 
     if getattr(plugin, "warmup", None) is not None:
         plugin.warmup()
-    else:
-        sigs = OrderedDict(
-            [
-                (plugin.enable, 1),
-                (plugin.parent.cam.array_callbacks, 1),  # set by number
-                (plugin.parent.cam.image_mode, 0),  # Single, set by number
-                # Trigger mode names are not identical for every camera.
-                # Assume here that the first item in the list is
-                # the best default choice to prime the plugin.
-                (plugin.parent.cam.trigger_mode, 1),  # set by number
-                # just in case the acquisition time is set very long...
-                (plugin.parent.cam.acquire_time, 1),
-                (plugin.parent.cam.acquire, 1),  # set by number
-            ]
-        )
+        return AD_plugin_primed(plugin)
+
+    cam = plugin.parent.cam
+    sigs = OrderedDict(
+        [
+            (plugin.enable, 1),
+            (cam.array_callbacks, 1),  # set by number
+            (cam.image_mode, 0),  # Single, set by number
+            # Trigger mode names are not identical for every camera.
+            # Assume here that the first item in the list is
+            # the best default choice to prime the plugin.
+            (cam.trigger_mode, 1),  # set by number
+            # just in case the acquisition time is set very long...
+            (cam.acquire_time, 1),
+        ]
+    )
+
+    original_vals = {sig: sig.get() for sig in sigs}
+    original_vals[cam.acquire] = cam.acquire.get()
 
-        original_vals = {sig: sig.get() for sig in sigs}
+    array_received = SubscriptionStatus(
+        plugin.time_stamp,
+        lambda *args, value=0, **kwargs: value != 0,
+        timeout=timeout,
+    )
 
+    primed = True
+    try:
         for sig, val in sigs.items():
-            sleep(0.1)  # abundance of caution
-            sig.set(val).wait()
+            sig.set(val).wait(timeout)
+        cam.acquire.put(1)  # set by number
+        array_received.wait()
+    except (StatusTimeoutError, WaitTimeoutError) as exinfo:
+        logger.warning("Could not prime '%s': %s", plugin.name, exinfo)
+        primed = False
 
-        sleep(2)  # wait for acquisition
+    # Acquire (stops the acquisition, if needed) is restored first.
+    for sig, val in reversed(list(original_vals.items())):
+        if sig is cam.acquire:
+            sig.put(val)
+        else:
+            sig.set(val).wait(timeout)
 
-        for sig, val in reversed(list(original_vals.items())):
-            sleep(0.1)
-            sig.set(val).wait()
+    return primed
 
 
-def device_import(module_name, obj_name, baseline, timeout=TIMEOUT):
+def prime_plugins(plugins, max_workers=MAX_WORKERS):
+    """
+    Prime many AD plugins at once, each in its own thread.
+
+    The outcome and duration of each one is recorded in `PRIMED_PLUGINS`.
+
+    Parameters
+    ----------
+    plugins : iterable
+        AD plugins (usually the `hdf1` of the detectors).
+    """
+    def _prime(plugin):
+        t0 = ttime()
+        try:
+            primed = AD_prime_plugin2(plugin)
+        except Exception as exinfo:
+            logger.warning("Error priming '%s': %s", plugin.name, exinfo)
+            primed = False
+        return plugin, primed, ttime() - t0
+
+    plugins = list(plugins)
+    if len(plugins) == 0:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in as_completed(
+            [executor.submit(_prime, plugin) for plugin in plugins]
+        ):
+            plugin, primed, dt = future.result()
+            PRIMED_PLUGINS[plugin.name] = dict(primed=primed, duration=dt)
+            logger.info(
+                "Plugin '%s' %s in %.2fs.",
+                plugin.name,
+                "primed" if primed else "NOT primed",
+                dt,
+            )
+
+
+def device_load(module_name, obj_name):
+    """
+    Import the device module and return the (not yet connected) object.
+
+    Importing the module instantiates the device, which starts the PV
+    connections in the background.
+    """
+    module_path = f"instrument.devices.{module_name}"
+    module = import_module(module_path)
+    return getattr(module, obj_name)
+
+
+def device_connect(obj, timeout=TIMEOUT):
+    """
+    Wait for the device PVs to connect.
+
+    Returns
+    -------
+    connected : bool
+        False if the device did not connect within `timeout`.
+    """
     t0 = ttime()
     try:
-        module_path = f"instrument.devices.{module_name}"
-        module = import_module(module_path)
-        obj = getattr(module, obj_name)
         obj.wait_for_connection(timeout=timeout)
-    except (
-        KeyError, NameError, TimeoutError, ConnectionTimeoutError
-    ) as exinfo:
+    except (TimeoutError, ConnectionTimeoutError) as exinfo:
         logger.warning(
             "Error connecting with '%s in %.2fs, %s",
-            obj_name,
+            obj.name,
             ttime() - t0,
             str(exinfo)
         )
-        logger.warning(f"Setting {obj_name} to 'None'.")
-        obj = None
+        return False
+    return True
+
 
+def _setup_stage_sigs(obj, baseline):
+    """Baseline registration and AD staging settings."""
     if obj is not None and baseline:
         sd.baseline.append(obj)
 
@@ -92,16 +200,299 @@ def device_import(module_name, obj_name, baseline, timeout=TIMEOUT):
             if "blocking_callbacks" in dir(item):  # is it a plugin?
                 item.stage_sigs["blocking_callbacks"] = "No"
 
+
+def _plugin_to_prime(obj):
+    """The HDF plugin of the device, if it needs priming, else None."""
     hdf1 = getattr(obj, "hdf1", None)
-    if hdf1 is not None:
-        if obj.connected:
-            if not AD_plugin_primed(hdf1):
-                AD_prime_plugin2(hdf1)
+    if hdf1 is not None and obj.connected and not AD_plugin_primed(hdf1):
+        return hdf1
+    return None
+
 
+def _setup_defaults(obj):
+    """Default settings and registration."""
     defaults = getattr(obj, "default_settings", None)
     if defaults is not None:
         defaults()
 
     oregistry.register(obj)
 
+
+def device_setup(obj, baseline):
+    """
+    Baseline registration, AD plugin priming and default settings.
+
+    Only runs after the device is connected (or set to None).
+    """
+    _setup_stage_sigs(obj, baseline)
+    hdf1 = _plugin_to_prime(obj)
+    if hdf1 is not None:
+        prime_plugins([hdf1])
+    _setup_defaults(obj)
+
+
+def device_import(module_name, obj_name, baseline, timeout=TIMEOUT):
+    t0 = ttime()
+    try:
+        obj = device_load(module_name, obj_name)
+        if not device_connect(obj, timeout):
+            obj = None
+    except (KeyError, NameError) as exinfo:
+        logger.warning(
+            "Error connecting with '%s in %.2fs, %s",
+            obj_name,
+            ttime() - t0,
+            str(exinfo)
+        )
+        obj = None
+
+    if obj is None:
+        logger.warning(f"Setting {obj_name} to 'None'.")
+
+    device_setup(obj, baseline)
+
     return obj
+
+
+def _retry_pending(module_name, obj_name, obj, baseline, timeout):
+    """
+    Connect a known-offline device in the background.
+
+    Its setup (baseline, priming, registration) is left to
+    `setup_pending_devices`, as the RunEngine may be reading the baseline.
+    """
+    t0 = ttime()
+    connected = device_connect(obj, timeout)
+    dt = ttime() - t0
+    if connected:
+        logger.info("Known-offline device '%s' is now connected.", obj_name)
+        with _connected_pending_lock:
+            _connected_pending.append((obj_name, obj, baseline))
+    update_connection_cache(
+        {obj_name: dict(module=module_name, connected=connected, connect=dt)}
+    )
+    return connected
+
+
+def setup_pending_devices():
+    """Setup the known-offline devices connected since the last call."""
+    with _connected_pending_lock:
+        ready = list(_connected_pending)
+        _connected_pending.clear()
+    for obj_name, obj, baseline in ready:
+        oregistry.pending.pop(obj_name, None)
+        device_setup(obj, baseline)
+
+
+def _load_pending(retry):
+    """`oregistry` loader of a known-offline device, waits for its retry."""
+    if retry.result():
+        setup_pending_devices()
+
+
+def _setup_pending_preprocessor(plan):
+    """
+    RunEngine preprocessor, runs `setup_pending_devices` before each plan.
+
+    Preprocessors are applied when the plan is given to the RunEngine, in
+    its thread and before the baseline is read.
+    """
+    setup_pending_devices()
+    return plan
+
+
+RE.preprocessors.insert(0, _setup_pending_preprocessor)
+
+
+def devices_import(
+    entries, max_workers=MAX_WORKERS, fast_restart=FAST_RESTART
+):
+    """
+    Import, connect and setup many devices, connecting them in parallel.
+
+    The import is done serially (it instantiates the devices and starts the
+    PV connections), then all connections are awaited in a thread pool, and
+    only then the baseline/priming/default settings are applied. Startup is
+    bounded by the slowest device instead of the sum of all of them.
+
+    Parameters
+    ----------
+    entries : iterable
+        Items of (module_name, obj_name, baseline, timeout).
+    max_workers : int, optional
+        Number of connection threads.
+    fast_restart : bool, optional
+        If True, devices that did not connect in the previous session (see
+        `connection_cache`) are not waited for. They are retried in the
+        background and set up on first access through `oregistry`, or
+        before the next plan (see `setup_pending_devices`).
+
+    Returns
+    -------
+    objs : dict
+        Device objects keyed by `obj_name`, None if it did not connect (or
+        if it is pending in the fast restart mode).
+    """
+    global _background
+
+    objs, baselines, timings = {}, {}, {}
+    t_start = ttime()
+
+    for module_name, obj_name, baseline, timeout in entries:
+        t0 = ttime()
+        try:
+            objs[obj_name] = device_load(module_name, obj_name)
+        except (KeyError, NameError) as exinfo:
+            logger.warning(
+                "Error loading '%s' from '%s', %s",
+                obj_name,
+                module_name,
+                str(exinfo)
+            )
+            objs[obj_name] = None
+        baselines[obj_name] = baseline
+        timings[obj_name] = dict(
+            module=module_name,
+            timeout=timeout,
+            load=ttime() - t0,
+            connect=0.0,
+            setup=0.0,
+            prime=0.0,
+        )
+
+    pending = {}
+    if fast_restart:
+        record = load_connection_cache()
+        for obj_name, obj in objs.items():
+            module_name = timings[obj_name]["module"]
+            if obj is not None and known_offline(record, module_name, obj_name):
+                pending[obj_name] = obj
+                objs[obj_name] = None
+                timings[obj_name]["pending"] = True
+
+    def _connect(obj_name, obj, timeout):
+        t0 = ttime()
+        connected = device_connect(obj, timeout)
+        return obj_name, connected, ttime() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _connect, obj_name, obj, timings[obj_name]["timeout"]
+            )
+            for obj_name, obj in objs.items()
+            if obj is not None
+        ]
+        for future in as_completed(futures):
+            obj_name, connected, dt = future.result()
+            timings[obj_name]["connect"] = dt
+            if not connected:
+                logger.warning(f"Setting {obj_name} to 'None'.")
+                objs[obj_name] = None
+
+    # All AD plugins are primed together, between the two setup steps.
+    to_prime = {}
+    for obj_name, obj in objs.items():
+        if obj_name in pending:
+            continue
+        t0 = ttime()
+        _setup_stage_sigs(obj, baselines[obj_name])
+        plugin = _plugin_to_prime(obj)
+        if plugin is not None:
+            to_prime[obj_name] = plugin
+        timings[obj_name]["setup"] = ttime() - t0
+
+    prime_plugins(to_prime.values(), max_workers=max_workers)
+    for obj_name, plugin in to_prime.items():
+        timings[obj_name]["prime"] = PRIMED_PLUGINS[plugin.name]["duration"]
+
+    for obj_name, obj in objs.items():
+        if obj_name in pending:
+            continue
+        t0 = ttime()
+        _setup_defaults(obj)
+        timings[obj_name]["setup"] += ttime() - t0
+        timings[obj_name]["connected"] = obj is not None
+
+    DEVICE_TIMINGS.update(timings)
+    update_connection_cache(
+        {nm: info for nm, info in timings.items() if nm not in pending}
+    )
+
+    if len(pending) > 0:
+        logger.info(
+            "Skipping %d known-offline devices, retrying in the background: %s",
+            len(pending),
+            ", ".join(pending),
+        )
+        if _background is None:
+            _background = ThreadPoolExecutor(max_workers=max_workers)
+        # Keyed by the YAML name, as the lazy devices.
+        for obj_name, obj in pending.items():
+            oregistry.pending[obj_name] = partial(
+                _load_pending,
+                _background.submit(
+                    _retry_pending,
+                    timings[obj_name]["module"],
+                    obj_name,
+                    obj,
+                    baselines[obj_name],
+                    timings[obj_name]["timeout"],
+                ),
+            )
+
+    if len(timings) > 0:
+        slowest = max(timings, key=lambda name: timings[name]["connect"])
+        logger.info(
+            "Connected %d of %d devices in %.2fs (slowest: '%s', %.2fs).",
+            sum(obj is not None for obj in objs.values()),
+            len(objs),
+            ttime() - t_start,
+            slowest,
+            timings[slowest]["connect"],
+        )
+
+    return objs
+
+
+def device_timing_report(sort_by="connect"):
+    """
+    Prints a table with the startup time spent on each device.
+
+    Parameters
+    ----------
+    sort_by : str
+        Column used to sort the table (slowest first). Options are "load",
+        "connect", "prime", "setup" or "total".
+    """
+    table = Table()
+    table.labels = (
+        "Device", "Module", "Connected", "Load (s)", "Connect (s)",
+        "Prime (s)", "Setup (s)", "Total (s)"
+    )
+    rows = [
+        (
+            name,
+            info,
+            info["load"] + info["connect"] + info["prime"] + info["setup"]
+        )
+        for name, info in DEVICE_TIMINGS.items()
+    ]
+    if sort_by == "total":
+        rows.sort(key=lambda row: row[2], reverse=True)
+    else:
+        rows.sort(key=lambda row: row[1][sort_by], reverse=True)
+
+    for name, info, total in rows:
+        table.addRow((
+            name,
+            info["module"],
+            "pending" if info.get("pending") else info["connected"],
+            f"{info['load']:.3f}",
+            f"{info['connect']:.3f}",
+            f"{info['prime']:.3f}",
+            f"{info['setup']:.3f}",
+            f"{total:.3f}",
+        ))
+
+    print(table.reST(fmt="simple"))
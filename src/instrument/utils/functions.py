@@ -5,17 +5,21 @@ Utility functions
 .. autosummary::
 
     ~host_on_aps_subnet
+    ~nearest_index
     ~running_in_queueserver
 """
 
 __all__ = """
     host_on_aps_subnet
+    nearest_index
     running_in_queueserver
 """.split()
 
 import logging
 import socket
 
+from numpy import searchsorted
+
 logger = logging.getLogger(__name__)
 logger.info(__file__)
 
@@ -39,6 +43,18 @@ def host_on_aps_subnet():
     ]
 
 
+def nearest_index(values, value, tolerance):
+    """
+    Index of `value` in the sorted `values`, within `tolerance`, or None.
+    """
+    i = searchsorted(values, value)
+    for j in (i - 1, i):
+        if 0 <= j < len(values):
+            if abs(values[j] - value) <= tolerance:
+                return j
+    return None
+
+
 def running_in_queueserver():
     """Detect if running in the bluesky queueserver."""
     try:
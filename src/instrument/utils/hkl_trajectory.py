@@ -0,0 +1,306 @@
+"""
+Batch hkl to real positions
+===========================
+
+Solves the real positions of the diffractometer for many (h, k, l, energy)
+points before a scan starts, so the scan moves the real motors directly
+instead of calling the libhkl solver at every point. Points that cannot be
+reached are found before the scan.
+
+The solutions are cached, keyed by the sample UB matrix, the engine mode,
+the axes constraints, the wavelength and the hkl.
+
+`reachability_map` finds all the solutions of many reflections at once,
+optionally in a pool of spawned processes as libhkl is CPU bound (see
+`instrument._hkl_pool`).
+
+.. autosummary::
+    ~geometry_key
+    ~solve_hkl_points
+    ~clear_solution_cache
+    ~q_magnitude
+    ~hkl_within_q
+    ~reachability_map
+"""
+
+__all__ = [
+    "geometry_key",
+    "solve_hkl_points",
+    "clear_solution_cache",
+    "q_magnitude",
+    "hkl_within_q",
+    "reachability_map",
+]
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from numpy import (
+    arange, array, array_split, asarray, cos, einsum, floor, meshgrid, pi,
+    radians, sqrt
+)
+from numpy.linalg import inv
+from pandas import DataFrame
+from .._hkl_pool import calc_setup, forward_all, pool_forward, pool_init
+from ._logging_setup import logger
+
+# Number of solved points kept in memory.
+SOLUTION_CACHE_SIZE = 10000
+_SOLUTION_CACHE = OrderedDict()
+
+
+def geometry_key(diffractometer):
+    """
+    Hashable description of what the hkl solutions depend on, except the
+    wavelength: sample, UB matrix, engine mode and axes constraints.
+    """
+    calc = diffractometer.calc
+    constraints = []
+    for axis in calc.physical_axis_names:
+        constraint = diffractometer.get_axis_constraints(axis)
+        constraints.append((
+            axis,
+            constraint.low_limit,
+            constraint.high_limit,
+            constraint.value,
+            constraint.fit,
+        ))
+    ub = array(calc.sample.UB, dtype=float).ravel()
+    return (
+        diffractometer.name,
+        calc.sample.name,
+        tuple(round(float(value), 10) for value in ub),
+        calc.engine.mode,
+        tuple(constraints),
+    )
+
+
+def _solve(diffractometer, hkl):
+    """Real positions (tuple) of one point, None if it cannot be reached."""
+    try:
+        return tuple(diffractometer.forward(tuple(hkl)))
+    except Exception as exinfo:  # libhkl errors are not all ValueError
+        logger.debug("No solution for hkl = %s: %s", hkl, exinfo)
+        return None
+
+
+def solve_hkl_points(diffractometer, hkls, energies=None):
+    """
+    Real positions of a list of hkl points.
+
+    Uses the current sample, mode and constraints of the diffractometer.
+    The calculation energy is restored at the end.
+
+    Parameters
+    ----------
+    diffractometer : hklpy Diffractometer
+        Usually `current_diffractometer()`.
+    hkls : iterable
+        (h, k, l) of each point.
+    energies : iterable, optional
+        Energy (keV) of each point. The `energy_offset` of the
+        diffractometer is added, as in its energy tracking. Defaults to the
+        current calculation energy.
+
+    Returns
+    -------
+    solutions : list
+        For each point, a dictionary mapping the real positioners to their
+        positions, or None if the point cannot be reached.
+    """
+    calc = diffractometer.calc
+    hkls = [tuple(float(value) for value in hkl) for hkl in hkls]
+    if energies is None:
+        energies = [None]*len(hkls)
+    offset = getattr(diffractometer, "energy_offset", None)
+    offset = 0 if offset is None else float(offset.get())
+
+    reals = list(diffractometer.real_positioners)
+    base = geometry_key(diffractometer)
+    current_energy = calc.energy
+    solutions = []
+    try:
+        for hkl, energy in zip(hkls, energies):
+            if energy is not None:
+                calc.energy = float(energy) + offset
+            key = (
+                base,
+                round(calc.wavelength, 8),
+                tuple(round(value, 8) for value in hkl),
+            )
+            if key in _SOLUTION_CACHE:
+                _SOLUTION_CACHE.move_to_end(key)
+            else:
+                _SOLUTION_CACHE[key] = _solve(diffractometer, hkl)
+                if len(_SOLUTION_CACHE) > SOLUTION_CACHE_SIZE:
+                    _SOLUTION_CACHE.popitem(last=False)
+            solution = _SOLUTION_CACHE[key]
+            solutions.append(
+                None if solution is None else dict(zip(reals, solution))
+            )
+    finally:
+        calc.energy = current_energy
+    return solutions
+
+
+def clear_solution_cache():
+    """Forget all the cached hkl solutions."""
+    _SOLUTION_CACHE.clear()
+
+
+def _reciprocal_metric(lattice):
+    """Reciprocal metric tensor of (a, b, c, alpha, beta, gamma)."""
+    a, b, c, alpha, beta, gamma = lattice
+    alpha, beta, gamma = radians([alpha, beta, gamma])
+    metric = array([
+        [a*a, a*b*cos(gamma), a*c*cos(beta)],
+        [a*b*cos(gamma), b*b, b*c*cos(alpha)],
+        [a*c*cos(beta), b*c*cos(alpha), c*c],
+    ])
+    return inv(metric)
+
+
+def q_magnitude(lattice, hkls):
+    """
+    Momentum transfer |Q| (1/angstrom) of reflections.
+
+    Parameters
+    ----------
+    lattice : iterable
+        a, b, c (angstrom), alpha, beta, gamma (degrees).
+    hkls : array (npoints, 3)
+        Reflections.
+    """
+    hkls = asarray(hkls, dtype=float).reshape(-1, 3)
+    gstar = _reciprocal_metric(lattice)
+    return 2*pi*sqrt(einsum("ij,jk,ik->i", hkls, gstar, hkls))
+
+
+def hkl_within_q(lattice, qmax, qmin=0):
+    """
+    All integer reflections with qmin <= |Q| <= qmax, sorted by |Q|.
+
+    Parameters
+    ----------
+    lattice : iterable
+        a, b, c (angstrom), alpha, beta, gamma (degrees).
+    qmax, qmin : float
+        |Q| limits (1/angstrom).
+
+    Returns
+    -------
+    hkls : array (npoints, 3)
+    """
+    # h = Q.a/2pi, so |h| <= qmax*a/2pi.
+    limits = [int(floor(qmax*length/(2*pi))) for length in lattice[:3]]
+    grid = meshgrid(*[arange(-n, n + 1) for n in limits], indexing="ij")
+    hkls = array([axis.ravel() for axis in grid]).T
+    q = q_magnitude(lattice, hkls)
+    keep = (q >= qmin) & (q <= qmax) & (q > 0)
+    hkls, q = hkls[keep], q[keep]
+    return hkls[q.argsort(kind="stable")]
+
+
+def reachability_map(
+    diffractometer, hkls=None, qmax=None, qmin=0, energy=None, processes=None
+):
+    """
+    Solutions of many reflections with the current mode and constraints.
+
+    Reflections beyond the Ewald sphere (|Q| > 4pi/lambda) are flagged
+    without calling libhkl. The calculation energy is restored at the end.
+
+    Parameters
+    ----------
+    diffractometer : hklpy Diffractometer
+        Usually `current_diffractometer()`.
+    hkls : array (npoints, 3), optional
+        Reflections. If None, all the reflections within the |Q| limits.
+    qmax : float, optional
+        Largest |Q| (1/angstrom) of the generated reflections. Defaults to
+        4pi/lambda.
+    qmin : float, optional
+        Smallest |Q| (1/angstrom) of the generated reflections.
+    energy : float, optional
+        Energy (keV) of the calculation, the `energy_offset` of the
+        diffractometer is added. Defaults to the current one.
+    processes : int, optional
+        Number of worker processes (spawned, each one rebuilds the
+        calculation engine). None solves in this process, as do the modes
+        with extra parameters.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        One row per reflection with h, k, l, |Q|, the reachable flag, the
+        number of solutions, the angles of the first solution and the list
+        of all the solutions.
+    """
+    calc = diffractometer.calc
+    lattice = tuple(calc.sample.lattice)
+    current_energy = calc.energy
+    try:
+        if energy is not None:
+            offset = getattr(diffractometer, "energy_offset", None)
+            offset = 0 if offset is None else float(offset.get())
+            calc.energy = float(energy) + offset
+        qlimit = 4*pi/calc.wavelength
+
+        if hkls is None:
+            hkls = hkl_within_q(lattice, qlimit if qmax is None else qmax,
+                                qmin)
+        hkls = asarray(hkls, dtype=float).reshape(-1, 3)
+        q = q_magnitude(lattice, hkls)
+        candidates = (q <= qlimit).nonzero()[0]
+
+        solutions = [[] for _ in hkls]
+        setup = None
+        if processes and len(candidates) > 1:
+            setup = calc_setup(calc)
+            if setup is None:
+                logger.info(
+                    "Mode '%s' has extra parameters, solving in this process.",
+                    calc.engine.mode
+                )
+        if setup is not None:
+            chunks = [
+                chunk for chunk in array_split(candidates, processes)
+                if len(chunk)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=len(chunks),
+                mp_context=get_context("spawn"),
+                initializer=pool_init,
+                initargs=(setup,),
+            ) as pool:
+                results = pool.map(
+                    pool_forward,
+                    [hkls[chunk] for chunk in chunks],
+                    [calc.energy]*len(chunks),
+                )
+                for chunk, result in zip(chunks, results):
+                    for index, sols in zip(chunk, result):
+                        solutions[index] = sols
+        else:
+            for index, sols in zip(
+                candidates, forward_all(calc, hkls[candidates])
+            ):
+                solutions[index] = sols
+    finally:
+        calc.energy = current_energy
+
+    axes = list(diffractometer.RealPosition._fields)
+    table = DataFrame(dict(
+        h=hkls[:, 0],
+        k=hkls[:, 1],
+        l=hkls[:, 2],  # noqa: E741
+        q=q,
+        reachable=[len(sols) > 0 for sols in solutions],
+        solutions=[len(sols) for sols in solutions],
+    ))
+    for i, axis in enumerate(axes):
+        table[axis] = [
+            sols[0][i] if sols else float("nan") for sols in solutions
+        ]
+    table["all_solutions"] = solutions
+    return table
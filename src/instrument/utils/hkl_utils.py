@@ -23,6 +23,7 @@ Auxilary HKL functions.
     ~calc_UB
     ~setmode
     ~ca
+    ~ca_map
     ~br
     ~uan
     ~wh
@@ -51,6 +52,7 @@ from .run_engine import RE
 from ..devices.polar_diffractometer import huber_euler, huber_euler_psi
 from ..devices.simulated_fourc_vertical import fourc
 from ._logging_setup import logger
+from .hkl_trajectory import reachability_map
 
 from .catalog import full_cat
 from .polartools_hklpy_imports import pa
@@ -1564,6 +1566,42 @@ def ca(h, k, l):
         )
 
 
+def ca_map(hkls=None, qmax=None, qmin=0, energy=None, processes=None):
+    """
+    Calculate the motors position of many reflections.
+
+    Uses the current diffractometer, mode and constraints. See
+    `reachability_map`.
+
+    Parameters
+    ----------
+    hkls : array (npoints, 3), optional
+        Reflections. If None, all the reflections between `qmin` and `qmax`.
+    qmax, qmin : float, optional
+        |Q| limits (1/angstrom) of the generated reflections. `qmax`
+        defaults to the largest |Q| at this energy.
+    energy : float, optional
+        Energy (keV). Defaults to the current energy.
+    processes : int, optional
+        Number of processes used to solve the reflections.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        Angles and reachability of each reflection.
+    """
+    _geom_ = current_diffractometer()
+    table = reachability_map(
+        _geom_, hkls=hkls, qmax=qmax, qmin=qmin, energy=energy,
+        processes=processes
+    )
+    print(
+        f"\n   {table.reachable.sum()} of {len(table)} reflections can be"
+        " reached."
+    )
+    return table
+
+
 def _ensure_idle():
     if RE.state != "idle":
         print("The RunEngine invoked by magics cannot be resumed.")
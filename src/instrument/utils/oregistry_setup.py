@@ -2,8 +2,39 @@
 from ophydregistry import Registry
 from pyRestTable import Table
 
+
+class PolarRegistry(Registry):
+    """
+    Registry that loads pending devices on first access.
+
+    Devices that are not loaded at startup (lazy devices, or known-offline
+    devices skipped by the fast restart mode) keep a loader in ``pending``,
+    keyed by device name. ``find`` calls the loader before searching, and
+    removes it once it succeeded (a failed loader is tried again at the next
+    search). Only searches by name trigger the loaders, label searches will
+    only return devices that are already loaded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+
+    def find(self, any_of=None, *, label=None, name=None, allow_none=False):
+        key = name if name is not None else any_of
+        if isinstance(key, str):
+            name_ = key.split(".")[0]
+            loader = self.pending.get(name_)
+            if loader is not None:
+                loader()
+                if self.pending.get(name_) is loader:
+                    del self.pending[name_]
+        return super().find(
+            any_of, label=label, name=name, allow_none=allow_none
+        )
+
+
 # Registry of all ophyd-style Devices and Signals.
-oregistry = Registry(auto_register=False)
+oregistry = PolarRegistry(auto_register=False)
 
 
 def get_devices(label):
@@ -0,0 +1,242 @@
+"""
+Minimum-travel ordering of scan points
+======================================
+
+Reorders a list of points so the estimated time spent moving between them
+is small. The move time of each axis uses the velocity and acceleration of
+its motor record (trapezoidal profile); the axes move together, so a step
+takes the time of its slowest axis.
+
+.. autosummary::
+    ~axis_kinematics
+    ~axis_time
+    ~move_times
+    ~path_time
+    ~order_points
+"""
+
+__all__ = [
+    "axis_kinematics", "axis_time", "move_times", "path_time", "order_points"
+]
+
+from time import time as ttime
+from numpy import (
+    arange, argmin, array, asarray, inf, newaxis, sqrt, where, zeros
+)
+from ._logging_setup import logger
+
+# Used for positioners without motor record velocity/acceleration.
+DEFAULT_VELOCITY = 1.0
+DEFAULT_ACCELERATION = 0.0
+
+# Larger lists keep their order: the move time matrix has npoints**2 items
+# (2000 points: 32 MB per matrix, a few are alive at once).
+MAX_POINTS = 2000
+
+
+def axis_kinematics(motor):
+    """
+    Velocity (units/s) and acceleration time (s) of a positioner.
+
+    EpicsMotor provides ``velocity`` (VELO) and ``acceleration`` (ACCL, the
+    time to reach the velocity). Other positioners use the defaults.
+    """
+    try:
+        velocity = float(motor.velocity.get())
+    except (AttributeError, TypeError, ValueError):
+        velocity = DEFAULT_VELOCITY
+    try:
+        acceleration = float(motor.acceleration.get())
+    except (AttributeError, TypeError, ValueError):
+        acceleration = DEFAULT_ACCELERATION
+    if velocity <= 0:
+        velocity = DEFAULT_VELOCITY
+    return velocity, max(acceleration, 0.0)
+
+
+def axis_time(distance, velocity, acceleration):
+    """Trapezoidal (or triangular, for short moves) profile time."""
+    distance = abs(distance)
+    if acceleration == 0:
+        return distance/velocity
+    ramp = velocity*acceleration  # distance used to speed up and slow down
+    return where(
+        distance >= ramp,
+        distance/velocity + acceleration,
+        2*sqrt(distance*acceleration/velocity),
+    )
+
+
+def move_times(points, kinematics, start=None):
+    """
+    Matrix of the move times between all the points.
+
+    Parameters
+    ----------
+    points : array (npoints, naxes)
+        Positions of each point.
+    kinematics : list of tuple
+        (velocity, acceleration) of each axis.
+    start : array (naxes), optional
+        Current position. If given, it is added as the first row/column.
+
+    Returns
+    -------
+    times : array
+        times[i, j] is the time to move from point i to point j.
+    """
+    points = asarray(points, dtype=float)
+    if start is not None:
+        points = array([list(start)] + list(points), dtype=float)
+    times = zeros((len(points), len(points)))
+    for axis, (velocity, acceleration) in enumerate(kinematics):
+        column = points[:, axis]
+        distance = column[:, newaxis] - column[newaxis, :]
+        times = times.clip(min=axis_time(distance, velocity, acceleration))
+    return times
+
+
+def _sequence_time(points, kinematics, start=None):
+    """Total move time visiting `points` in order, without the matrix."""
+    points = asarray(points, dtype=float)
+    if start is not None:
+        points = array([list(start)] + list(points), dtype=float)
+    steps = zeros(max(len(points) - 1, 0))
+    for axis, (velocity, acceleration) in enumerate(kinematics):
+        distance = points[1:, axis] - points[:-1, axis]
+        steps = steps.clip(min=axis_time(distance, velocity, acceleration))
+    return float(steps.sum())
+
+
+def path_time(times, order):
+    """Total move time following `order` (indices of `times`)."""
+    order = asarray(order)
+    return float(times[order[:-1], order[1:]].sum())
+
+
+def _nearest_neighbor(times, first):
+    """Greedy path from `first` visiting all the points."""
+    n = len(times)
+    visited = zeros(n, dtype=bool)
+    order = [first]
+    visited[first] = True
+    for _ in range(n - 1):
+        row = where(visited, inf, times[order[-1]])
+        nxt = int(argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def _two_opt(times, order, fixed_start, timeout):
+    """
+    Improve an open path by reversing segments (2-opt).
+
+    The first point is kept in place if `fixed_start`.
+    """
+    order = array(order)
+    n = len(order)
+    first = 1 if fixed_start else 0
+    t0 = ttime()
+    improved = True
+    while improved and ttime() - t0 < timeout:
+        improved = False
+        for i in range(first, n - 1):
+            a = order[i - 1] if i > 0 else None
+            b = order[i]
+            js = arange(i + 1, n)
+            c = order[js]
+            d = order[where(js + 1 < n, js + 1, js)]
+            last = js + 1 >= n
+
+            old = where(last, 0, times[c, d])
+            new = where(last, 0, times[b, d])
+            if a is not None:
+                old = old + times[a, b]
+                new = new + times[a, c]
+            gain = old - new
+            k = int(argmin(-gain))
+            if gain[k] > 1e-9:
+                j = js[k]
+                order[i:j + 1] = order[i:j + 1][::-1]
+                improved = True
+    return list(order)
+
+
+def order_points(points, motors=None, kinematics=None, start=None,
+                 timeout=5.0):
+    """
+    Order the points to minimize the estimated move time.
+
+    Parameters
+    ----------
+    points : array (npoints, naxes)
+        Positions of each point, one column per motor.
+    motors : list, optional
+        Positioners of each column, used to get the velocity/acceleration
+        and (if `start` is None) the current position.
+    kinematics : list of tuple, optional
+        (velocity, acceleration) of each axis, overrides the `motors`.
+    start : iterable, optional
+        Position before the scan. The first point is the fastest to reach.
+    timeout : float, optional
+        Time limit (seconds) for the path improvement.
+
+    Lists of more than `MAX_POINTS` points are not reordered.
+
+    Returns
+    -------
+    order : list
+        Indices of `points` in measurement order.
+    original : float
+        Estimated move time (seconds) in the original order.
+    optimized : float
+        Estimated move time (seconds) in the new order.
+    """
+    points = asarray(points, dtype=float)
+    if points.ndim == 1:
+        points = points[:, newaxis]
+    if kinematics is None:
+        if motors is None:
+            kinematics = [(DEFAULT_VELOCITY, DEFAULT_ACCELERATION)]
+            kinematics *= points.shape[1]
+        else:
+            kinematics = [axis_kinematics(motor) for motor in motors]
+    if start is None and motors is not None:
+        try:
+            start = [float(motor.position) for motor in motors]
+        except (AttributeError, TypeError, ValueError):
+            start = None
+
+    n = len(points)
+    if n < 3:
+        return list(range(n)), 0.0, 0.0
+    if n > MAX_POINTS:
+        original = _sequence_time(points, kinematics, start)
+        logger.warning(
+            "Point ordering: %d points (more than %d), the order is kept.",
+            n, MAX_POINTS
+        )
+        return list(range(n)), original, original
+
+    times = move_times(points, kinematics, start=start)
+    if start is not None:
+        order = _nearest_neighbor(times, 0)
+        order = _two_opt(times, order, True, timeout)
+        original = path_time(times, range(n + 1))
+        optimized = path_time(times, order)
+        order = [i - 1 for i in order[1:]]
+    else:
+        order = _nearest_neighbor(times, 0)
+        order = _two_opt(times, order, False, timeout)
+        original = path_time(times, range(n))
+        optimized = path_time(times, order)
+
+    if optimized > original:
+        order, optimized = list(range(n)), original
+
+    logger.info(
+        "Point ordering: estimated move time %.1f s -> %.1f s (%.1f s saved).",
+        original, optimized, original - optimized
+    )
+    return order, original, optimized
@@ -0,0 +1,272 @@
+"""
+Per-point timing of the runs
+============================
+
+`PointTimer` is a RunEngine preprocessor that measures the time the
+RunEngine spends on each message of a run and splits it per point (a point
+ends when its "primary" event is saved) in these categories:
+
+* plan: time spent in the plan itself, between messages.
+* move: ``set`` messages and the ``wait`` for them (includes the settling).
+* trigger: ``trigger`` messages and the ``wait`` for them.
+* read: ``read`` messages of the primary stream (detector readout).
+* emit: ``save`` messages, the event is sent to all the callbacks (NeXus,
+  SPEC, plots...) before the RunEngine continues.
+* baseline: ``read`` and ``save`` of the baseline stream.
+* other: everything else (checkpoint, create, ...).
+
+The time before the first point (open run, staging, baseline) is the
+"setup" and the time after the last point is the "teardown". The points
+are added to the run as a "timing" stream and a summary table is printed
+at the end of the run.
+
+It is enabled with ``RUN_ENGINE.POINT_TIMING`` in the iconfig, or with
+``point_timer.enabled = True``.
+
+.. autosummary::
+    ~PointTimer
+    ~point_timer
+    ~point_timing_report
+"""
+
+from collections import defaultdict
+from time import time as ttime
+
+from bluesky.plan_stubs import create, read, save
+from ophyd import Component, Device, Signal
+from pyRestTable import Table
+
+from ._logging_setup import logger
+from .config import iconfig
+
+CATEGORIES = (
+    "plan", "move", "trigger", "read", "emit", "baseline", "other"
+)
+
+# Component of `PointTimingDevice` of each category.
+_COMPONENTS = dict(trigger="trigger_time", read="read_time")
+
+# Time spent on each message command by all timed runs:
+# command -> {"count": int, "total": float}.
+MESSAGE_TIMINGS = defaultdict(lambda: dict(count=0, total=0.0))
+
+
+class PointTimingDevice(Device):
+    """
+    Time (s) spent in each category of one point.
+
+    The trigger and read categories are `trigger_time` and `read_time`, as
+    ophyd reserves the names of the bluesky interface.
+    """
+
+    point = Component(Signal, value=0)
+    plan = Component(Signal, value=0.0)
+    move = Component(Signal, value=0.0)
+    trigger_time = Component(Signal, value=0.0)
+    read_time = Component(Signal, value=0.0)
+    emit = Component(Signal, value=0.0)
+    baseline = Component(Signal, value=0.0)
+    other = Component(Signal, value=0.0)
+    total = Component(Signal, value=0.0)
+
+
+class PointTimer:
+    """
+    RunEngine preprocessor that times each point of a run.
+
+    Parameters
+    ----------
+    enabled : boolean
+        If False, the plans are not modified.
+    stream : boolean
+        If True, the point timings are added as a "timing" stream.
+    verbose : boolean
+        If True, prints the summary at the end of each run.
+    """
+
+    def __init__(self, enabled=False, stream=True, verbose=True):
+        self.enabled = enabled
+        self.stream = stream
+        self.verbose = verbose
+        self.device = PointTimingDevice("", name="point_timing")
+        self.last_run = None
+        self._reset()
+
+    def _reset(self, plan_name=None):
+        self._run = None if plan_name is None else dict(
+            plan_name=plan_name,
+            start=ttime(),
+            setup=defaultdict(float),
+            teardown=defaultdict(float),
+            points=[],
+        )
+        self._bucket = None if self._run is None else self._run["setup"]
+        self._in_points = False
+        self._stream_name = None
+        self._groups = {}
+
+    def __call__(self, plan):
+        if not self.enabled:
+            return plan
+        return self._timed(plan)
+
+    def _category(self, msg):
+        command = msg.command
+        if command == "set":
+            if msg.kwargs.get("group") is not None:
+                self._groups[msg.kwargs["group"]] = "move"
+            return "move"
+        if command == "trigger":
+            group = msg.kwargs.get("group")
+            if group is not None:
+                # A group with moves stays a move.
+                self._groups.setdefault(group, "trigger")
+            return "baseline" if self._stream_name == "baseline" else "trigger"
+        if command == "wait":
+            return self._groups.get(msg.kwargs.get("group"), "other")
+        if command in ("read", "save"):
+            if self._stream_name == "baseline":
+                return "baseline"
+            return "read" if command == "read" else "emit"
+        return "other"
+
+    def _start_point(self):
+        self._in_points = True
+        self._bucket = defaultdict(float)
+
+    def _record(self, msg, gap, duration):
+        """Adds the time of one message to the current point."""
+        info = MESSAGE_TIMINGS[msg.command]
+        info["count"] += 1
+        info["total"] += duration
+
+        command = msg.command
+        if command == "create":
+            self._stream_name = msg.kwargs.get("name")
+            if not self._in_points and self._stream_name == "primary":
+                self._start_point()
+        elif command == "checkpoint" and not self._in_points:
+            self._start_point()
+
+        self._bucket["plan"] += gap
+        self._bucket[self._category(msg)] += duration
+
+        if command in ("save", "drop"):
+            if command == "save" and self._stream_name == "primary":
+                self._run["points"].append(dict(self._bucket))
+                self._bucket = defaultdict(float)
+            self._stream_name = None
+
+    def _close(self):
+        """Keeps the run results, the last point bucket is the teardown."""
+        run = self._run
+        if self._in_points:
+            run["teardown"] = self._bucket
+        run["total"] = ttime() - run["start"]
+        self.last_run = run
+
+    def _emit_stream(self):
+        """Adds the point timings to the run as the "timing" stream."""
+        for index, point in enumerate(self.last_run["points"]):
+            self.device.point.put(index)
+            for category in CATEGORIES:
+                component = _COMPONENTS.get(category, category)
+                getattr(self.device, component).put(point.get(category, 0.0))
+            self.device.total.put(sum(point.values()))
+            yield from create("timing")
+            yield from read(self.device)
+            yield from save()
+
+    def _timed(self, plan):
+        """Wraps the plan, times the RunEngine response to each message."""
+        response, exception = None, None
+        last = ttime()
+        while True:
+            try:
+                if exception is None:
+                    msg = plan.send(response)
+                else:
+                    msg = plan.throw(exception)
+            except StopIteration as stop:
+                return stop.value
+            gap = ttime() - last
+
+            command = msg.command
+            if command == "open_run" and self._run is None:
+                self._reset(msg.kwargs.get("plan_name", "unknown"))
+                gap = 0
+            elif command == "close_run" and self._run is not None:
+                self._close()
+                if self.stream and msg.kwargs.get("exit_status") in (
+                    None, "success"
+                ):
+                    try:
+                        yield from self._emit_stream()
+                    except Exception as exinfo:
+                        logger.warning(
+                            "Could not save the timing stream: %s", exinfo
+                        )
+
+            start = ttime()
+            try:
+                response, exception = (yield msg), None
+            except GeneratorExit:
+                plan.close()
+                raise
+            except BaseException as exinfo:
+                response, exception = None, exinfo
+            last = ttime()
+
+            if self._run is not None and command != "open_run":
+                self._record(msg, gap, last - start)
+            if command == "close_run" and self._run is not None:
+                self._reset()
+                if self.verbose:
+                    point_timing_report()
+
+
+point_timer = PointTimer(
+    enabled=iconfig.get("RUN_ENGINE", {}).get("POINT_TIMING", False)
+)
+"""Per-point timing preprocessor, added to ``RE.preprocessors``."""
+
+
+def point_timing_report(run=None):
+    """
+    Prints the time spent in each category, per point, of a run.
+
+    Parameters
+    ----------
+    run : dict, optional
+        Run timings. Defaults to the last run timed by `point_timer`.
+    """
+    run = run or point_timer.last_run
+    if run is None:
+        print("No run was timed, set point_timer.enabled = True.")
+        return
+
+    points = run["points"]
+    npoints = max(len(points), 1)
+    totals = {
+        category: sum(point.get(category, 0.0) for point in points)
+        for category in CATEGORIES
+    }
+    table = Table()
+    table.labels = ("Category", "Total (s)", "Per point (s)", "Fraction")
+    for category in CATEGORIES:
+        table.addRow((
+            category,
+            f"{totals[category]:.3f}",
+            f"{totals[category] / npoints:.4f}",
+            f"{totals[category] / max(run['total'], 1e-9):.1%}",
+        ))
+    for name in ("setup", "teardown"):
+        value = sum(run[name].values())
+        table.addRow((
+            name, f"{value:.3f}", "",
+            f"{value / max(run['total'], 1e-9):.1%}"
+        ))
+    table.addRow(("total", f"{run['total']:.3f}", "", ""))
+
+    print(f"\n{run['plan_name']}: {len(points)} points")
+    print(table.reST(fmt="simple"))
@@ -12,7 +12,9 @@ import logging
 import bluesky
 from bluesky.utils import ProgressBarManager
 
+from .baseline_cache import BASELINE_MODE, CachedSupplementalData
 from .config import iconfig
+from .point_timing import point_timer
 
 logger = logging.getLogger(__name__)
 logger.info(__file__)
@@ -35,12 +37,13 @@ RE.md.update(re_metadata(full_cat))  # programmatic metadata
 RE.md.update(re_config.get("DEFAULT_METADATA", {}))
 RE.md["instrument_name"] = f'polar-{iconfig.get("STATION")}'
 
-sd = bluesky.SupplementalData()
+sd = CachedSupplementalData(use_cache=BASELINE_MODE == "monitor")
 """Baselines & monitors for ``RE``."""
 
 RE.subscribe(full_cat.v1.insert)
 RE.subscribe(bec)
 RE.preprocessors.append(sd)
+RE.preprocessors.append(point_timer)  # outermost, sees the baseline too
 
 connect_scan_id_pv(RE)  # if configured
 
@@ -3,33 +3,181 @@ Transfocator functions.
 
 .. autosummary::
     ~read_delta
+    ~TransfocatorCalculator
     ~transfocator
+    ~benchmark_lens_search
 """
 
-from numpy import loadtxt, array, eye, dot, inf
+from numpy import (
+    loadtxt, array, eye, dot, inf, zeros, ones, abs as np_abs, argmin, where,
+    asarray, atleast_1d, any as np_any
+)
 from scipy.interpolate import interp1d
 from pandas import read_csv, DataFrame
 from itertools import combinations
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
 
-BE_REFR_INDEX_FILE = (
-    "/home/beams/POLAR/polar_instrument/src/instrument/utils/Be_refr_index.dat"
-)
+BE_REFR_INDEX_FILE = Path(__file__).parent / "Be_refr_index.dat"
 
-LENS_SETTINGS = (
-    "/home/beams/POLAR/polar_instrument/src/instrument/utils/"
-    "transfocator_settings.csv"
-)
+LENS_SETTINGS = Path(__file__).parent / "transfocator_settings.csv"
+
+SOURCE_SAMPLE_DISTANCES = {  # microns
+    "diffractometer": 67.2e6,
+    "magnet": 73.3e6,
+}
+
+
+def _source_sample_distance(experiment):
+    try:
+        return SOURCE_SAMPLE_DISTANCES[experiment]
+    except KeyError:
+        raise ValueError(
+            "Calculation limited to focus positions at 67.2 m "
+            "(diffractometer) or 73.3 m (magnet)."
+        )
+
+
+class TransfocatorCalculator:
+    """
+    Transfocator tables loaded once, re-read only if the files change.
+
+    The Be refractive index interpolator and the lens settings table are
+    cached, and invalidated when the file modification time changes. All
+    methods accept arrays of energies.
+
+    .. autosummary::
+        ~delta
+        ~lenses
+        ~focal_lengths
+        ~crl_z
+    """
+
+    def __init__(self, delta_path=BE_REFR_INDEX_FILE, lenses_path=LENS_SETTINGS):
+        self.delta_path = Path(delta_path)
+        self.lenses_path = Path(lenses_path)
+        self._cache = {}
+        self._lock = Lock()
+
+    def _cached(self, path, loader):
+        """Load `path` with `loader`, unless it was loaded and didn't change."""
+        mtime = path.stat().st_mtime
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, loader(path))
+                self._cache[path] = cached
+        return cached[1]
+
+    @staticmethod
+    def _load_delta(path):
+        energies, deltas = loadtxt(
+            path, skiprows=2, usecols=(0, 1), unpack=True
+        )
+        return interp1d(energies, deltas, kind="linear")
+
+    @staticmethod
+    def _load_lenses(path):
+        return read_csv(path, skiprows=1).set_index("index")
+
+    def delta(self, energy):
+        """Be refractive index decrement at `energy` (eV), scalar or array."""
+        energy = asarray(energy, dtype=float)
+        if np_any((energy < 2700) | (energy > 27000)):
+            raise ValueError(
+                "Energy {} out of range [2700, 27000].".format(energy)
+            )
+        return self._cached(self.delta_path, self._load_delta)(energy)
+
+    def lenses(self, delta=None):
+        """
+        Copy of the lens settings table.
+
+        If `delta` is given, a "focus" column is added with the focal length
+        of each stack (microns).
+        """
+        lenses = self._cached(self.lenses_path, self._load_lenses).copy()
+        if delta is not None:
+            lenses["focus"] = (
+                lenses["single_lens_radius"] /
+                (2 * lenses["number_of_lenses"] * delta)
+            )
+        return lenses
+
+    def focal_lengths(self, energies, selected_lenses):
+        """
+        Effective focal length (microns) of a lens set at many energies.
+
+        PARAMETERS
+        ----------
+            energies : float or iterable
+                Photon energies in keV.
+            selected_lenses : iterable
+                Index of the inserted lens stacks.
+        """
+        deltas = atleast_1d(self.delta(asarray(energies, dtype=float) * 1e3))
+        selected = self.lenses().loc[list(selected_lenses)]
+
+        a, b = ones(deltas.shape), zeros(deltas.shape)
+        c, d = zeros(deltas.shape), ones(deltas.shape)
+        last_position = None
+        for _, lens in selected.iterrows():
+            if last_position is not None:
+                dist = abs(lens["distance"] - last_position)
+                a, b = a + dist * c, b + dist * d
+            inv_f = (
+                2 * lens["number_of_lenses"] * deltas /
+                lens["single_lens_radius"]
+            )
+            c, d = c - a * inv_f, d - b * inv_f
+            last_position = lens["distance"]
+
+        with_power = c != 0
+        return where(with_power, -1.0 / where(with_power, c, 1.0), inf)
+
+    def crl_z(
+        self,
+        energies,
+        selected_lenses,
+        optimize_position=0,
+        experiment="diffractometer",
+        reference_distance=2591,
+    ):
+        """
+        CRL Z positions (mm) that focus a fixed lens set at many energies.
+
+        Vectorized version of ``transfocator_calculation`` with
+        ``distance_only=True``.
+        """
+        source_sample_distance = _source_sample_distance(experiment)
+        optimize_distance = (optimize_position + reference_distance)*1e3
+        source_crl_distance = source_sample_distance - optimize_distance
+
+        focal_lengths = self.focal_lengths(energies, selected_lenses)
+
+        _selected = self.lenses().loc[list(selected_lenses)]
+        power = _selected["number_of_lenses"]*2/_selected["single_lens_radius"]
+        effective_center = (power*_selected["distance"]).sum()/power.sum()
+
+        crl_center = source_crl_distance + effective_center
+        sample_distance = focal_lengths*crl_center/(crl_center-focal_lengths)
+        effective_reference_distance = reference_distance - effective_center/1e3
+        return effective_reference_distance - sample_distance/1e3
+
+
+calculator = TransfocatorCalculator()
+"""Shared calculator, loads the tables of this package once."""
 
 
 def read_delta(
     energy,
     path=BE_REFR_INDEX_FILE
 ):
-    if energy < 2700 or energy > 27000:
-        raise ValueError("Energy {} out of range [2700, 27000].".format(energy))
-
-    energies, deltas = loadtxt(path, skiprows=2, usecols=(0, 1), unpack=True)
-    return interp1d(energies, deltas, kind="linear")(energy)
+    if Path(path) == calculator.delta_path:
+        return calculator.delta(energy)
+    return TransfocatorCalculator(delta_path=path).delta(energy)
 
 
 def _lens_matrix(f):
@@ -72,7 +220,70 @@ def _compute_effective_focal_length(focuses, positions):
     return f_eff
 
 
+@lru_cache(maxsize=None)
+def _combination_masks(n):
+    """
+    Boolean (subsets, n) array with every non-empty subset of n lens stacks.
+
+    The subsets are in the same order as the loop search: larger subsets
+    first, then lexicographic order.
+    """
+    subsets = [
+        c for r in range(n, 0, -1) for c in combinations(range(n), r)
+    ]
+    masks = zeros((len(subsets), n), dtype=bool)
+    for i, c in enumerate(subsets):
+        masks[i, list(c)] = True
+    masks.flags.writeable = False
+    return masks
+
+
+def _combinations_focal_lengths(focuses, positions, masks):
+    """
+    Effective focal length of every lens subset, all subsets at once.
+
+    The ABCD matrix of each subset is accumulated stack by stack (n steps),
+    with the four matrix elements as arrays over the subsets.
+    """
+    n_subsets = masks.shape[0]
+    a, b = ones(n_subsets), zeros(n_subsets)
+    c, d = zeros(n_subsets), ones(n_subsets)
+    started = zeros(n_subsets, dtype=bool)
+    last_position = zeros(n_subsets)
+
+    for j, (f, z) in enumerate(zip(focuses, positions)):
+        use = masks[:, j]
+
+        # Propagation from the previous lens in the subset, if any.
+        dist = where(use & started, np_abs(z - last_position), 0.0)
+        a, b = a + dist * c, b + dist * d
+
+        # Thin lens.
+        inv_f = where(use, 1.0 / f, 0.0)
+        c, d = c - a * inv_f, d - b * inv_f
+
+        started |= use
+        last_position = where(use, z, last_position)
+
+    with_power = c != 0
+    return where(with_power, -1.0 / where(with_power, c, 1.0), inf)
+
+
 def _find_optimal_combination(lenses, f_eff):
+    """Lens subset whose effective focal length is closest to `f_eff`."""
+    masks = _combination_masks(len(lenses))
+    focal_lengths = _combinations_focal_lengths(
+        lenses["focus"].values, lenses["distance"].values, masks
+    )
+
+    # argmin returns the first minimum, as the strict '<' in the loop search.
+    best = argmin(np_abs(focal_lengths - f_eff))
+    best_combination = list(lenses.index[masks[best]])
+    return best_combination, focal_lengths[best]
+
+
+def _find_optimal_combination_loop(lenses, f_eff):
+    """Reference (slow) search, one DataFrame and matrix loop per subset."""
 
     lenses_list = [i for _, i in lenses.iterrows()]
 
@@ -100,6 +311,62 @@ def _find_optimal_combination(lenses, f_eff):
     return best_combination, best_focal_length
 
 
+def benchmark_lens_search(energies=(5, 8, 10, 15, 20), crl_z=0, repeat=5):
+    """
+    Compare the vectorized and loop lens searches.
+
+    PARAMETERS
+    ----------
+        energies : iterable
+            Photon energies in keV.
+        crl_z : float
+            Target CRL Z position in mm.
+        repeat : int
+            Number of searches per energy with each implementation.
+
+    RETURNS
+    -------
+        dict with the mean time per search (s) of each implementation, and
+        whether both found the same combinations.
+    """
+    lenses = calculator.lenses()
+    optimize_distance = (crl_z + 2591) * 1e3
+    source_crl_distance = 67.2e6 - optimize_distance
+    f_eff = (
+        source_crl_distance * optimize_distance /
+        (source_crl_distance + optimize_distance)
+    )
+
+    times = {"vectorized": 0.0, "loop": 0.0}
+    same = True
+    for energy in energies:
+        lenses["focus"] = (
+            lenses["single_lens_radius"] /
+            (2 * lenses["number_of_lenses"] * read_delta(energy * 1e3))
+        )
+        results = {}
+        for name, func in (
+            ("vectorized", _find_optimal_combination),
+            ("loop", _find_optimal_combination_loop),
+        ):
+            t0 = perf_counter()
+            for _ in range(repeat):
+                results[name] = func(lenses, f_eff)[0]
+            times[name] += perf_counter() - t0
+        same &= results["vectorized"] == results["loop"]
+
+    n = repeat * len(energies)
+    result = {name: t / n for name, t in times.items()}
+    result["speedup"] = result["loop"] / result["vectorized"]
+    result["same_result"] = bool(same)
+
+    print(
+        "Lens search: vectorized {vectorized:.2e} s, loop {loop:.2e} s, "
+        "speedup {speedup:.0f}x, same result: {same_result}".format(**result)
+    )
+    return result
+
+
 def _find_optimal_focus(lenses):
     return _compute_effective_focal_length(
         lenses["focus"].values,
@@ -162,17 +429,9 @@ def transfocator_calculation(
         selected_lenses = [int(i) for i in _inp.split()]
 
     # Collect setup
-    if experiment == "diffractometer":
-        source_sample_distance = 67.2e6
-    elif experiment == "magnet":
-        source_sample_distance = 73.3e6
-    else:
-        raise ValueError(
-            "Calculation limited to focus positions at 67.2 m "
-            "(diffractometer) or 73.3 m (magnet)."
-        )
+    source_sample_distance = _source_sample_distance(experiment)
 
-    delta = read_delta(energy*1e3)  # delta table uses eV.
+    delta = calculator.delta(energy*1e3)  # delta table uses eV.
 
     # Effective focal point for the desired distance
 
@@ -181,11 +440,7 @@ def transfocator_calculation(
     source_crl_distance = source_sample_distance - optimize_distance
     f_eff = source_crl_distance * optimize_distance / (source_crl_distance + optimize_distance)
 
-    lenses = read_csv(LENS_SETTINGS, skiprows=1).set_index("index")
-
-    lenses["focus"] = (
-        lenses["single_lens_radius"] / (2 * lenses["number_of_lenses"] * delta)
-    )
+    lenses = calculator.lenses(delta)
 
     if not distance_only:
         best_combination, best_focal_length = _find_optimal_combination(